@@ -0,0 +1,7 @@
+"""
+Load benchmarks over the HTTP API.
+
+    python -m app.benchmarks --base-url http://127.0.0.1:8000 --seed --users 1000 --articles 20000
+
+See `python -m app.benchmarks --help` for all options.
+"""
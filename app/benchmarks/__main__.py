@@ -0,0 +1,75 @@
+"""
+Runs load benchmarks against a running backend and prints the results as JSON.
+"""
+from app.benchmarks.runner import run_scenario
+from app.benchmarks.scenarios import SCENARIOS
+from app.internal.seeder import Seeder
+import argparse
+import asyncio
+import datetime
+import httpx
+import json
+import sys
+
+
+async def main(args: argparse.Namespace, dataset: Seeder) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        for scenario in args.scenarios:
+            results[scenario] = await run_scenario(
+                client, scenario,
+                dataset=dataset,
+                concurrency=args.concurrency,
+                duration=args.duration,
+                iterations=args.iterations
+            )
+
+    return {
+        "started_at": args.started_at,
+        "base_url": args.base_url,
+        "dataset_seed": args.dataset_seed,
+        "users": args.users,
+        "articles": args.articles,
+        "concurrency": args.concurrency,
+        "scenarios": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--users", type=int, default=1000, help="seeded users")
+    parser.add_argument("--articles", type=int, default=20000, help="seeded articles")
+    parser.add_argument("--follows", type=int, default=20, help="average seeded follows per user")
+    parser.add_argument("--purchases", type=int, default=10, help="average seeded purchases per user")
+    parser.add_argument("--dataset-seed", type=int, default=0, help="`--seed` of app.internal.seeder")
+    parser.add_argument("--seed", action="store_true", help="recreate the tables of DATABASE_URL and seed them first")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="seconds per scenario")
+    parser.add_argument("--iterations", type=int, help="iterations per virtual user, instead of --duration")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--output", type=argparse.FileType("w"), default=sys.stdout)
+    args = parser.parse_args()
+
+    args.started_at = datetime.datetime.now(datetime.UTC).isoformat()
+    if args.iterations:
+        args.duration = None
+
+    # scenarios only need to know what the seeder generated, the same options describe the same dataset
+    options = {
+        "seed": args.dataset_seed, "users": args.users, "articles": args.articles,
+        "follows": args.follows, "purchases": args.purchases,
+    }
+
+    if args.seed:
+        from app.database import SessionLocal
+        from app.internal.seeder import seed_database
+
+        with SessionLocal() as db:
+            seed_database(db, reset=True, **options)
+
+    json.dump(asyncio.run(main(args, Seeder(**options))), args.output, indent=2)
+    args.output.write("\n")
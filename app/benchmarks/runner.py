@@ -0,0 +1,88 @@
+"""
+Runs scenarios with concurrent virtual users and summarizes the latencies per endpoint.
+"""
+from app.benchmarks.scenarios import SCENARIOS, VirtualUser
+from app.internal.seeder import Seeder
+from collections import defaultdict
+import asyncio
+import httpx
+import math
+import time
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)]
+
+
+def summarize(samples: list[tuple[str, float, bool]], elapsed: float) -> dict:
+    """
+    Turns `(endpoint, seconds, succeeded)` samples into per-endpoint stats, latencies in milliseconds.
+    """
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+
+    for endpoint, duration, succeeded in samples:
+        latencies[endpoint].append(duration * 1000)
+        errors[endpoint] += not succeeded
+
+    endpoints = {}
+    for endpoint, values in sorted(latencies.items()):
+        values.sort()
+        endpoints[endpoint] = {
+            "requests": len(values),
+            "errors": errors[endpoint],
+            "throughput": round(len(values) / elapsed, 2),
+            "mean": round(sum(values) / len(values), 2),
+            "p50": round(percentile(values, 50), 2),
+            "p95": round(percentile(values, 95), 2),
+            "p99": round(percentile(values, 99), 2),
+        }
+
+    return {
+        "elapsed": round(elapsed, 2),
+        "requests": len(samples),
+        "errors": sum(errors.values()),
+        "throughput": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: str,
+    dataset: Seeder,
+    concurrency: int,
+    duration: float | None = None,
+    iterations: int | None = None,
+) -> dict:
+    """
+    Runs `scenario` with `concurrency` virtual users, each logged in as a different seeded user,
+    for `duration` seconds or `iterations` iterations per virtual user.
+    """
+    run = SCENARIOS[scenario]
+    samples = []
+    dataset.index_articles()
+    virtual_users = [
+        VirtualUser(client, user_id, dataset, samples)
+        for user_id in range(1, min(concurrency, dataset.users) + 1)
+    ]
+
+    start = time.perf_counter()
+    deadline = start + duration if duration else math.inf
+
+    async def loop(user: VirtualUser) -> None:
+        while time.perf_counter() < deadline and (iterations is None or user.iteration < iterations):
+            try:
+                await run(user)
+            except httpx.HTTPError:
+                pass
+            user.iteration += 1
+
+    await asyncio.gather(*[loop(user) for user in virtual_users])
+
+    return summarize(samples, time.perf_counter() - start)
@@ -0,0 +1,137 @@
+"""
+Scripted user journeys. Every scenario runs one iteration for a virtual user and reports each
+request under its route template, so results of different ids add up per endpoint.
+"""
+from app.internal.seeder import Seeder, DEFAULT_PASSWORD, user_email
+from typing import Awaitable, Callable
+import httpx
+import random
+import time
+
+
+class VirtualUser:
+    """
+    One simulated client, logged in as seeded user `user_id` when a scenario needs it.
+    `dataset` describes what the seeder generated, e.g. which articles the user bought.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, user_id: int, dataset: Seeder, samples: list):
+        self.client = client
+        self.user_id = user_id
+        self.dataset = dataset
+        self.samples = samples
+        self.random = random.Random(user_id)
+        self.iteration = 0
+        self.cookies: dict[str, str] | None = None
+
+    async def request(self, method: str, route: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, cookies=self.cookies, **kwargs)
+        except httpx.HTTPError:
+            self.samples.append((f"{method} {route}", time.perf_counter() - start, False))
+            raise
+
+        self.samples.append((f"{method} {route}", time.perf_counter() - start, response.is_success))
+        return response
+
+    async def login(self) -> None:
+        if self.cookies is not None:
+            return
+
+        response = await self.request(
+            "POST", "/oauth2/token", "/oauth2/token",
+            data={"email": user_email(self.user_id), "password": DEFAULT_PASSWORD}
+        )
+        response.raise_for_status()
+        self.cookies = {name: response.cookies[name] for name in ("access_token", "refresh_token")}
+
+    def random_article(self) -> int:
+        return self.random.randint(1, self.dataset.articles)
+
+
+async def browse(user: VirtualUser) -> None:
+    """
+    Anonymous visitor: front page lists, a search and an article preview with its comments.
+    """
+    await user.request("GET", "/articles/all", "/articles/all", params={"page": user.random.randint(1, 5)})
+    await user.request("GET", "/user/followers/top", "/user/followers/top")
+    await user.request("GET", "/articles/search", "/articles/search", params={"value": f"Article {user.random.randint(1, 99)}"})
+
+    article_id = user.random_article()
+    await user.request("GET", "/articles/id/{article_id}", f"/articles/id/{article_id}")
+    await user.request("GET", "/articles/comment/all/{article_id}", f"/articles/comment/all/{article_id}")
+
+
+async def read(user: VirtualUser) -> None:
+    """
+    Logged in reader: own profile, feed, bought articles and their details.
+    """
+    await user.login()
+    await user.request("GET", "/user/get", "/user/get")
+    await user.request("GET", "/articles/feed", "/articles/feed")
+    await user.request("GET", "/articles/bought-list", "/articles/bought-list")
+
+    if article_ids := user.dataset.purchased_articles(user.user_id):
+        article_id = user.random.choice(article_ids)
+        await user.request("GET", "/articles/detail/id/{article_id}", f"/articles/detail/id/{article_id}")
+
+    await user.request("GET", "/user/get/{user_id}", f"/user/get/{user.random.randint(1, user.dataset.users)}")
+
+
+async def checkout(user: VirtualUser) -> None:
+    """
+    Orders an article which isn't bought yet. Needs the backend to talk to the PayU stand-in.
+    """
+    await user.login()
+    article_ids = user.dataset.purchasable_articles(user.user_id)
+    if not article_ids:
+        return
+
+    await user.request(
+        "POST", "/transactions/create-order", "/transactions/create-order",
+        json={"items": [user.random.choice(article_ids)], "redirect_url": "http://127.0.0.1:3000"}
+    )
+
+
+async def follow(user: VirtualUser) -> None:
+    """
+    Follows and unfollows a user that isn't followed in the seed.
+    """
+    await user.login()
+    followed = set(user.dataset.followed_users(user.user_id)) | {user.user_id}
+    if len(followed) >= user.dataset.users:
+        return
+
+    offset = user.iteration
+    while (followed_id := 1 + (user.user_id + offset) % user.dataset.users) in followed:
+        offset += 1
+
+    await user.request("POST", "/user/follow/{followed_id}", f"/user/follow/{followed_id}")
+    await user.request("DELETE", "/user/follow/{followed_id}", f"/user/follow/{followed_id}")
+
+
+async def comment(user: VirtualUser) -> None:
+    """
+    Comments the next bought article, until all bought articles are commented.
+    """
+    await user.login()
+    commented = set(user.dataset.commented_articles(user.user_id))
+    article_ids = [article_id for article_id in user.dataset.purchased_articles(user.user_id) if article_id not in commented]
+    if user.iteration >= len(article_ids):
+        return
+
+    article_id = article_ids[user.iteration]
+    await user.request(
+        "POST", "/articles/comment/{article_id}", f"/articles/comment/{article_id}",
+        json={"content": "Benchmark comment", "rating": 1 + user.iteration % 5}
+    )
+
+
+SCENARIOS: dict[str, Callable[[VirtualUser], Awaitable[None]]] = {
+    "browse": browse,
+    "read": read,
+    "checkout": checkout,
+    "follow": follow,
+    "comment": comment,
+}
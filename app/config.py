@@ -3,6 +3,7 @@ import os
 DATABASE_URL = os.environ.get("DATABASE_URL")
 FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:3000")
 IS_PRODUCTION = os.environ.get("PRODUCTION", False)
+IS_TESTING = os.environ.get("TESTING", False)
 
 CORS_ORIGINS = [
     FRONTEND_URL,
@@ -18,3 +19,11 @@ REFRESH_TOKEN_EXPIRE_TIME = 7
 ### Hashing
 SECRET_KEY = os.environ.get("SECRET_KEY") # if you don't have one, you can generate one using `openssl rand -hex 32` in cmd
 ENCRYPTION_ALGORITHM = "HS256"
+
+### Metrics
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN") # required as a bearer token when set, /metrics is not served in production without it
+
+### Caching
+LEADERBOARD_SIZE = 100
+LEADERBOARD_TTL = 0 if IS_TESTING else 60 # in seconds
+TAG_INDEX_TTL = 0 if IS_TESTING else 60 # in seconds
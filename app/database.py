@@ -1,8 +1,9 @@
 from time import sleep
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text, Table
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import DATABASE_URL
+from typing import Iterable
 
 connection_engine = None
 
@@ -20,3 +21,12 @@ while connection_engine is None:
 engine = connection_engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def truncate_tables(connection, tables: Iterable[Table]) -> None:
+    """
+    Empties `tables` and resets their id sequences with a single TRUNCATE.
+    """
+    names = ", ".join(connection.dialect.identifier_preparer.format_table(table) for table in tables)
+    if names:
+        connection.execute(text(f"TRUNCATE {names} RESTART IDENTITY CASCADE"))
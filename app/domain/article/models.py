@@ -12,32 +12,41 @@ from sqlalchemy import (
     UniqueConstraint,
     func,
     CheckConstraint,
+    select,
+    update,
+    insert,
+    delete,
+    literal,
+    Index,
 )
-from sqlalchemy.orm import relationship, Session
-from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import relationship, Session, column_property
+from sqlalchemy.orm.attributes import get_history, PASSIVE_NO_INITIALIZE
 from sqlalchemy.types import DateTime
 from ..model_base import Base
+from ..user.models import Follower, User
+from collections import defaultdict
 import datetime
 import re
 from app.config import IP_ADDRESS
 from app.dependencies import get_db
+from app.internal.trending import trending_articles
 from urllib.parse import quote
 
 
-def article_avg_rating(db: Session, article_id: int) -> float:
-    avg_rating = (
-        db.query(func.avg(ArticleComment.rating))
-        .filter(ArticleComment.article_id == article_id)
-        .scalar()
+def article_avg_rating(connection: Connection, article_id: int) -> float:
+    avg_rating = connection.scalar(
+        select(func.avg(ArticleComment.rating))
+        .where(ArticleComment.article_id == article_id)
     )
     return float(avg_rating) if avg_rating is not None else 0.0
 
 
-def count_article_ratings(db: Session, article_id: int) -> int:
-    count_rating = (
-        db.query(func.count(ArticleComment.id))
-        .filter(ArticleComment.article_id == article_id)
-        .scalar()
+def count_article_ratings(connection: Connection, article_id: int) -> int:
+    count_rating = connection.scalar(
+        select(func.count(ArticleComment.id))
+        .where(ArticleComment.article_id == article_id)
     )
     return count_rating if count_rating is not None else 0
 
@@ -68,8 +77,14 @@ class Tag(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     value = Column(String(50), nullable=False, unique=True)
+    free_article_count = Column(Integer, nullable=False, default=0, server_default="0")
+    paid_article_count = Column(Integer, nullable=False, default=0, server_default="0")
     articles = relationship("Article", secondary="article_tag", back_populates="tags")
 
+    @property
+    def article_count(self) -> int:
+        return self.free_article_count + self.paid_article_count
+
     def __repr__(self):
         return f"<Tag(value={self.value})>"
 
@@ -88,10 +103,17 @@ class Article(Base):
     created_at = Column(DateTime, server_default=func.timezone("UTC", func.now()))
     view_count = Column(Integer, default=0)
     title_image = Column(String(255), nullable=False)
-    is_free = Column(Boolean, default=True)
+    # the old value is loaded on change, so tag counts know which counter the article leaves
+    is_free = column_property(Column(Boolean, default=True), active_history=True)
     price = Column(Float(precision=2), default=0.00)
     rating = Column(Float(precision=2), default=0.00)
     rating_count = Column(Integer, default=0)
+    # last change of the indexed content (title, summary, tags, content elements), not of counters
+    # like view_count; clock_timestamp() so changes made later in one transaction get later values
+    content_updated_at = Column(
+        DateTime, nullable=False, index=True,
+        server_default=func.timezone("UTC", func.clock_timestamp()),
+    )
 
     tags = relationship("Tag", secondary="article_tag", back_populates="articles")
     author = relationship("User", back_populates="articles")
@@ -116,6 +138,11 @@ class Article(Base):
         cascade="all, delete-orphan",
     )
     transaction_items = relationship("TransactionItem", back_populates="article", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index("ix_articles_author_id_created_at", "author_id", "created_at"),
+    )
+
     @property
     def questions_count(self) -> int | None:
         return (
@@ -142,30 +169,64 @@ class Article(Base):
         self._is_bought = value
 
 
+def update_author_counters(
+    connection,
+    author_id: int,
+    article_count_delta: int = 0,
+    old_rating: float | None = 0,
+    new_rating: float | None = 0,
+) -> None:
+    """
+    Updates the author's article_count and rated article aggregate with one UPDATE,
+    moving the aggregate from `old_rating` to `new_rating` (unrated articles, 0, are not counted)
+    """
+    old_rating, new_rating = old_rating or 0, new_rating or 0
+    count_delta = (new_rating != 0) - (old_rating != 0)
+    sum_delta = new_rating - old_rating
+
+    if author_id is None or (article_count_delta == 0 and count_delta == 0 and sum_delta == 0):
+        return
+
+    connection.execute(
+        update(User)
+        .where(User.id == author_id)
+        .values(
+            article_count=func.coalesce(User.article_count, 0) + article_count_delta,
+            rated_article_count=User.rated_article_count + count_delta,
+            rated_article_rating_sum=User.rated_article_rating_sum + sum_delta,
+        )
+    )
+
+
 @event.listens_for(Article, "after_insert")
 def increment_article_count(mapper, connection, target):
-    from app.domain.user.models import User
+    update_author_counters(connection, target.author_id, article_count_delta=1, new_rating=target.rating)
 
-    session = Session(bind=connection)
 
-    session.query(User).filter(User.id == target.author_id).update(
-        {User.article_count: User.article_count + 1}, synchronize_session=False
-    )
+@event.listens_for(Article, "after_update")
+def update_author_counters_on_article_change(mapper, connection, target):
+    rating_history = get_history(target, "rating")
+    author_history = get_history(target, "author_id")
 
-    session.commit()
+    if not rating_history.has_changes() and not author_history.has_changes():
+        return
 
+    old_rating = rating_history.deleted[0] if rating_history.deleted else target.rating
+    old_author_id = author_history.deleted[0] if author_history.deleted else target.author_id
 
-@event.listens_for(Article, "after_delete")
-def decrement_article_count(mapper, connection, target):
-    from app.domain.user.models import User
+    if old_author_id != target.author_id:
+        update_author_counters(connection, old_author_id, -1, old_rating, 0)
+        update_author_counters(connection, target.author_id, 1, 0, target.rating)
+    else:
+        update_author_counters(connection, target.author_id, 0, old_rating, target.rating)
 
-    session = Session(bind=connection)
 
-    session.query(User).filter(User.id == target.author_id).update(
-        {User.article_count: User.article_count - 1}, synchronize_session=False
-    )
-
-    session.commit()
+@event.listens_for(Article, "before_delete")
+def decrement_article_count(mapper, connection, target):
+    # Comments are deleted first and already moved the rating in the database,
+    # so the stored value is used instead of the one loaded into `target`
+    rating = connection.scalar(select(Article.rating).where(Article.id == target.id))
+    update_author_counters(connection, target.author_id, -1, rating, 0)
 
 
 @event.listens_for(Article, "before_insert")
@@ -180,6 +241,124 @@ def set_unique_slug(mapper, connection, target):
             target.slug = unique_slug(session, base_slug, Article)
 
 
+def change_tag_counts(connection, deltas: dict[str, list[int]]) -> None:
+    """
+    Moves free_article_count and paid_article_count of tags by `deltas` ({value: [free, paid]}),
+    with one UPDATE per distinct pair of deltas
+    """
+    values_by_delta = defaultdict(list)
+    for value, (free_delta, paid_delta) in deltas.items():
+        if free_delta or paid_delta:
+            values_by_delta[(free_delta, paid_delta)].append(value)
+
+    for (free_delta, paid_delta), values in values_by_delta.items():
+        connection.execute(
+            update(Tag)
+            .where(Tag.value.in_(values))
+            .values(
+                free_article_count=Tag.free_article_count + free_delta,
+                paid_article_count=Tag.paid_article_count + paid_delta,
+            )
+        )
+
+
+INDEXED_ARTICLE_ATTRIBUTES = ("title", "summary", "tags", "content_elements")
+
+
+@event.listens_for(Session, "before_flush")
+def touch_article_content(session, flush_context, instances):
+    """
+    Moves content_updated_at of articles whose indexed content changes in this flush
+    """
+    touched = set()
+    for obj in session.dirty:
+        if isinstance(obj, Article) and any(
+            get_history(obj, attribute, passive=PASSIVE_NO_INITIALIZE).has_changes()
+            for attribute in INDEXED_ARTICLE_ATTRIBUTES
+        ):
+            touched.add(obj)
+
+    for obj in [*session.new, *session.dirty, *session.deleted]:
+        if isinstance(obj, ArticleContentElement) and obj.article_id is not None:
+            if (article := session.get(Article, obj.article_id)) is not None:
+                touched.add(article)
+
+    for article in touched:
+        if article not in session.new and article not in session.deleted:
+            article.content_updated_at = func.timezone("UTC", func.clock_timestamp())
+
+
+class DeletedArticle(Base):
+    """
+    Tombstones of deleted articles, so in-memory indexes of every process can drop them
+    """
+    __tablename__ = "deleted_articles"
+
+    article_id = Column(Integer, primary_key=True)
+    deleted_at = Column(
+        DateTime, nullable=False, index=True,
+        server_default=func.timezone("UTC", func.clock_timestamp()),
+    )
+
+
+@event.listens_for(Article, "after_delete")
+def record_article_deletion(mapper, connection, target):
+    stmt = postgresql_insert(DeletedArticle).values(article_id=target.id)
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=[DeletedArticle.article_id],
+        set_={"deleted_at": func.timezone("UTC", func.clock_timestamp())},
+    ))
+
+
+def tag_values(tags: list[Tag]) -> list[str]:
+    return [tag.value for tag in tags]
+
+
+@event.listens_for(Session, "after_flush")
+def update_tag_counts(session, flush_context):
+    # article_tag rows are written through `Article.tags`, which doesn't emit ArticleTag events,
+    # so the counts follow the tag collections and is_free of flushed articles instead
+    deltas = defaultdict(lambda: [0, 0])
+
+    def count(values: list[str], is_free: bool | None, delta: int) -> None:
+        for value in values:
+            deltas[value][0 if is_free is not False else 1] += delta
+
+    for article in session.new:
+        if isinstance(article, Article):
+            count(tag_values(article.tags), article.is_free, 1)
+
+    for article in session.dirty:
+        if not isinstance(article, Article):
+            continue
+        tags_history = get_history(article, "tags", passive=PASSIVE_NO_INITIALIZE)
+        free_history = get_history(article, "is_free")
+        if not tags_history.has_changes() and not free_history.has_changes():
+            continue
+
+        old_is_free = free_history.deleted[0] if free_history.deleted else article.is_free
+        if tags_history.has_changes():
+            count(tag_values(tags_history.unchanged + tags_history.deleted), old_is_free, -1)
+            count(tag_values(tags_history.unchanged + tags_history.added), article.is_free, 1)
+        else:
+            # only is_free changed, the tags didn't have to be loaded
+            values = list(session.connection().scalars(
+                select(ArticleTag.tag_value).where(ArticleTag.article_id == article.id)
+            ))
+            count(values, old_is_free, -1)
+            count(values, article.is_free, 1)
+
+    for article in session.deleted:
+        if isinstance(article, Article):
+            # the flush loaded the tags to delete their article_tag rows
+            free_history = get_history(article, "is_free")
+            is_free = free_history.deleted[0] if free_history.deleted else article.is_free
+            count(tag_values(get_history(article, "tags", passive=PASSIVE_NO_INITIALIZE).sum()), is_free, -1)
+
+    if deltas:
+        change_tag_counts(session.connection(), deltas)
+
+
 class ArticleAssessmentQuestion(Base):
     __tablename__ = "article_assessment_questions"
 
@@ -262,6 +441,7 @@ class ArticleComment(Base):
             "article_id",
             name="unique_author_article",
         ),
+        Index("ix_article_comment_article_id", "article_id"),
     )
 
 
@@ -279,30 +459,91 @@ class WishList(Base):
     user = relationship("User", back_populates="wish_list")
     article = relationship("Article", back_populates="wish_list")
 
+    __table_args__ = (
+        Index("ix_wishlists_user_id_article_id", "user_id", "article_id"),
+    )
+
 
 @event.listens_for(ArticleComment, "after_insert")
 @event.listens_for(ArticleComment, "after_update")
 @event.listens_for(ArticleComment, "after_delete")
 def update_article_rating_on_comment_change(mapper, connection, target):
-    session = Session(bind=connection)
-
+    # Runs on the flush's connection, so it's part of the same transaction
     article_id = target.article_id
-    new_rating = article_avg_rating(db=session, article_id=article_id)
-    new_rating_count = count_article_ratings(db=session, article_id=article_id)
+    old_rating, author_id = connection.execute(
+        select(Article.rating, Article.author_id).where(Article.id == article_id)
+    ).first() or (0, None)
+    new_rating = article_avg_rating(connection=connection, article_id=article_id)
+    new_rating_count = count_article_ratings(connection=connection, article_id=article_id)
+
+    connection.execute(
+        update(Article)
+        .where(Article.id == article_id)
+        .values(rating=new_rating, rating_count=new_rating_count)
+    )
+    update_author_counters(connection, author_id, 0, old_rating, new_rating)
 
-    session.query(Article).filter(Article.id == article_id).update(
-        {Article.rating: new_rating, Article.rating_count: new_rating_count},
-        synchronize_session=False,
+
+class ArticleTrendingScore(Base):
+    """
+    Decayed trending score of an article as of `updated_at`, merged from the in-memory counters
+    of every process, see app.internal.trending
+    """
+    __tablename__ = "article_trending_scores"
+    article_id = Column(
+        Integer, ForeignKey("articles.id", ondelete="CASCADE"), primary_key=True
     )
+    score = Column(Float, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+
+TRENDING_SIGNALS_KEY = "trending_signals"
+
+
+def record_trending_signal(session: Session, article_id: int, signal: str, count: int = 1) -> None:
+    """
+    Adds the signal to the trending counters once the session commits
+    """
+    session.info.setdefault(TRENDING_SIGNALS_KEY, []).append((article_id, signal, count))
+
+
+@event.listens_for(Article, "after_update")
+def record_article_views(mapper, connection, target):
+    # every route showing an article (detail ones included) increments `view_count`,
+    # so views are recorded here instead of in each of them
+    history = get_history(target, "view_count")
+    if history.deleted and history.added:
+        views = (history.added[0] or 0) - (history.deleted[0] or 0)
+        if views > 0:
+            record_trending_signal(Session.object_session(target), target.id, "view", views)
+
+
+@event.listens_for(WishList, "after_insert")
+def record_wish_list_add(mapper, connection, target):
+    record_trending_signal(Session.object_session(target), target.article_id, "wishlist")
 
-    session.commit()
+
+@event.listens_for(ArticlePurchase, "after_insert")
+def record_purchase(mapper, connection, target):
+    record_trending_signal(Session.object_session(target), target.article_id, "purchase")
+
+
+@event.listens_for(Session, "after_commit")
+def apply_trending_signals(session):
+    for article_id, signal, count in session.info.pop(TRENDING_SIGNALS_KEY, []):
+        trending_articles.add(article_id, signal, count)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def forget_trending_signals(session, previous_transaction):
+    session.info.pop(TRENDING_SIGNALS_KEY, None)
 
 
 class Collection(Base):
     __tablename__ = "collections"
     id = Column(Integer, primary_key=True, autoincrement=True)
     owner_id = Column(
-        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
     )
     title = Column(String(255), nullable=False)
     short_description = Column(String(500))
@@ -375,21 +616,132 @@ class CollectionArticle(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     collection_id = Column(
-        Integer, ForeignKey("collections.id", ondelete="CASCADE"), nullable=False
+        Integer, ForeignKey("collections.id", ondelete="CASCADE"), nullable=False, index=True
     )
     article_id = Column(
-        Integer, ForeignKey("articles.id", ondelete="CASCADE"), nullable=False
+        Integer, ForeignKey("articles.id", ondelete="CASCADE"), nullable=False, index=True
     )
 
 
 @event.listens_for(Article, "after_delete")
 def check_collection_article_count(mapper, connection, target):
     collection_ids = [collection.id for collection in target.collections]
+    if not collection_ids:
+        return
 
-    with Session(bind=connection) as session:
-        for collection_id in collection_ids:
-            collection = session.get(Collection, collection_id)
+    articles_count = (
+        select(func.count(CollectionArticle.id))
+        .where(CollectionArticle.collection_id == Collection.id)
+        .scalar_subquery()
+    )
+    connection.execute(
+        delete(Collection).where(Collection.id.in_(collection_ids), articles_count < 2)
+    )
 
-            if collection and collection.articles_count < 2:
-                session.delete(collection)
-                session.commit()
+
+# Readers following at least this many authors get a precomputed timeline,
+# everyone else reads their feed straight from the follower graph
+FEED_FANOUT_THRESHOLD = 200
+FEED_TIMELINE_SIZE = 1000
+
+
+class FeedEntry(Base):
+    """
+    Precomputed timeline of readers following many authors, written when an article is published
+    """
+    __tablename__ = "feed_entries"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    article_id = Column(Integer, ForeignKey("articles.id", ondelete="CASCADE"), nullable=False)
+    author_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "article_id", name="uix_feed_user_article"),
+        Index("ix_feed_entries_user_id_created_at", "user_id", "created_at", "article_id"),
+        Index("ix_feed_entries_user_id_author_id", "user_id", "author_id"),
+    )
+
+
+def fill_feed(connection, user_id: int, author_id: int | None = None) -> None:
+    """
+    Copies the latest articles of followed authors (or of one author) into the user's timeline
+    """
+    articles = select(
+        literal(user_id), Article.id, Article.author_id, Article.created_at
+    ).order_by(Article.created_at.desc()).limit(FEED_TIMELINE_SIZE)
+
+    if author_id is None:
+        articles = articles.join(Follower, Follower.followed_id == Article.author_id)\
+                           .where(Follower.follower_id == user_id)
+    else:
+        articles = articles.where(Article.author_id == author_id)
+
+    connection.execute(
+        postgresql_insert(FeedEntry)
+        .from_select(["user_id", "article_id", "author_id", "created_at"], articles)
+        .on_conflict_do_nothing(index_elements=["user_id", "article_id"])
+    )
+
+
+def trim_feeds(connection, user_ids) -> None:
+    """
+    Drops entries beyond the newest FEED_TIMELINE_SIZE of the timelines of `user_ids` (ids or a select of them)
+    """
+    positions = select(
+        FeedEntry.id,
+        func.row_number().over(
+            partition_by=FeedEntry.user_id,
+            order_by=(FeedEntry.created_at.desc(), FeedEntry.article_id.desc()),
+        ).label("position"),
+    ).where(FeedEntry.user_id.in_(user_ids)).subquery()
+
+    connection.execute(
+        delete(FeedEntry).where(
+            FeedEntry.id.in_(select(positions.c.id).where(positions.c.position > FEED_TIMELINE_SIZE))
+        )
+    )
+
+
+@event.listens_for(Article, "after_insert")
+def fan_out_article(mapper, connection, target):
+    followers = select(
+        Follower.follower_id, Article.id, Article.author_id, Article.created_at
+    ).join(User, User.id == Follower.follower_id)\
+     .join(Article, Article.author_id == Follower.followed_id)\
+     .where(
+        Article.id == target.id,
+        User.following_count >= FEED_FANOUT_THRESHOLD,
+     )
+
+    user_ids = connection.scalars(
+        insert(FeedEntry)
+        .from_select(["user_id", "article_id", "author_id", "created_at"], followers)
+        .returning(FeedEntry.user_id)
+    ).all()
+    if user_ids:
+        trim_feeds(connection, user_ids)
+
+
+# Registered after the follower counters, so `following_count` already includes this change
+@event.listens_for(Follower, "after_insert")
+def add_author_to_feed(mapper, connection, target):
+    following_count = connection.scalar(select(User.following_count).where(User.id == target.follower_id))
+
+    if following_count == FEED_FANOUT_THRESHOLD:
+        fill_feed(connection, target.follower_id)
+    elif following_count > FEED_FANOUT_THRESHOLD:
+        fill_feed(connection, target.follower_id, target.followed_id)
+        trim_feeds(connection, [target.follower_id])
+
+
+@event.listens_for(Follower, "after_delete")
+def remove_author_from_feed(mapper, connection, target):
+    following_count = connection.scalar(select(User.following_count).where(User.id == target.follower_id))
+
+    query = delete(FeedEntry).where(FeedEntry.user_id == target.follower_id)
+    if following_count >= FEED_FANOUT_THRESHOLD:
+        query = query.where(FeedEntry.author_id == target.followed_id)
+
+    connection.execute(query)
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field, root_validator, conint, conset, Field
 from datetime import datetime
 from typing import Annotated, Literal, Union, Optional, List
+from fastapi_pagination import Page
 
 # USER
 class UserInfo(BaseModel):
@@ -16,6 +17,11 @@ class BaseTag(BaseModel):
 class ResponseTag(BaseTag):
     id: int
 
+class TagCount(BaseTag):
+    free_article_count: int
+    paid_article_count: int
+    article_count: int
+
 # ARTICLE ASSESSMENT
 
 class ArticleAssessmentAnswer(BaseModel):
@@ -87,6 +93,35 @@ class ResponseArticle(BaseArticle):
     rating_count: int
     questions_count: int | None
 
+class TrendingArticle(ResponseArticle):
+    trending_score: float
+
+class TagFacet(BaseModel):
+    value: str
+    count: int
+
+class IsFreeFacet(BaseModel):
+    value: bool
+    count: int
+
+class RangeFacet(BaseModel):
+    min: float
+    max: float | None
+    count: int
+
+class SearchFacets(BaseModel):
+    tags: List[TagFacet]
+    is_free: List[IsFreeFacet]
+    price: List[RangeFacet]
+    rating: List[RangeFacet]
+
+class ArticleSearchPage(Page[ResponseArticle]):
+    facets: SearchFacets | None = None
+
+class ArticleFeed(BaseModel):
+    items: List[ResponseArticle]
+    next_cursor: str | None = None
+
 class ResponseArticleWishList(ResponseArticle):
     is_bought: bool | None = None
 
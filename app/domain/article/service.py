@@ -1,10 +1,21 @@
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy.sql import or_
-from app.dependencies import get_or_create
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.sql import or_, and_
+from sqlalchemy import select, tuple_, func, case, distinct, delete, literal, values, column, Integer, Float, DateTime
+from sqlalchemy.dialects.postgresql import insert
+from app.internal.cache import SnapshotCache
+from app.internal.related import RelatedArticlesIndex, ArticleDocument
+from app.internal.trending import trending_articles, MIN_TRENDING_SCORE
+from app.config import TAG_INDEX_TTL
+from app.domain.user.service import top_users_by_most_articles
 from . import models, schemas
 from typing import Union, Literal, Optional
 from sqlalchemy.sql import text
+from app.domain.user.models import Follower, User
+from datetime import datetime, timedelta, timezone
+from bisect import bisect_left
+import base64
+import heapq
 
 
 def get_articles(
@@ -38,10 +49,268 @@ def get_article_by_id(db: Session, article_id: int) -> models.Article:
     return db.query(models.Article).filter(models.Article.id == article_id).first()
 
 
+def get_articles_for_purchase(
+    db: Session, user_id: int, article_ids: list[int]
+) -> list[tuple[models.Article, bool]]:
+    """
+    Loads articles together with information if user already owns them, in one query
+    """
+    if not article_ids:
+        return []
+    return (
+        db.query(models.Article, models.ArticlePurchase.id.isnot(None))
+        .outerjoin(
+            models.ArticlePurchase,
+            and_(
+                models.ArticlePurchase.article_id == models.Article.id,
+                models.ArticlePurchase.user_id == user_id,
+            ),
+        )
+        .filter(models.Article.id.in_(article_ids))
+        .all()
+    )
+
+
 def get_articles_by_user_id(db: Session, user_id: int):
     return db.query(models.Article).filter(models.Article.author_id == user_id).all()
 
 
+def get_or_create_tags(db: Session, values: list[str]) -> list[models.Tag]:
+    """
+    Tags with the given values in their order, without duplicates. Missing ones are inserted
+    with a single statement (tags created concurrently are kept) and nothing is committed.
+    """
+    values = list(dict.fromkeys(values))
+    if not values:
+        return []
+
+    tags = {tag.value: tag for tag in db.scalars(select(models.Tag).where(models.Tag.value.in_(values)))}
+    missing = [value for value in values if value not in tags]
+    if missing:
+        db.execute(
+            insert(models.Tag)
+            .values([{"value": value} for value in missing])
+            .on_conflict_do_nothing(index_elements=[models.Tag.value])
+        )
+        tags.update((tag.value, tag) for tag in db.scalars(select(models.Tag).where(models.Tag.value.in_(missing))))
+
+    return [tags[value] for value in values]
+
+
+def tag_popularity(tag: schemas.TagCount) -> tuple[int, str]:
+    return -tag.article_count, tag.value
+
+
+class TagIndex:
+    """
+    Used tags sorted by popularity and by lowercase value, for prefix lookups with bisect.
+    """
+
+    def __init__(self, tags: list[schemas.TagCount]):
+        self.popular = sorted(tags, key=tag_popularity)
+        self.alphabetical = sorted(tags, key=lambda tag: tag.value.lower())
+        self.keys = [tag.value.lower() for tag in self.alphabetical]
+
+    def search(self, prefix: str = "", limit: int = 20) -> list[schemas.TagCount]:
+        """
+        Most popular tags starting with `prefix` (case insensitive).
+        """
+        if not prefix:
+            return self.popular[:limit]
+
+        prefix = prefix.lower()
+        start = bisect_left(self.keys, prefix)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(prefix):
+            end += 1
+
+        return heapq.nsmallest(limit, self.alphabetical[start:end], key=tag_popularity)
+
+
+def load_tag_index(db: Session) -> TagIndex:
+    tags = db.scalars(
+        select(models.Tag)
+        .where(models.Tag.free_article_count + models.Tag.paid_article_count > 0)
+    )
+    return TagIndex([schemas.TagCount.model_validate(tag, from_attributes=True) for tag in tags])
+
+
+tag_index = SnapshotCache(load_tag_index, ttl=TAG_INDEX_TTL, name="tag_index")
+
+
+related_articles = RelatedArticlesIndex()
+RELATED_ARTICLES_OVERLAP = timedelta(minutes=1)
+DELETED_ARTICLES_TTL = timedelta(days=1)  # longer than the rebuild interval of the related articles worker
+
+
+def load_article_documents(db: Session, article_ids: list[int] | None = None) -> list[ArticleDocument]:
+    """
+    Title, summary and text content elements of articles (all of them by default), with their tags
+    """
+    text_elements = (
+        select(func.string_agg(models.ArticleContentElement.content, " "))
+        .where(
+            models.ArticleContentElement.article_id == models.Article.id,
+            models.ArticleContentElement.content_type == "text",
+        )
+        .scalar_subquery()
+    )
+    tags = (
+        select(func.array_agg(models.ArticleTag.tag_value))
+        .where(models.ArticleTag.article_id == models.Article.id)
+        .scalar_subquery()
+    )
+    query = select(
+        models.Article.id, models.Article.title, models.Article.summary, text_elements, tags,
+        models.Article.content_updated_at,
+    )
+    if article_ids is not None:
+        query = query.where(models.Article.id.in_(article_ids))
+
+    return [
+        ArticleDocument(id=article_id, text=" ".join(filter(None, [title, summary, text])), tags=tags or [], version=version)
+        for article_id, title, summary, text, tags, version in db.execute(query.order_by(models.Article.id))
+    ]
+
+
+def refresh_related_articles(db: Session, rebuild: bool = False) -> None:
+    """
+    Builds the related articles index when it's missing or `rebuild` is set, otherwise applies
+    articles whose content changed or which were deleted since the index watermark
+    """
+    if rebuild or not related_articles.is_built:
+        # tombstones are only needed until every process rebuilt its index without those articles
+        db.execute(delete(models.DeletedArticle).where(
+            models.DeletedArticle.deleted_at < datetime.now(timezone.utc).replace(tzinfo=None) - DELETED_ARTICLES_TTL
+        ))
+        db.commit()
+        related_articles.build(load_article_documents(db))
+        return
+
+    if related_articles.watermark is None:
+        # nothing indexed yet, so nothing to remove either
+        changed = db.execute(select(models.Article.id, models.Article.content_updated_at))
+        deleted = []
+    else:
+        # transactions commit after their timestamps were taken, so recent changes are looked at again
+        since = related_articles.watermark - RELATED_ARTICLES_OVERLAP
+        changed = db.execute(
+            select(models.Article.id, models.Article.content_updated_at)
+            .where(models.Article.content_updated_at > since)
+        )
+        deleted = db.execute(
+            select(models.DeletedArticle.article_id, models.DeletedArticle.deleted_at)
+            .where(models.DeletedArticle.deleted_at > since)
+        ).all()
+
+    changed_ids = [article_id for article_id, version in changed if related_articles.version(article_id) != version]
+    for document in load_article_documents(db, changed_ids) if changed_ids else []:
+        related_articles.update(document)
+
+    for article_id, deleted_at in deleted:
+        related_articles.remove(article_id, deleted_at)
+
+
+def get_related_articles(db: Session, article_id: int, limit: int = 10) -> list[models.Article]:
+    # the background worker builds and maintains the index, nothing is related until it's built
+    if not related_articles.is_built:
+        return []
+
+    related_ids = related_articles.related(article_id, limit)
+    if not related_ids:
+        return []
+
+    articles = {
+        article.id: article
+        for article in db.scalars(
+            select(models.Article)
+            .where(models.Article.id.in_(related_ids))
+            .options(
+                selectinload(models.Article.author),
+                selectinload(models.Article.tags),
+                selectinload(models.Article.assessment_questions),
+            )
+        )
+    }
+    return [articles[related_id] for related_id in related_ids if related_id in articles]
+
+
+def decayed_trending_score(now: datetime):
+    age = func.extract("epoch", literal(now, DateTime) - models.ArticleTrendingScore.updated_at)
+    return models.ArticleTrendingScore.score * func.exp(-trending_articles.decay * age)
+
+
+def load_trending_scores(db: Session) -> None:
+    """
+    Replaces the in-memory trending counters with the persisted scores
+    """
+    now = trending_articles.clock()
+    as_of = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None)
+    scores = db.execute(select(models.ArticleTrendingScore.article_id, decayed_trending_score(as_of)))
+    trending_articles.load(dict(scores.all()), now)
+
+
+def persist_trending_scores(db: Session) -> None:
+    """
+    Adds signals of this process to the persisted scores, forgets decayed ones and reloads all of them,
+    so the counters include signals persisted by other processes
+    """
+    now = trending_articles.clock()
+    as_of = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None)
+
+    deltas = trending_articles.pop_pending(now)
+    try:
+        if deltas:
+            rows = values(column("article_id", Integer), column("score", Float), name="deltas").data(list(deltas.items()))
+            stmt = insert(models.ArticleTrendingScore).from_select(
+                ["article_id", "score", "updated_at"],
+                # deleted articles are skipped instead of failing the whole batch on the foreign key
+                select(rows.c.article_id, rows.c.score, literal(as_of, DateTime))
+                .join(models.Article, models.Article.id == rows.c.article_id)
+            )
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[models.ArticleTrendingScore.article_id],
+                set_={
+                    "score": decayed_trending_score(as_of) + stmt.excluded.score,
+                    "updated_at": stmt.excluded.updated_at,
+                },
+            ))
+
+        db.execute(delete(models.ArticleTrendingScore).where(decayed_trending_score(as_of) < MIN_TRENDING_SCORE))
+        db.commit()
+    except Exception:
+        # signals stay pending until a persist succeeds
+        db.rollback()
+        trending_articles.restore_pending(deltas, now)
+        raise
+
+    load_trending_scores(db)
+
+
+def get_trending_articles(db: Session, limit: int = 20) -> list[models.Article]:
+    # the background worker keeps the counters in sync with the database, only the first lookup loads them
+    if not trending_articles.is_loaded:
+        load_trending_scores(db)
+
+    scores = dict(trending_articles.top(limit))
+    if not scores:
+        return []
+
+    articles = db.scalars(
+        select(models.Article)
+        .where(models.Article.id.in_(scores))
+        .options(
+            selectinload(models.Article.author),
+            selectinload(models.Article.tags),
+            selectinload(models.Article.assessment_questions),
+        )
+    ).all()
+    for article in articles:
+        article.trending_score = scores[article.id]
+
+    return sorted(articles, key=lambda article: (-article.trending_score, article.id))
+
+
 def create_article(
     db: Session,
     article: Union[schemas.CreateArticle, dict],
@@ -62,12 +331,12 @@ def create_article(
     content_elements_dicts = article_dict.pop("content_elements", [])
     assessment_questions_data = article_dict.pop("assessment_questions", [])
 
-    tags = [get_or_create(db, models.Tag, value=tag["value"]) for tag in tag_dicts]
-    if len(tags) > 3:
+    if len(tag_dicts) > 3:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Zbyt wiele tagów. Maksymalnie dozwolone jest 3.",
         )
+    tags = get_or_create_tags(db, [tag["value"] for tag in tag_dicts])
     db_article = models.Article(
         **article_dict, author_id=user_id, tags=tags, title_image=title_image
     )
@@ -98,6 +367,8 @@ def create_article(
 
     db.add(db_article)
     db.commit()
+    top_users_by_most_articles.invalidate()
+    tag_index.invalidate()
     db.refresh(db_article)
     db_article.content_elements = sorted(
         db_article.content_elements, key=lambda e: e.order
@@ -107,8 +378,12 @@ def create_article(
 
 
 def delete_article(db: Session, db_article: models.Article):
+    article_id = db_article.id
     db.delete(db_article)
     db.commit()
+    top_users_by_most_articles.invalidate()
+    tag_index.invalidate()
+    trending_articles.remove(article_id)
     return True
 
 
@@ -286,17 +561,32 @@ def add_purchased_article(db: Session, user_id: int, article_id: int) -> None:
 
 
 def add_purchased_article_event(db: Session, user_id: int, article_id: int) -> None:
-    # Check if the purchase already exists
-    exists_query = db.query(models.ArticlePurchase).filter_by(
-        user_id=user_id,
-        article_id=article_id
-    ).first()
+    add_purchased_articles_event(db, user_id, [article_id])
+
+
+def add_purchased_articles(db: Session, user_id: int, article_ids: list[int]) -> None:
+    add_purchased_articles_event(db, user_id, article_ids)
+    db.commit()
+
+
+def add_purchased_articles_event(db: Session, user_id: int, article_ids: list[int]) -> None:
+    # Single INSERT ... ON CONFLICT DO NOTHING, already owned articles are skipped by uix_user_article
+    if not article_ids:
+        return
+
+    stmt = (
+        insert(models.ArticlePurchase)
+        .values([
+            {"user_id": user_id, "article_id": article_id}
+            for article_id in dict.fromkeys(article_ids)
+        ])
+        .on_conflict_do_nothing(index_elements=["user_id", "article_id"])
+        .returning(models.ArticlePurchase.article_id)
+    )
+    for article_id in db.scalars(stmt):
+        models.record_trending_signal(db, article_id, "purchase")
 
-    if not exists_query:
-        purchase = models.ArticlePurchase(user_id=user_id, article_id=article_id)
-        db.add(purchase)
 
-       
 def has_user_purchased_article(db: Session, user_id: int, article_id: int) -> bool:
     return (
         db.query(models.ArticlePurchase)
@@ -325,7 +615,7 @@ def get_purchased_articles_by_user_id(
     return db.query(models.ArticlePurchase).filter_by(user_id=user_id).all()
 
 
-def search_articles(
+def search_articles_query(
     db: Session,
     value: str,
     tags: list[str] = [],
@@ -337,10 +627,10 @@ def search_articles(
     min_rating: Optional[float] = None,
     max_rating: Optional[float] = None,
     is_free: Optional[bool] = None,
-    sort_order: Literal["asc", "desc"] = "desc",
-    sort_by: Literal["views", "date", "price", "rating"] = "date",
-) -> list[models.Article]:
-
+):
+    """
+    Unsorted query of articles matching the search filters
+    """
     query = db.query(models.Article)
 
     # Search by title and summary
@@ -385,6 +675,114 @@ def search_articles(
     if max_rating is not None:
         query = query.filter(models.Article.rating <= max_rating)
 
+    return query
+
+
+PRICE_FACET_BOUNDS = [0, 10, 25, 50, 100]
+RATING_FACET_BOUNDS = [0, 1, 2, 3, 4, 5]
+
+
+def facet_bucket(column, bounds: list[float]):
+    """
+    Lower bound of the range of `bounds` that contains `column`
+    """
+    return case(
+        *[(column < upper, lower) for lower, upper in zip(bounds, bounds[1:])],
+        else_=bounds[-1],
+    )
+
+
+def facet_ranges(counts: dict[float, int], bounds: list[float]) -> list[dict]:
+    upper_bounds = dict(zip(bounds, bounds[1:]))
+    return [
+        {"min": lower, "max": upper_bounds.get(lower), "count": counts[lower]}
+        for lower in bounds if lower in counts
+    ]
+
+
+def search_facets(db: Session, **filters) -> dict:
+    """
+    Counts of articles matching `filters` (arguments of search_articles_query) per tag, is_free,
+    price range and rating range, computed in one grouped query with GROUPING SETS
+    """
+    article_ids = search_articles_query(db, **filters).with_entities(models.Article.id)
+    filtered = (
+        select(
+            models.Article.id,
+            func.coalesce(models.Article.is_free, True).label("is_free"),
+            facet_bucket(models.Article.price, PRICE_FACET_BOUNDS).label("price"),
+            facet_bucket(models.Article.rating, RATING_FACET_BOUNDS).label("rating"),
+        )
+        .where(models.Article.id.in_(article_ids))
+        .subquery()
+    )
+    dimensions = {
+        "tags": models.ArticleTag.tag_value,
+        "is_free": filtered.c.is_free,
+        "price": filtered.c.price,
+        "rating": filtered.c.rating,
+    }
+
+    rows = db.execute(
+        select(
+            *dimensions.values(),
+            *[func.grouping(column) for column in dimensions.values()],
+            # tags multiply the rows of an article, so articles are counted once per group
+            func.count(distinct(filtered.c.id)),
+        )
+        .select_from(filtered.outerjoin(models.ArticleTag, models.ArticleTag.article_id == filtered.c.id))
+        .group_by(func.grouping_sets(*[tuple_(column) for column in dimensions.values()]))
+    )
+
+    counts = {name: {} for name in dimensions}
+    for row in rows:
+        values, grouped, count = row[:len(dimensions)], row[len(dimensions):-1], row[-1]
+        for name, value, is_aggregated in zip(dimensions, values, grouped):
+            # articles without tags form a group with a NULL tag
+            if not is_aggregated and value is not None:
+                counts[name][value] = count
+
+    return {
+        "tags": [
+            {"value": value, "count": count}
+            for value, count in sorted(counts["tags"].items(), key=lambda item: (-item[1], item[0]))
+        ],
+        "is_free": [{"value": value, "count": count} for value, count in sorted(counts["is_free"].items())],
+        "price": facet_ranges(counts["price"], PRICE_FACET_BOUNDS),
+        "rating": facet_ranges(counts["rating"], RATING_FACET_BOUNDS),
+    }
+
+
+def search_articles(
+    db: Session,
+    value: str,
+    tags: list[str] = [],
+    author_id: Optional[int] = None,
+    min_view_count: Optional[int] = None,
+    max_view_count: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_rating: Optional[float] = None,
+    max_rating: Optional[float] = None,
+    is_free: Optional[bool] = None,
+    sort_order: Literal["asc", "desc"] = "desc",
+    sort_by: Literal["views", "date", "price", "rating"] = "date",
+) -> list[models.Article]:
+
+    query = search_articles_query(
+        db=db,
+        value=value,
+        tags=tags,
+        author_id=author_id,
+        min_view_count=min_view_count,
+        max_view_count=max_view_count,
+        min_price=min_price,
+        max_price=max_price,
+        min_rating=min_rating,
+        max_rating=max_rating,
+        is_free=is_free,
+    )
+
     # Apply sorting based on sort_by and sort_order
     if sort_by == "views":
         sort_column = models.Article.view_count
@@ -497,12 +895,12 @@ def partial_update_article(
             setattr(db_article, attribute, db_content_elements)
 
         elif attribute == "tags":
-            tags = [get_or_create(db, models.Tag, value=tag["value"]) for tag in value]
-            if len(tags) > 3:
+            if len(value) > 3:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail="Zbyt wiele tagów. Maksymalnie dozwolone jest 3.",
                 )
+            tags = get_or_create_tags(db, [tag["value"] for tag in value])
             setattr(db_article, attribute, tags)
 
         elif attribute == "assessment_questions":
@@ -526,8 +924,70 @@ def partial_update_article(
             setattr(db_article, attribute, value)
 
     db.commit()
+    tag_index.invalidate()
     db.refresh(db_article)
     db_article.content_elements = sorted(
         db_article.content_elements, key=lambda e: e.order
     )
     return db_article
+
+
+def encode_feed_cursor(created_at: datetime, article_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{article_id}".encode()).decode()
+
+
+def decode_feed_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, article_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(article_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Niepoprawny kursor.",
+        )
+
+
+def get_feed(
+    db: Session, user_id: int, cursor: Optional[str] = None, size: int = 20
+) -> tuple[list[models.Article], Optional[str]]:
+    """
+    Newest articles of authors followed by the user and the cursor of the next page.
+
+    Readers following many authors read their precomputed timeline,
+    the rest read articles of followed authors directly.
+    """
+    following_count = db.query(User.following_count).filter(User.id == user_id).scalar() or 0
+
+    if following_count >= models.FEED_FANOUT_THRESHOLD:
+        position = (models.FeedEntry.created_at, models.FeedEntry.article_id)
+        query = (
+            select(models.Article)
+            .join(models.FeedEntry, models.FeedEntry.article_id == models.Article.id)
+            .where(models.FeedEntry.user_id == user_id)
+        )
+    else:
+        position = (models.Article.created_at, models.Article.id)
+        query = (
+            select(models.Article)
+            .join(Follower, Follower.followed_id == models.Article.author_id)
+            .where(Follower.follower_id == user_id)
+        )
+
+    if cursor is not None:
+        query = query.where(tuple_(*position) < tuple_(*decode_feed_cursor(cursor)))
+
+    articles = db.scalars(
+        query.order_by(*[column.desc() for column in position])
+        .limit(size + 1)
+        .options(
+            selectinload(models.Article.author),
+            selectinload(models.Article.tags),
+            selectinload(models.Article.assessment_questions),
+        )
+    ).all()
+
+    if len(articles) <= size:
+        return articles, None
+
+    articles = articles[:size]
+    return articles, encode_feed_cursor(articles[-1].created_at, articles[-1].id)
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, event, DateTime, Text
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, event, DateTime, Text, Index
 from sqlalchemy.orm import relationship, Session
 from sqlalchemy.sql import func
 from ..model_base import Base
@@ -16,4 +16,8 @@ class Issue(Base):
     
     reported_by_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     reported_by = relationship('User', back_populates='support_issues')
+
+    __table_args__ = (
+        Index('ix_issues_reported_by_id_updated_at', 'reported_by_id', 'updated_at'),
+    )
     
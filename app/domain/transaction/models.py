@@ -1,16 +1,17 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, event, DateTime, Text
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, event, DateTime, Text, select, UniqueConstraint, Index
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import relationship, Session, attributes
 from sqlalchemy.sql import func
 from ..model_base import Base
-from ..article.service import add_purchased_article_event
+from ..article.models import ArticlePurchase, record_trending_signal
 
 
 class TransactionItem(Base):
     __tablename__ = "transaction_items"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    transaction_id = Column(String(255), ForeignKey("transactions.id"), nullable=False)
-    article_id = Column(Integer, ForeignKey("articles.id"), nullable=False)
+    transaction_id = Column(String(255), ForeignKey("transactions.id"), nullable=False, index=True)
+    article_id = Column(Integer, ForeignKey("articles.id"), nullable=False, index=True)
     paid_out = Column(Boolean, nullable=False, default=False)
 
     transaction = relationship("Transaction", foreign_keys=[transaction_id], back_populates="items")
@@ -31,6 +32,10 @@ class Transaction(Base):
     user = relationship("User", foreign_keys=[user_id], back_populates="transactions")
     items = relationship("TransactionItem", back_populates="transaction", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_transactions_user_id_created_at", "user_id", "created_at"),
+    )
+
     # @property
     # def total_price(self) -> float:
     #     price = 0
@@ -38,22 +43,71 @@ class Transaction(Base):
     #         price += item.article.price
     #     return price
 
+class PaymentNotification(Base):
+    """
+    Inbox of PayU notifications, filled by the webhook and applied to transactions in batches by a worker
+    """
+    __tablename__ = "payment_notifications"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    order_id = Column(String(255), nullable=False)
+    payu_order_id = Column(String(255), nullable=True)
+    status = Column(String(255), nullable=False)
+    payload = Column(Text, nullable=False)
+    received_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    outcome = Column(String(255), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("order_id", "status", name="uix_payment_notification_order_status"),
+        Index(
+            "ix_payment_notifications_unprocessed",
+            "received_at",
+            postgresql_where=processed_at.is_(None)
+        ),
+    )
+
+
+COMPLETED_TRANSACTIONS_KEY = "completed_transaction_ids"
+
+
 @event.listens_for(Session, "before_flush")
 def track_status_changes(session, flush_context, instances):
+    completed = set()
     for obj in session.dirty:
-        if isinstance(obj, Transaction):
+        if isinstance(obj, Transaction) and obj.status == "COMPLETED":
             hist = attributes.get_history(obj, "status", passive=True)
-            if hist.has_changes() and obj.status == "COMPLETED":
-                setattr(obj, "_status_changed_to_completed", True)
+            if hist.has_changes():
+                completed.add(obj.id)
     for obj in session.new:
         if isinstance(obj, Transaction) and obj.status == "COMPLETED":
-            setattr(obj, "_status_changed_to_completed", True)
+            completed.add(obj.id)
+    if completed:
+        session.info.setdefault(COMPLETED_TRANSACTIONS_KEY, set()).update(completed)
 
 @event.listens_for(Session, "after_flush_postexec")
 def after_status_completed(session, flush_context):
-    for obj in session.identity_map.values():
-        if isinstance(obj, Transaction) and getattr(obj, "_status_changed_to_completed", False):
-            for item in obj.items:
-                add_purchased_article_event(session, obj.user_id, item.article_id)
-                # print(f"[EVENT] Purchase added: user {obj.user_id}, article {item.article_id}")
+    """
+    Grants articles of every transaction completed in this flush with one INSERT ... SELECT
+    """
+    if not (transaction_ids := session.info.pop(COMPLETED_TRANSACTIONS_KEY, None)):
+        return
+
+    purchases = (
+        select(Transaction.user_id, TransactionItem.article_id)
+        .join(TransactionItem, TransactionItem.transaction_id == Transaction.id)
+        .where(Transaction.id.in_(transaction_ids))
+        .distinct()
+    )
+    purchased = session.scalars(
+        insert(ArticlePurchase)
+        .from_select(["user_id", "article_id"], purchases)
+        .on_conflict_do_nothing(index_elements=["user_id", "article_id"])
+        .returning(ArticlePurchase.article_id)
+    )
+    for article_id in purchased:
+        record_trending_signal(session, article_id, "purchase")
 
+@event.listens_for(Session, "after_soft_rollback")
+def forget_completed_transactions(session, previous_transaction):
+    session.info.pop(COMPLETED_TRANSACTIONS_KEY, None)
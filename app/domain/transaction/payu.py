@@ -0,0 +1,276 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import random
+import time
+import httpx
+
+
+logger = logging.getLogger("payu")
+
+PAYU_BASE_URL = os.getenv("PAYU_BASE_URL") or (
+    "https://secure.snd.payu.com" if os.getenv("PAYU_ENV") == "sandbox" else "https://secure.payu.com"
+)
+PAYU_NOTIFY_URL = os.getenv("PAYU_NOTIFY_URL", "http://readit.ddns.net:8000/transactions/notify")
+PAYU_SECOND_KEY = os.getenv("PAYU_SECOND_KEY", "")
+
+TOKEN_REFRESH_MARGIN = 60  # in seconds, token is refreshed this long before it expires
+REQUEST_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.2  # in seconds, doubled after every attempt
+RETRY_STATUS_CODES = {502, 503, 504}
+
+
+SIGNATURE_ALGORITHMS = {"MD5": "md5", "SHA": "sha1", "SHA1": "sha1", "SHA-256": "sha256", "SHA256": "sha256"}
+
+
+def verify_notification_signature(body: bytes, header: str | None, second_key: str | None = None) -> bool:
+    """
+    Checks `OpenPayu-Signature` header of a notification, e.g.
+    `sender=checkout;signature=<hex>;algorithm=MD5;content=DOCUMENT`
+
+    Without a second key anyone could sign a notification, so all of them are rejected.
+    """
+    second_key = PAYU_SECOND_KEY if second_key is None else second_key
+    if not header or not second_key:
+        return False
+
+    fields = dict(part.split("=", 1) for part in header.split(";") if "=" in part)
+
+    if not (algorithm := SIGNATURE_ALGORITHMS.get(fields.get("algorithm", "MD5").upper())):
+        return False
+
+    expected = hashlib.new(algorithm, body + second_key.encode()).hexdigest()
+    return hmac.compare_digest(expected, fields.get("signature", ""))
+
+
+class PayUUnavailableError(Exception):
+    """Raised when the circuit breaker is open and PayU is not called at all"""
+
+
+class CircuitBreaker:
+    """
+    Stops calling PayU after `failure_threshold` consecutive failures.
+
+    After `reset_timeout` seconds a single trial request is let through,
+    its result decides whether the breaker closes again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow_request(self) -> bool:
+        if self.opened_at is None:
+            return True
+
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Half-open, let one request through and re-arm the timer
+            self.opened_at = time.monotonic()
+            return True
+
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("PayU circuit breaker opened after %s failures", self.failures)
+            self.opened_at = time.monotonic()
+
+
+class PayUClient:
+    """
+    Long-lived PayU REST client.
+
+    Keeps one pooled `httpx.AsyncClient` (HTTP/2 when available) and caches the
+    OAuth token until shortly before it expires. Concurrent callers share a single
+    token refresh.
+    """
+
+    def __init__(
+        self,
+        base_url: str = PAYU_BASE_URL,
+        client_id: str | None = None,
+        client_secret: str | None = None,
+        pos_id: str | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+    ):
+        self.base_url = base_url
+        self.client_id = client_id if client_id is not None else os.getenv("PAYU_CLIENT_ID")
+        self.client_secret = client_secret if client_secret is not None else os.getenv("PAYU_CLIENT_SECRET")
+        self.pos_id = pos_id if pos_id is not None else os.getenv("PAYU_POS_ID")
+        self.transport = transport
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+
+        self._client: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._token: str | None = None
+        self._token_expires_at = 0.0
+        self._token_lock: asyncio.Lock | None = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+
+        # Connections and locks are bound to the loop they were created in
+        # (TestClient starts a fresh loop for every `with` block)
+        if self._client is not None and self._loop is not loop:
+            self._discard_client()
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=self.transport is None,
+                limits=POOL_LIMITS,
+                timeout=REQUEST_TIMEOUT,
+                transport=self.transport,
+            )
+            self._loop = loop
+            self._token_lock = asyncio.Lock()
+
+        return self._client
+
+    def _discard_client(self) -> None:
+        """
+        Closes the client of another loop on that loop, connections of a closed loop are left to be collected
+        """
+        client, loop = self._client, self._loop
+        self._client = None
+        self._loop = None
+
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        else:
+            logger.debug("Dropping PayU client of a closed event loop")
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    def _token_is_valid(self) -> bool:
+        return self._token is not None and time.monotonic() < self._token_expires_at
+
+    async def get_access_token(self) -> str:
+        self._get_client()
+
+        if self._token_is_valid():
+            return self._token
+
+        async with self._token_lock:
+            # Another coroutine could have refreshed it while we were waiting
+            if self._token_is_valid():
+                return self._token
+
+            response = await self._send(
+                "POST",
+                "/pl/standard/user/oauth/authorize",
+                retry_unsafe=True,
+                data={"grant_type": "client_credentials"},
+                auth=(self.client_id, self.client_secret),
+            )
+            response.raise_for_status()
+            body = response.json()
+
+            self._token = body["access_token"]
+            self._token_expires_at = time.monotonic() + max(int(body.get("expires_in", 0)) - TOKEN_REFRESH_MARGIN, 0)
+
+            return self._token
+
+    def invalidate_token(self) -> None:
+        self._token = None
+        self._token_expires_at = 0.0
+
+    async def _send(self, method: str, url: str, retry_unsafe: bool = False, **kwargs) -> httpx.Response:
+        """
+        Sends request with retries and exponential backoff.
+
+        Connection failures are always retried, timeouts and 5xx responses only
+        when `retry_unsafe` is set (the request can be repeated without side effects).
+        """
+        client = self._get_client()
+        attempt = 0
+
+        while True:
+            if not self.circuit_breaker.allow_request():
+                raise PayUUnavailableError("PayU is unavailable")
+
+            try:
+                response = await client.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                self.circuit_breaker.record_failure()
+                error = e
+            except httpx.TransportError as e:
+                self.circuit_breaker.record_failure()
+                if not retry_unsafe:
+                    raise
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    self.circuit_breaker.record_success()
+                    return response
+
+                self.circuit_breaker.record_failure()
+                if not retry_unsafe:
+                    return response
+                error = None
+
+            attempt += 1
+            if attempt >= MAX_RETRIES:
+                if error is not None:
+                    raise error
+                return response
+
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1) * (1 + random.random() / 2))
+
+    async def request(self, method: str, url: str, retry_unsafe: bool = False, **kwargs) -> httpx.Response:
+        token = await self.get_access_token()
+        response = await self._send(method, url, retry_unsafe=retry_unsafe, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+
+        if response.status_code == 401:
+            # Token was revoked before its expiry, fetch a new one once
+            self.invalidate_token()
+            token = await self.get_access_token()
+            response = await self._send(method, url, retry_unsafe=retry_unsafe, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+
+        return response
+
+    async def create_order(self, payload: dict) -> dict:
+        payload = {"merchantPosId": self.pos_id, **payload}
+        response = await self.request("POST", "/api/v2_1/orders", json=payload)
+
+        # PayU answers with 302 and the redirect in the body
+        if response.status_code in [200, 201, 302]:
+            return response.json()
+
+        response.raise_for_status()
+
+    async def get_order(self, payu_order_id: str) -> dict:
+        response = await self.request("GET", f"/api/v2_1/orders/{payu_order_id}", retry_unsafe=True)
+        response.raise_for_status()
+        return response.json()
+
+
+payu_client = PayUClient()
+
+
+def get_payu_client() -> PayUClient:
+    """
+    Dependency returning the shared PayU client, override it in tests
+    """
+    return payu_client
@@ -1,11 +1,26 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import case, func, or_
-from passlib.context import CryptContext
-from collections import Counter
-from typing import Literal, Optional, List, Tuple
+from sqlalchemy.orm import Session, selectinload, joinedload
+from sqlalchemy import func, select, Select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from typing import List, Tuple
+from datetime import datetime
+from app.domain.article.models import Article
 from . import models, schemas
 
 
+# Order of PayU statuses, a notification may only move a transaction forward.
+# EXPIRED is set by us for abandoned orders, a late payment can still complete them.
+STATUS_RANK = {
+    "WAITING_FOR_PAYMENT": 0,
+    "NEW": 0,
+    "PENDING": 1,
+    "WAITING_FOR_CONFIRMATION": 2,
+    "EXPIRED": 3,
+    "COMPLETED": 4,
+    "CANCELED": 4,
+}
+PENDING_STATUSES = ("WAITING_FOR_PAYMENT", "NEW", "PENDING", "WAITING_FOR_CONFIRMATION")
+
+
 def create_transaction(db: Session, transaction: schemas.TransactionCreate):
     db_transaction = models.Transaction(**transaction.model_dump())
     db.add(db_transaction)
@@ -14,20 +29,37 @@ def create_transaction(db: Session, transaction: schemas.TransactionCreate):
     return db_transaction
 
 
+def create_transaction_with_items(
+    db: Session,
+    transaction: schemas.TransactionCreate,
+    items: List[schemas.TransactionItemCreate]
+) -> models.Transaction:
+    db_transaction = models.Transaction(
+        **transaction.model_dump(),
+        items=[models.TransactionItem(**item.model_dump()) for item in items]
+    )
+    db.add(db_transaction)
+    db.commit()
+    return db_transaction
+
+
 def get_transaction(db: Session, transaction_id: str):
     return db.query(models.Transaction).filter(models.Transaction.id == transaction_id).first()
 
-def get_user_transactions_service(db: Session, user_id: int) -> List[schemas.TransactionGet]:
-    transactions = db.query(models.Transaction).filter(models.Transaction.user_id == user_id).all()
-    return [
-        schemas.TransactionGet(
-            id=txn.id,
-            status=txn.status,
-            created_at=txn.created_at,
-            total_price=txn.total_price
+def get_user_transactions_query(user_id: int) -> Select:
+    """
+    Newest first, items and the title/price of their articles are loaded by one extra query per page
+    """
+    return (
+        select(models.Transaction)
+        .where(models.Transaction.user_id == user_id)
+        .options(
+            selectinload(models.Transaction.items)
+            .joinedload(models.TransactionItem.article)
+            .load_only(Article.title, Article.price)
         )
-        for txn in transactions
-    ]
+        .order_by(models.Transaction.created_at.desc(), models.Transaction.id.desc())
+    )
 
 def delete_transaction(db: Session, transaction_id: str):
     db_transaction = get_transaction(db, transaction_id)
@@ -50,4 +82,115 @@ def get_transaction_items_by_article_id(db: Session, article_id: int) -> List[mo
     return db.query(models.TransactionItem).filter(models.TransactionItem.article_id == article_id).all()
 
 def get_transaction_items_by_transaction_id(db: Session, transaction_id: str) -> List[models.TransactionItem]:
-    return db.query(models.TransactionItem).filter(models.TransactionItem.transaction_id == transaction_id).all()
\ No newline at end of file
+    return db.query(models.TransactionItem).filter(models.TransactionItem.transaction_id == transaction_id).all()
+
+
+def is_status_forward(current: str, new: str) -> bool:
+    if new not in STATUS_RANK:
+        return False
+    return STATUS_RANK[new] > STATUS_RANK.get(current, -1)
+
+
+def add_payment_notification(db: Session, order_id: str, payu_order_id: str | None, status: str, payload: str) -> bool:
+    """
+    Puts notification into the inbox, returns False if the same (order, status) pair was already received
+    """
+    result = db.execute(
+        insert(models.PaymentNotification)
+        .values(order_id=order_id, payu_order_id=payu_order_id, status=status, payload=payload)
+        .on_conflict_do_nothing(index_elements=["order_id", "status"])
+    )
+    db.commit()
+    return result.rowcount > 0
+
+
+def apply_payment_notifications(db: Session, batch_size: int = 500) -> int:
+    """
+    Applies a batch of unprocessed notifications in one transaction, returns how many were processed.
+
+    Rows are locked with SKIP LOCKED, so several workers can run at once.
+    """
+    notifications = db.scalars(
+        select(models.PaymentNotification)
+        .where(models.PaymentNotification.processed_at.is_(None))
+        .order_by(models.PaymentNotification.received_at, models.PaymentNotification.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    if not notifications:
+        return 0
+
+    transactions = {
+        transaction.id: transaction
+        for transaction in db.scalars(
+            select(models.Transaction)
+            .where(models.Transaction.id.in_({notification.order_id for notification in notifications}))
+            .order_by(models.Transaction.id)  # same lock order in every process, so they cannot deadlock
+            .with_for_update()
+        )
+    }
+    processed_at = func.now()
+
+    for notification in notifications:
+        if not (transaction := transactions.get(notification.order_id)):
+            notification.outcome = "UNKNOWN_ORDER"
+        elif is_status_forward(transaction.status, notification.status):
+            transaction.status = notification.status
+            notification.outcome = "APPLIED"
+        else:
+            notification.outcome = "STALE"
+        notification.processed_at = processed_at
+
+    db.commit()
+    return len(notifications)
+
+
+def get_pending_transactions(
+    db: Session,
+    created_before: datetime,
+    after: Tuple[datetime, str] | None = None,
+    limit: int = 100
+) -> List[models.Transaction]:
+    """
+    Pending transactions older than `created_before`, oldest first, `after` is the (created_at, id) of the previous batch's last row
+    """
+    query = (
+        select(models.Transaction)
+        .where(
+            models.Transaction.status.in_(PENDING_STATUSES),
+            models.Transaction.created_at < created_before
+        )
+        .order_by(models.Transaction.created_at, models.Transaction.id)
+        .limit(limit)
+    )
+
+    if after is not None:
+        query = query.where(
+            tuple_(models.Transaction.created_at, models.Transaction.id) > tuple_(*after)
+        )
+
+    return db.scalars(query).all()
+
+
+def update_transaction_statuses(db: Session, statuses: dict[str, str]) -> int:
+    """
+    Moves transactions forward to the given statuses in one commit, returns how many changed
+    """
+    if not statuses:
+        return 0
+
+    changed = 0
+    for transaction in db.scalars(
+        select(models.Transaction)
+        .where(models.Transaction.id.in_(statuses))
+        .order_by(models.Transaction.id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ):
+        if is_status_forward(transaction.status, statuses[transaction.id]):
+            transaction.status = statuses[transaction.id]
+            changed += 1
+
+    db.commit()
+    return changed
@@ -1,5 +1,5 @@
 from sqladmin import Admin, ModelView
-from .models import Transaction, TransactionItem
+from .models import Transaction, TransactionItem, PaymentNotification
 
 class TransactionView(ModelView, model=Transaction):
     column_list = [
@@ -9,4 +9,9 @@ class TransactionView(ModelView, model=Transaction):
 class TransactionItemView(ModelView, model=TransactionItem):
     column_list = [
         "id", "transaction_id", "article_id", "paid_out"
-    ]
\ No newline at end of file
+    ]
+
+class PaymentNotificationView(ModelView, model=PaymentNotification):
+    column_list = [
+        "id", "order_id", "status", "received_at", "processed_at", "outcome"
+    ]
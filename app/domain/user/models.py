@@ -1,8 +1,19 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, event
-from sqlalchemy.orm import relationship, Session
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, UniqueConstraint, Index, event, update, case
+from sqlalchemy.orm import relationship, Session, object_session
 from sqlalchemy.sql import func
 from app.config import IP_ADDRESS
 from ..model_base import Base
+
+DEFAULT_AVATAR = "media/uploads/user/default.jpg"
+DEFAULT_BACKGROUND_IMAGE = "media/uploads/user/default_bg_img.png"
+
+
+def average_rating(rating_sum: float | None, rated_count: int | None) -> float:
+    """
+    Average rating of an author from the aggregate of their rated articles
+    """
+    return round(rating_sum / rated_count, 2) if rated_count else 0.0
+
     
 class User(Base):
     __tablename__ = "users"
@@ -12,14 +23,17 @@ class User(Base):
     last_name = Column(String(31), unique=False)
     email = Column(String(63), unique=True)
     sex = Column(String(31), unique=False)
-    avatar = Column(String, unique=False, default="media/uploads/user/default.jpg")
-    background_image = Column(String, unique=False, default="media/uploads/user/default_bg_img.png")
+    avatar = Column(String, unique=False, default=DEFAULT_AVATAR)
+    background_image = Column(String, unique=False, default=DEFAULT_BACKGROUND_IMAGE)
     description = Column(String(1023), unique=False, default="", nullable=False)
     short_description = Column(String(255), unique=False, default="", nullable=False)
     is_active = Column(Boolean, unique=False, default=False)
-    follower_count = Column(Integer, unique=False, default=0)
+    follower_count = Column(Integer, unique=False, default=0, index=True)
     following_count = Column(Integer, unique=False, default=0)
-    article_count = Column(Integer, unique=False, default=0)
+    article_count = Column(Integer, unique=False, default=0, index=True)
+    # Aggregate of the author's articles with a non-zero rating, kept up to date by article listeners
+    rated_article_count = Column(Integer, nullable=False, default=0, server_default="0")
+    rated_article_rating_sum = Column(Float, nullable=False, default=0, server_default="0")
     hashed_password = Column(String, unique=False)
     
     followers = relationship('Follower', foreign_keys='Follower.followed_id', back_populates='followed', lazy=True, cascade="all, delete-orphan")
@@ -37,31 +51,36 @@ class User(Base):
 
     @property 
     def skill_list(self):
-        from .service import get_user_skills
-        from app.dependencies import SessionLocal
-        db = SessionLocal()
-        try:
-            return get_user_skills(db=db, user_id=self.id)
-        finally:
-            db.close()
+        """
+        Skills preloaded with `attach_user_skills`, otherwise loaded once through the session of this user
+        """
+        if (skill_list := self.__dict__.get('_skill_list')) is None:
+            from .service import get_user_skills
+
+            if (db := object_session(self)) is None:
+                return []
+            skill_list = get_user_skills(db=db, user_id=self.id)
+            self.set_skill_list(skill_list)
+
+        return skill_list
+
+    def set_skill_list(self, skill_list) -> None:
+        self.__dict__['_skill_list'] = skill_list
          
     @property
     def avg_rating_from_articles(self):
-        articles = [article.rating for article in self.articles if article.rating != 0]
-        sum_rating = sum(articles)
-        counter = len(articles)
-        return round(sum_rating / counter, 2) if counter > 0 else 0.0
+        return average_rating(self.rated_article_rating_sum, self.rated_article_count)
 
     @property
     def avatar_url(self):
         if self.avatar is None:
-            self.avatar = 'media/uploads/user/default.jpg'
+            self.avatar = DEFAULT_AVATAR
         return IP_ADDRESS + self.avatar
     
     @property
     def background_image_url(self):
         if self.background_image is None:
-            self.background_image = "media/uploads/user/default_bg_img.png"
+            self.background_image = DEFAULT_BACKGROUND_IMAGE
         return IP_ADDRESS + self.background_image
     
     def __str__(self):
@@ -73,37 +92,38 @@ class Follower(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     followed_id = Column(Integer, ForeignKey('users.id'), unique=False, nullable=False)
     follower_id = Column(Integer, ForeignKey('users.id'), unique=False, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=func.now(), server_default=func.now())
 
     followed = relationship('User', foreign_keys=[followed_id], back_populates='followers', overlaps="followers,following_user")
     follower = relationship('User', foreign_keys=[follower_id], back_populates='following', overlaps="followers,following_user")
+
+    __table_args__ = (
+        UniqueConstraint("follower_id", "followed_id", name="uix_follower_followed"),
+        # Followers and followed users of a profile, newest first, without touching the table
+        Index("ix_followers_followed_id_created_at", "followed_id", "created_at", "follower_id"),
+        Index("ix_followers_follower_id_created_at", "follower_id", "created_at", "followed_id"),
+    )
     
+def change_follow_counts(connection, follower_id: int, followed_id: int, delta: int) -> None:
+    """
+    Moves follower_count of the followed user and following_count of the follower with one UPDATE
+    """
+    connection.execute(
+        update(User)
+        .where(User.id.in_([followed_id, follower_id]))
+        .values(
+            follower_count=func.coalesce(User.follower_count, 0) + case((User.id == followed_id, delta), else_=0),
+            following_count=func.coalesce(User.following_count, 0) + case((User.id == follower_id, delta), else_=0),
+        )
+    )
+
 @event.listens_for(Follower, 'after_insert')
 def increment_follower_count(mapper, connection, target):
-    session = Session(bind=connection)
-    
-    session.query(User).filter(User.id == target.followed_id).update({
-        User.follower_count: User.follower_count + 1
-    }, synchronize_session=False)
-    
-    session.query(User).filter(User.id == target.follower_id).update({
-        User.following_count: User.following_count + 1
-    }, synchronize_session=False)
-    
-    session.commit()
+    change_follow_counts(connection, target.follower_id, target.followed_id, 1)
 
 @event.listens_for(Follower, 'after_delete')
 def decrement_follower_count(mapper, connection, target):
-    session = Session(bind=connection)
-
-    session.query(User).filter(User.id == target.followed_id).update({
-        User.follower_count: User.follower_count - 1
-    }, synchronize_session=False)
-    
-    session.query(User).filter(User.id == target.follower_id).update({
-        User.following_count: User.following_count - 1
-    }, synchronize_session=False)
-    
-    session.commit()
+    change_follow_counts(connection, target.follower_id, target.followed_id, -1)
 
     
 class SkillList(Base):
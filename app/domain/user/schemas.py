@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from app.domain.article.schemas import ResponseArticle
+from .models import DEFAULT_AVATAR, DEFAULT_BACKGROUND_IMAGE
 
 class Skill(BaseModel):
     id: int
@@ -22,8 +23,8 @@ class UserBase(BaseModel):
     
 class UserCreate(UserBase):
     password: str
-    avatar: str | None = "media/uploads/user/default.jpg"
-    background_image: str | None = "media/uploads/user/default_bg_img.png"
+    avatar: str | None = DEFAULT_AVATAR
+    background_image: str | None = DEFAULT_BACKGROUND_IMAGE
     short_description: str = ""
     description: str = ""
     is_active: bool | None = False
@@ -62,8 +63,8 @@ class User(UserBase):
 class UserPublic(BaseModel): 
     id: int
     sex: str
-    avatar_url: str | None = "media/uploads/user/default.jpg"
-    background_image_url: str | None = "media/uploads/user/default_bg_img.png"
+    avatar_url: str | None = DEFAULT_AVATAR
+    background_image_url: str | None = DEFAULT_BACKGROUND_IMAGE
     short_description: str
     follower_count: int
     first_name: str
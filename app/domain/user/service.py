@@ -1,8 +1,12 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import case, func, or_
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import case, delete, func, or_, select, Select
+from sqlalchemy.exc import IntegrityError
 from passlib.context import CryptContext
 from collections import Counter
 from typing import Literal, Optional, List, Tuple
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from app.config import IP_ADDRESS, LEADERBOARD_SIZE, LEADERBOARD_TTL
+from app.internal.cache import SnapshotCache
 from . import models, schemas
 
 pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
@@ -16,6 +20,55 @@ def verify_password(password: str, hashed_password: str) -> bool:
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
 
+def get_user_profile(db: Session, user_id: int) -> dict | None:
+    """
+    Profile of the user with counters, rating and skills, read with a single query
+    """
+    User = models.User
+    skills = select(
+        func.coalesce(
+            func.json_agg(
+                aggregate_order_by(
+                    func.json_build_object('id', models.SkillList.id, 'skill_name', models.Skill.skill_name),
+                    models.SkillList.id
+                )
+            ),
+            func.json_build_array()
+        )
+    ).select_from(models.SkillList)\
+     .join(models.Skill, models.Skill.id == models.SkillList.skill_id)\
+     .where(models.SkillList.user_id == User.id)\
+     .scalar_subquery()
+
+    row = db.execute(
+        select(
+            User.id, User.email, User.sex, User.first_name, User.last_name,
+            User.avatar, User.background_image, User.description, User.short_description,
+            User.follower_count, User.article_count,
+            User.rated_article_count, User.rated_article_rating_sum,
+            skills.label('skill_list')
+        ).where(User.id == user_id)
+    ).mappings().first()
+
+    if row is None:
+        return None
+
+    return {
+        "id": row["id"],
+        "email": row["email"],
+        "sex": row["sex"],
+        "avatar": IP_ADDRESS + (row["avatar"] or models.DEFAULT_AVATAR),
+        "background_image": IP_ADDRESS + (row["background_image"] or models.DEFAULT_BACKGROUND_IMAGE),
+        "description": row["description"],
+        "short_description": row["short_description"],
+        "follower_count": row["follower_count"] or 0,
+        "first_name": row["first_name"],
+        "last_name": row["last_name"],
+        "article_count": row["article_count"] or 0,
+        "skill_list": row["skill_list"],
+        "avg_rating_from_articles": models.average_rating(row["rated_article_rating_sum"], row["rated_article_count"])
+    }
+
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
@@ -56,14 +109,13 @@ def get_follows_by_follower_id(db: Session, follower_id: int):
     return db.query(models.Follower).filter(models.Follower.follower_id==follower_id).all()
 
 def get_follows_by_followed_id(db: Session, followed_id: int):
-    return db.query(models.Follower).filter(models.Follower.follower_id==followed_id).all()
+    return db.query(models.Follower).filter(models.Follower.followed_id==followed_id).all()
 
 def get_follows_amount(db: Session, followed_id: int):
     if not get_user(db, followed_id):
         return None
 
-    amount = len(get_follows_by_followed_id(db, followed_id))
-    return amount
+    return db.query(func.count(models.Follower.id)).filter(models.Follower.followed_id==followed_id).scalar()
 
 def get_follow_by_both_ids(db: Session, followed_user_id: int, follower_user_id: int):
     return db.query(models.Follower).filter(models.Follower.followed_id==followed_user_id).filter(models.Follower.follower_id==follower_user_id).first()
@@ -74,28 +126,65 @@ def create_follow(db: Session, followed_user_id: int, follower_user_id: int):
         follower_id=follower_user_id
     )
     db.add(db_follower)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Already followed, guarded by the unique (follower_id, followed_id) constraint
+        db.rollback()
+        return None
+    top_users_by_most_followers.invalidate()
     db.refresh(db_follower)
     return db_follower
 
+def remove_duplicate_follows(db: Session) -> int:
+    """
+    Deletes repeated (follower_id, followed_id) rows, keeping the oldest one of every pair,
+    so the unique constraint can be created. Counters have to be reconciled afterwards.
+
+    Returns how many rows were deleted.
+    """
+    Follower = models.Follower
+    kept = aliased(Follower)
+    result = db.execute(
+        delete(Follower)
+        .where(
+            Follower.follower_id == kept.follower_id,
+            Follower.followed_id == kept.followed_id,
+            Follower.id > kept.id,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
 def delete_follow(db: Session, follow_id: int):
     db.delete(get_follow(db, follow_id))
     db.commit()
+    top_users_by_most_followers.invalidate()
+
+def get_followers_query(user_id: int) -> Select:
+    """
+    Users following `user_id`, most recent follows first
+    """
+    return select(models.User)\
+        .join(models.Follower, models.Follower.follower_id == models.User.id)\
+        .where(models.Follower.followed_id == user_id)\
+        .order_by(models.Follower.created_at.desc(), models.Follower.id.desc())
+
+def get_following_query(user_id: int) -> Select:
+    """
+    Users followed by `user_id`, most recent follows first
+    """
+    return select(models.User)\
+        .join(models.Follower, models.Follower.followed_id == models.User.id)\
+        .where(models.Follower.follower_id == user_id)\
+        .order_by(models.Follower.created_at.desc(), models.Follower.id.desc())
 
 def get_followers_by_user_id(db: Session, user_id: int):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    if db_user:
-        return [follower.follower for follower in db_user.followers]
-    
-    return []
+    return db.scalars(get_followers_query(user_id)).all()
     
 def get_following_by_user_id(db: Session, user_id: int):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
-    
-    if db_user:
-        return [following.followed for following in db_user.following]
-    
-    return []
+    return db.scalars(get_following_query(user_id)).all()
 
 def create_skill(db: Session, skill_name: str):
     db_skill = models.Skill(
@@ -134,27 +223,68 @@ def delete_skill_list_element(db: Session, skill_list_element_id: int):
     db.commit()
 
 def get_user_skills(db: Session, user_id: int):
-    skills = db.query(models.SkillList).filter(models.SkillList.user_id==user_id).all()
-    skill_list: list[schemas.ReturnSkillListElement] = []
-    for skill in skills:
-        skill_list.append(schemas.ReturnSkillListElement(id=skill.id, skill_name=skill.skill.skill_name))
+    return get_users_skills(db, [user_id])[user_id]
+
+def get_users_skills(db: Session, user_ids: List[int]) -> dict[int, list[schemas.ReturnSkillListElement]]:
+    """
+    Skills of many users with one query, users without skills get an empty list
+    """
+    skills = {user_id: [] for user_id in user_ids}
+    if not skills:
+        return skills
+
+    rows = db.query(models.SkillList.user_id, models.SkillList.id, models.Skill.skill_name)\
+             .join(models.Skill, models.Skill.id == models.SkillList.skill_id)\
+             .filter(models.SkillList.user_id.in_(skills))\
+             .order_by(models.SkillList.id)\
+             .all()
+
+    for user_id, skill_list_id, skill_name in rows:
+        skills[user_id].append(schemas.ReturnSkillListElement(id=skill_list_id, skill_name=skill_name))
 
-    return skill_list
+    return skills
 
-def get_top_users_by_most_followers(db: Session):
+def attach_user_skills(db: Session, users: List[models.User]) -> List[models.User]:
+    """
+    Loads `skill_list` of a whole page of users at once, meant to be used as a pagination transformer
+    """
+    skills = get_users_skills(db, [user.id for user in users])
+    for user in users:
+        user.set_skill_list(skills[user.id])
+
+    return users
+
+def get_top_users_by_most_followers(db: Session, limit: int | None = None):
     query = db.query(models.User)\
-             .order_by(models.User.follower_count.desc())\
+             .order_by(models.User.follower_count.desc(), models.User.id)\
+             .limit(limit)\
              .all()
     return query
 
-def get_top_users_by_most_articles(db: Session):
-    from app.domain.article.models import Article
-    
+def get_top_users_by_most_articles(db: Session, limit: int | None = None):
     query = db.query(models.User)\
-             .order_by(models.User.article_count.desc())\
+             .order_by(models.User.article_count.desc(), models.User.id)\
+             .limit(limit)\
              .all()
     return query
 
+def build_leaderboard(db: Session, users: List[models.User]) -> List[schemas.UserPublic]:
+    return [
+        schemas.UserPublic.model_validate(user, from_attributes=True)
+        for user in attach_user_skills(db, users)
+    ]
+
+top_users_by_most_followers = SnapshotCache(
+    lambda db: build_leaderboard(db, get_top_users_by_most_followers(db, LEADERBOARD_SIZE)),
+    ttl=LEADERBOARD_TTL,
+    name="top_users_by_most_followers"
+)
+top_users_by_most_articles = SnapshotCache(
+    lambda db: build_leaderboard(db, get_top_users_by_most_articles(db, LEADERBOARD_SIZE)),
+    ttl=LEADERBOARD_TTL,
+    name="top_users_by_most_articles"
+)
+
 def search_users_by_first_name_and_last_name(
     db: Session,
     value: str,
@@ -3,7 +3,7 @@ from app.database import engine, SessionLocal
 from app.domain.article.views import TagView, ArticleView, ArticleCommentView, WishListView, ArticleContentElementView, CollectionView, CollectionArticleView, ArticlePurchaseView
 from app.domain.user.views import UserView, FollowerView, SkillView, SkillListView
 from app.domain.support.views import IssueView
-from app.domain.transaction.views import TransactionItemView, TransactionView
+from app.domain.transaction.views import TransactionItemView, TransactionView, PaymentNotificationView
 from sqladmin.authentication import AuthenticationBackend
 from starlette.requests import Request
 import os
@@ -46,6 +46,7 @@ def create_admin(app):
     admin.add_view(IssueView)
     admin.add_view(TransactionView)
     admin.add_view(TransactionItemView)
+    admin.add_view(PaymentNotificationView)
     admin.add_view(ArticlePurchaseView)
     
     return admin
@@ -0,0 +1,89 @@
+"""
+In-process caches for read-heavy, rarely changing results.
+"""
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.internal.metrics import CACHE_HITS, CACHE_MISSES
+from typing import Callable, Generic, TypeVar
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger("cache")
+
+T = TypeVar("T")
+
+
+class SnapshotCache(Generic[T]):
+    """
+    Keeps the last result of `loader` and serves it with stale-while-revalidate semantics.
+
+    The first read loads the snapshot with the caller's session. Later reads after `ttl`
+    seconds, or after `invalidate()`, still get the old snapshot while a background
+    thread builds a new one with its own session. With `ttl` 0 every read loads a new
+    snapshot, which keeps tests deterministic.
+
+    Reads are counted in `hits` and `misses` and exported as metrics labeled with `name`.
+    """
+
+    def __init__(self, loader: Callable[[Session], T], ttl: float, name: str = "snapshot"):
+        self.loader = loader
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+        self._value: T | None = None
+        self._loaded_at: float | None = None
+        self._stale = False
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> T:
+        if self._loaded_at is None or self.ttl <= 0:
+            self.misses += 1
+            CACHE_MISSES.labels(self.name).inc()
+            return self._store(self.loader(db))
+
+        self.hits += 1
+        CACHE_HITS.labels(self.name).inc()
+        value = self._value
+        if self._stale or time.monotonic() - self._loaded_at >= self.ttl:
+            self._revalidate()
+
+        return value
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._value = None
+            self._loaded_at = None
+            self._stale = False
+
+    def _store(self, value: T) -> T:
+        with self._lock:
+            self._value = value
+            self._loaded_at = time.monotonic()
+        return value
+
+    def _revalidate(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            self._stale = False
+
+        threading.Thread(target=self._refresh, daemon=True).start()
+
+    def _refresh(self) -> None:
+        try:
+            with SessionLocal() as db:
+                self._store(self.loader(db))
+        except Exception:
+            logger.exception("Refreshing cached snapshot failed")
+            self._stale = True
+        finally:
+            self._refreshing = False
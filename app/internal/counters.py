@@ -0,0 +1,97 @@
+"""
+Recomputes denormalized user and tag counters from the source tables and fixes the ones that drifted.
+
+    python -m app.internal.counters --batch-size 5000
+"""
+from sqlalchemy import select, update, func, or_, cast, Double
+from sqlalchemy.orm import Session
+from app.domain.article.models import Article, ArticleTag, Tag
+from app.domain.user.models import User, Follower
+import argparse
+import logging
+
+
+logger = logging.getLogger("counters")
+
+BATCH_SIZE = 1000
+
+
+def reconcile_user_counters(db: Session, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Fixes follower_count, following_count, article_count and the rated article aggregate
+    of users in id ranges of `batch_size`, one UPDATE and commit per range.
+
+    Returns how many users had drifted counters.
+    """
+    counters = {
+        User.follower_count: select(func.count(Follower.id)).where(Follower.followed_id == User.id),
+        User.following_count: select(func.count(Follower.id)).where(Follower.follower_id == User.id),
+        User.article_count: select(func.count(Article.id)).where(Article.author_id == User.id),
+        User.rated_article_count: select(func.count(Article.id)).where(Article.author_id == User.id, Article.rating != 0),
+        # summed in double precision, a sum of reals depends on the order rows are read in
+        User.rated_article_rating_sum: select(func.coalesce(func.sum(cast(Article.rating, Double)), 0))
+                                       .where(Article.author_id == User.id, Article.rating != 0),
+    }
+    counters = {column: query.scalar_subquery() for column, query in counters.items()}
+
+    last_id = db.scalar(select(func.max(User.id))) or 0
+    fixed = 0
+
+    for start in range(0, last_id + 1, batch_size):
+        result = db.execute(
+            update(User)
+            .where(
+                User.id >= start,
+                User.id < start + batch_size,
+                or_(*[column.is_distinct_from(value) for column, value in counters.items()])
+            )
+            .values(counters)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        fixed += result.rowcount
+
+    return fixed
+
+
+def reconcile_tag_counters(db: Session) -> int:
+    """
+    Fixes free_article_count and paid_article_count of all tags with one UPDATE.
+
+    Returns how many tags had drifted counters.
+    """
+    def tagged_articles(is_free: bool):
+        return (
+            select(func.count(ArticleTag.id))
+            .join(Article, Article.id == ArticleTag.article_id)
+            .where(ArticleTag.tag_value == Tag.value, func.coalesce(Article.is_free, True).is_(is_free))
+            .scalar_subquery()
+        )
+
+    counters = {
+        Tag.free_article_count: tagged_articles(True),
+        Tag.paid_article_count: tagged_articles(False),
+    }
+    result = db.execute(
+        update(Tag)
+        .where(or_(*[column.is_distinct_from(value) for column, value in counters.items()]))
+        .values(counters)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    with SessionLocal() as db:
+        logger.info("Fixed counters of %s users", reconcile_user_counters(db, args.batch_size))
+        logger.info("Fixed counters of %s tags", reconcile_tag_counters(db))
@@ -0,0 +1,110 @@
+"""
+Prometheus metrics of the application.
+
+Values are updated when things happen (requests, pool checkouts, cache reads), so a scrape
+only serializes them. With `PROMETHEUS_MULTIPROC_DIR` set, every worker process writes its
+values to that directory and `/metrics` aggregates all of them.
+"""
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+from sqlalchemy import event
+import os
+import time
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency", ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests being handled", ["method"], multiprocess_mode="livesum"
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Response body size", ["method", "route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576)
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements executed per request", ["route"],
+    buckets=(1, 2, 5, 10, 20, 50, 100)
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_duration_seconds", "Time spent executing SQL per request", ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+THREADPOOL_BUSY = Gauge(
+    "threadpool_busy_threads", "Worker threads running sync endpoints and dependencies", multiprocess_mode="livesum"
+)
+THREADPOOL_SIZE = Gauge(
+    "threadpool_size", "Worker threads available for sync endpoints and dependencies", multiprocess_mode="livesum"
+)
+
+POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connections checked out of the pool")
+POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections currently checked out", multiprocess_mode="livesum")
+POOL_OVERFLOW = Gauge("db_pool_overflow", "Connections opened over the pool size", multiprocess_mode="livesum")
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection",
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+
+CACHE_HITS = Counter("cache_hits_total", "Reads served from a cache", ["cache"])
+CACHE_MISSES = Counter("cache_misses_total", "Reads that had to load the value", ["cache"])
+
+
+def generate_metrics() -> bytes:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        return generate_latest(registry)
+
+    return generate_latest(REGISTRY)
+
+
+def observe_request(method: str, route: str, status: int, duration: float, size: int | None, query_stats) -> None:
+    REQUEST_LATENCY.labels(method, route, status).observe(duration)
+    if size is not None:
+        RESPONSE_SIZE.labels(method, route).observe(size)
+    if query_stats is not None:
+        REQUEST_QUERIES.labels(route).observe(query_stats.count)
+        REQUEST_DB_TIME.labels(route).observe(query_stats.duration)
+
+
+def observe_threadpool(limiter) -> None:
+    """
+    `limiter` is anyio's default thread limiter which Starlette uses to run sync code.
+    """
+    THREADPOOL_BUSY.set(limiter.borrowed_tokens)
+    THREADPOOL_SIZE.set(limiter.total_tokens)
+
+
+def pool_overflow(pool) -> int:
+    return max(pool.overflow(), 0) if hasattr(pool, "overflow") else 0
+
+
+def instrument_engine(engine) -> None:
+    """
+    Tracks checkouts of `engine`'s pool. The pool has no event fired before a checkout,
+    so the wait is timed around `Pool.connect`.
+    """
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+    pool.connect = timed_connect
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        POOL_CHECKOUTS.inc()
+        POOL_CHECKED_OUT.inc()
+        POOL_OVERFLOW.set(pool_overflow(pool))
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        POOL_CHECKED_OUT.dec()
+        POOL_OVERFLOW.set(pool_overflow(pool))
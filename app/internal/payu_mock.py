@@ -0,0 +1,155 @@
+"""
+Local stand-in for the PayU REST API, used by tests and load runs.
+
+Run it next to the backend and point the backend at it:
+
+    uvicorn app.internal.payu_mock:app --port 8010
+    PAYU_BASE_URL=http://127.0.0.1:8010 python server.py
+
+`PAYU_MOCK_LATENCY` (in milliseconds) delays every response to mimic the real service.
+"""
+from fastapi import FastAPI, Request, Response, HTTPException, Body, status
+from fastapi.responses import JSONResponse
+from typing import Annotated
+import asyncio
+import hashlib
+import httpx
+import json
+import os
+import uuid
+
+
+PAYU_MOCK_LATENCY = float(os.getenv("PAYU_MOCK_LATENCY", 0)) / 1000
+TOKEN_EXPIRES_IN = 43199
+
+app = FastAPI(title="PayU stand-in")
+
+app.state.tokens = set()
+app.state.orders = {}
+app.state.token_requests = 0
+
+
+def sign_notification(body: str, second_key: str) -> str:
+    """
+    Builds `OpenPayu-Signature` header the same way PayU does
+    """
+    signature = hashlib.md5((body + second_key).encode()).hexdigest()
+    return f"sender=checkout;signature={signature};algorithm=MD5;content=DOCUMENT"
+
+
+def notification_body(order: dict) -> str:
+    return json.dumps({
+        "order": {
+            "orderId": order["orderId"],
+            "extOrderId": order["extOrderId"],
+            "totalAmount": order["totalAmount"],
+            "currencyCode": order["currencyCode"],
+            "status": order["status"],
+        }
+    })
+
+
+@app.middleware("http")
+async def simulate_latency(request: Request, call_next):
+    if PAYU_MOCK_LATENCY:
+        await asyncio.sleep(PAYU_MOCK_LATENCY)
+    return await call_next(request)
+
+
+def check_token(request: Request) -> None:
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if token not in app.state.tokens:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+
+@app.post("/pl/standard/user/oauth/authorize")
+async def authorize():
+    app.state.token_requests += 1
+    token = str(uuid.uuid4())
+    app.state.tokens.add(token)
+
+    return {
+        "access_token": token,
+        "token_type": "bearer",
+        "expires_in": TOKEN_EXPIRES_IN,
+        "grant_type": "client_credentials",
+    }
+
+
+@app.post("/api/v2_1/orders")
+async def create_order(request: Request):
+    check_token(request)
+    payload = await request.json()
+
+    order_id = uuid.uuid4().hex[:20].upper()
+    app.state.orders[order_id] = {
+        "orderId": order_id,
+        "extOrderId": payload.get("extOrderId"),
+        "notifyUrl": payload.get("notifyUrl"),
+        "totalAmount": payload.get("totalAmount"),
+        "currencyCode": payload.get("currencyCode", "PLN"),
+        "description": payload.get("description"),
+        "products": payload.get("products", []),
+        "status": "NEW",
+    }
+
+    return JSONResponse(
+        status_code=status.HTTP_302_FOUND,
+        content={
+            "status": {"statusCode": "SUCCESS"},
+            "redirectUri": f"{request.base_url}pay/{order_id}",
+            "orderId": order_id,
+            "extOrderId": payload.get("extOrderId"),
+        },
+    )
+
+
+@app.get("/api/v2_1/orders/{order_id}")
+async def get_order(order_id: str, request: Request):
+    check_token(request)
+
+    if not (order := app.state.orders.get(order_id)):
+        return JSONResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            content={"status": {"statusCode": "DATA_NOT_FOUND"}},
+        )
+
+    return {
+        "orders": [{key: value for key, value in order.items() if key != "notifyUrl"}],
+        "status": {"statusCode": "SUCCESS"},
+    }
+
+
+@app.post("/mock/orders/{order_id}/status")
+async def change_order_status(
+    order_id: str,
+    order_status: Annotated[str, Body(embed=True, alias="status")],
+    notify: Annotated[bool, Body(embed=True)] = True,
+):
+    """
+    Moves the order to a new status, like a buyer paying or cancelling would.
+
+    Returns the notification that PayU would send, and sends it to `notifyUrl` when `notify` is set.
+    """
+    if not (order := app.state.orders.get(order_id)):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+
+    order["status"] = order_status
+    body = notification_body(order)
+    headers = {
+        "Content-Type": "application/json",
+        "OpenPayu-Signature": sign_notification(body, os.getenv("PAYU_SECOND_KEY", "")),
+    }
+
+    if notify and order["notifyUrl"]:
+        async with httpx.AsyncClient() as client:
+            await client.post(order["notifyUrl"], content=body, headers=headers)
+
+    return {"body": body, "headers": headers}
+
+
+@app.get("/pay/{order_id}")
+async def pay(order_id: str):
+    if order_id not in app.state.orders:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    return Response(content=f"PayU stand-in payment page for {order_id}", media_type="text/plain")
@@ -0,0 +1,55 @@
+"""
+Counts SQL statements and the time spent executing them, per request.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextvars import ContextVar
+import time
+
+
+class QueryStats:
+    """
+    Statement count and total database time (in seconds) of one unit of work.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries"'
+
+
+current_query_stats: ContextVar[QueryStats | None] = ContextVar("current_query_stats", default=None)
+
+
+def start_query_stats() -> QueryStats:
+    """
+    Starts collecting statements executed in the current context, e.g. a request.
+    Threads spawned from this context (like sync endpoints) report to the same object.
+    """
+    stats = QueryStats()
+    current_query_stats.set(stats)
+    return stats
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start_time"].pop()
+
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += duration
+
+
+@event.listens_for(Engine, "handle_error")
+def discard_query_timer(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start_time"):
+        connection.info["query_start_time"].pop()
@@ -0,0 +1,233 @@
+"""
+In-memory "more like this" index of articles.
+
+Every article is a row of two L2-normalized sparse matrices: TF-IDF of its title, summary and text
+content elements, and its tags. The similarity of two articles is a weighted sum of the cosine
+similarities of both rows, computed for all articles at once with sparse matrix products. The
+`limit` most similar articles of every article are kept, so a lookup doesn't compute anything.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from scipy import sparse
+import numpy as np
+import re
+import threading
+
+
+RELATED_ARTICLES_LIMIT = 20
+TAG_WEIGHT = 0.3  # the rest of the similarity comes from the text
+BUILD_CHUNK_CELLS = 2 ** 22  # similarities held at once when building (32 MB), bounds the memory of a full build
+
+TOKEN_PATTERN = re.compile(r"\w\w+")
+
+
+@dataclass
+class ArticleDocument:
+    id: int
+    text: str
+    tags: list[str] = field(default_factory=list)
+    version: datetime | None = None  # when the article content last changed
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def normalize_rows(matrix: sparse.csr_matrix) -> sparse.csr_matrix:
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
+
+
+def top_neighbours(ids: np.ndarray, scores: np.ndarray, exclude: int, limit: int) -> list[tuple[int, float]]:
+    """
+    `limit` (id, score) pairs with the highest positive scores, best first,
+    without `exclude` and removed articles (id -1)
+    """
+    candidates = np.flatnonzero((scores > 0) & (ids != exclude) & (ids >= 0))
+    if len(candidates) > limit:
+        candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+    candidates = candidates[np.lexsort((ids[candidates], -scores[candidates]))]
+    return [(int(ids[i]), float(scores[i])) for i in candidates]
+
+
+class RelatedArticlesIndex:
+    """
+    `build` indexes all articles and is meant to run in the background, `update` and `remove`
+    apply single article changes in between. Terms unknown at the last build are skipped by
+    `update` until the next one, and neighbour lists shortened by `remove` are refilled by it too.
+
+    The version of every indexed document is kept, so whoever maintains the index can look up
+    changes (and removals, given their time) newer than `watermark` and skip the ones already applied.
+    """
+
+    def __init__(self, limit: int = RELATED_ARTICLES_LIMIT, tag_weight: float = TAG_WEIGHT):
+        self.limit = limit
+        self.tag_weight = tag_weight
+        self.is_built = False
+        self.watermark: datetime | None = None
+
+        self._lock = threading.Lock()
+        self._vocabulary: dict[str, int] = {}
+        self._idf = np.zeros(0)
+        self._tag_columns: dict[str, int] = {}
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._rows: dict[int, int] = {}
+        self._text = sparse.csr_matrix((0, 0))
+        self._tags = sparse.csr_matrix((0, 0))
+        self._neighbours: dict[int, list[tuple[int, float]]] = {}
+        self._versions: dict[int, datetime | None] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def article_ids(self) -> set[int]:
+        return set(self._rows)
+
+    def version(self, article_id: int) -> datetime | None:
+        return self._versions.get(article_id)
+
+    def related(self, article_id: int, limit: int | None = None) -> list[int]:
+        return [neighbour_id for neighbour_id, _ in self._neighbours.get(article_id, [])[:limit]]
+
+    def scores(self, article_id: int) -> list[tuple[int, float]]:
+        return list(self._neighbours.get(article_id, []))
+
+    def build(self, documents: list[ArticleDocument]) -> None:
+        """
+        Replaces the index with one of `documents`
+        """
+        terms = [self._term_counts(document.text) for document in documents]
+
+        vocabulary = {}
+        for counts in terms:
+            for term in counts:
+                vocabulary.setdefault(term, len(vocabulary))
+        tag_columns = {}
+        for document in documents:
+            for tag in document.tags:
+                tag_columns.setdefault(tag, len(tag_columns))
+
+        text = self._count_matrix(terms, vocabulary)
+        document_frequency = np.bincount(text.indices, minlength=len(vocabulary))
+        # a term of a single article can't make it similar to another one
+        kept = np.flatnonzero(document_frequency >= 2)
+        text, document_frequency = text[:, kept], document_frequency[kept]
+        vocabulary = {term: column for column, term in enumerate(np.array(list(vocabulary), dtype=object)[kept])}
+        idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+        # sublinear term frequency, so repeating a word doesn't dominate the vector
+        text.data = 1 + np.log(text.data)
+        text = normalize_rows(text @ sparse.diags(idf))
+        tags = normalize_rows(self._count_matrix([dict.fromkeys(document.tags, 1) for document in documents], tag_columns))
+
+        ids = np.array([document.id for document in documents], dtype=np.int64)
+        neighbours = {int(article_id): [] for article_id in ids}
+        limit = min(self.limit, len(documents) - 1)
+        chunk_size = max(1, BUILD_CHUNK_CELLS // max(len(documents), 1))
+
+        for start in range(0, len(documents) if limit > 0 else 0, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            scores = self._similarity(text[chunk], tags[chunk], text, tags).toarray()
+            rows = np.arange(scores.shape[0])
+            scores[rows, rows + start] = 0
+
+            columns = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+            for row, row_columns in zip(rows, columns):
+                neighbours[int(ids[start + row])] = top_neighbours(ids[row_columns], scores[row, row_columns], -1, limit)
+
+        with self._lock:
+            self._vocabulary, self._idf, self._tag_columns = vocabulary, idf, tag_columns
+            self._ids, self._rows = ids, {int(article_id): row for row, article_id in enumerate(ids)}
+            self._text, self._tags = text, tags
+            self._neighbours = neighbours
+            self._versions = {document.id: document.version for document in documents}
+            self.watermark = max(filter(None, self._versions.values()), default=None)
+            self.is_built = True
+
+    def update(self, document: ArticleDocument) -> None:
+        """
+        Indexes a new or changed article and moves it into the neighbour lists it now belongs to
+        """
+        counts = self._term_counts(document.text)
+        text = self._count_matrix([counts], self._vocabulary)
+        text.data = 1 + np.log(text.data)
+        text = normalize_rows(text @ sparse.diags(self._idf))
+        tags = normalize_rows(self._count_matrix([dict.fromkeys(document.tags, 1)], self._tag_columns))
+
+        with self._lock:
+            self._remove(document.id)
+
+            scores = self._similarity(text, tags, self._text, self._tags).toarray().ravel()
+            self._neighbours[document.id] = top_neighbours(self._ids, scores, document.id, self.limit)
+
+            for row in np.flatnonzero((scores > 0) & (self._ids >= 0)):
+                self._add_neighbour(int(self._ids[row]), document.id, float(scores[row]))
+
+            self._rows[document.id] = len(self._ids)
+            self._ids = np.append(self._ids, document.id)
+            self._text = sparse.vstack([self._text, text], format="csr")
+            self._tags = sparse.vstack([self._tags, tags], format="csr")
+
+            self._versions[document.id] = document.version
+            self._advance_watermark(document.version)
+
+    def remove(self, article_id: int, version: datetime | None = None) -> None:
+        with self._lock:
+            self._remove(article_id)
+            self._advance_watermark(version)
+
+    def _advance_watermark(self, version: datetime | None) -> None:
+        if version is not None and (self.watermark is None or version > self.watermark):
+            self.watermark = version
+
+    def _remove(self, article_id: int) -> None:
+        row = self._rows.pop(article_id, None)
+        if row is None:
+            return
+
+        # only articles with a positive similarity can have it among their neighbours
+        scores = self._similarity(self._text[row], self._tags[row], self._text, self._tags).tocsr()
+        for neighbour_id in self._ids[scores.indices]:
+            neighbours = self._neighbours.get(int(neighbour_id))
+            if neighbours and any(entry[0] == article_id for entry in neighbours):
+                self._neighbours[int(neighbour_id)] = [entry for entry in neighbours if entry[0] != article_id]
+
+        # the row stays in the matrices until the next build, with an id no article has
+        self._ids[row] = -1
+        self._neighbours.pop(article_id, None)
+        self._versions.pop(article_id, None)
+
+    def _add_neighbour(self, article_id: int, neighbour_id: int, score: float) -> None:
+        neighbours = self._neighbours.get(article_id, [])
+        if len(neighbours) >= self.limit and score <= neighbours[-1][1]:
+            return
+        # lists are replaced instead of changed in place, lookups read them without the lock
+        self._neighbours[article_id] = sorted(
+            neighbours + [(neighbour_id, score)], key=lambda entry: (-entry[1], entry[0])
+        )[:self.limit]
+
+    def _similarity(self, text, tags, all_text, all_tags) -> sparse.csr_matrix:
+        return (1 - self.tag_weight) * (text @ all_text.T) + self.tag_weight * (tags @ all_tags.T)
+
+    @staticmethod
+    def _term_counts(text: str) -> dict[str, int]:
+        counts = {}
+        for term in tokenize(text):
+            counts[term] = counts.get(term, 0) + 1
+        return counts
+
+    @staticmethod
+    def _count_matrix(rows: list[dict[str, int]], columns: dict[str, int]) -> sparse.csr_matrix:
+        indptr, indices, data = [0], [], []
+        for counts in rows:
+            for key, count in counts.items():
+                column = columns.get(key)
+                if column is not None:
+                    indices.append(column)
+                    data.append(count)
+            indptr.append(len(indices))
+
+        return sparse.csr_matrix(
+            (np.array(data, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(rows), len(columns)),
+        )
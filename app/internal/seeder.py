@@ -0,0 +1,385 @@
+"""
+Fills an empty database with a large, deterministic dataset.
+
+    python -m app.internal.seeder --reset --users 1000000 --articles 2000000 --seed 7
+
+Rows are streamed to Postgres with COPY, so ORM listeners don't run. Article ratings, user
+counters and precomputed feeds are built afterwards with set-based SQL. Every user has the
+password `--password` and the email `user_email(id)`.
+"""
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.domain.model_base import Base
+from app.domain.user.models import DEFAULT_AVATAR, DEFAULT_BACKGROUND_IMAGE
+from app.domain.user.service import hash_password
+from app.internal.counters import reconcile_user_counters
+from app.config import IMAGE_URL, IP_ADDRESS
+# register every table, so drop_all and create_all see the whole schema
+from app.domain.article import models as article_models
+from app.domain.support import models as support_models
+from app.domain.transaction import models as transaction_models
+from array import array
+from typing import Iterable, Iterator
+import argparse
+import datetime
+import logging
+import random
+import uuid
+
+
+logger = logging.getLogger("seeder")
+
+COPY_CHUNK_SIZE = 1 << 16
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+TIME_SPAN = 365 * 24 * 60 * 60 # in seconds
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+    "et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip "
+    "ex ea commodo consequat duis aute irure in reprehenderit voluptate velit esse cillum fugiat nulla "
+    "pariatur excepteur sint occaecat cupidatat non proident sunt culpa qui officia deserunt mollit anim "
+    "id est laborum python database index query cache latency article author reader payment"
+).split()
+FIRST_NAMES = ["Adam", "Anna", "Jan", "Maria", "Piotr", "Katarzyna", "Tomasz", "Agnieszka", "Pawel", "Ewa"]
+LAST_NAMES = ["Nowak", "Kowalski", "Wisniewski", "Wojcik", "Kaminski", "Lewandowski", "Zielinski", "Szymanski"]
+CONTENT_TYPES = ["image", "title", "text", "listing"]
+DEFAULT_PASSWORD = "password"
+
+
+class RowStream:
+    """
+    File-like object for `copy_expert` that encodes rows into UTF-8 COPY text format lazily.
+    """
+
+    def __init__(self, rows: Iterable[tuple]):
+        self.lines = (encode_row(row).encode() for row in rows)
+        self.buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = [self.buffer]
+        length = len(self.buffer)
+
+        while size < 0 or length < size:
+            if (line := next(self.lines, None)) is None:
+                break
+            chunks.append(line)
+            length += len(line)
+
+        data = b"".join(chunks)
+        if size < 0:
+            self.buffer = b""
+            return data
+
+        self.buffer = data[size:]
+        return data[:size]
+
+
+def encode_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def encode_row(row: tuple) -> str:
+    return "\t".join(map(encode_value, row)) + "\n"
+
+
+def copy_rows(db: Session, table: str, columns: list[str], rows: Iterable[tuple]) -> None:
+    columns = ", ".join(f'"{column}"' for column in columns)
+    with db.connection().connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (ENCODING 'UTF8')", RowStream(rows), size=COPY_CHUNK_SIZE)
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=words)).capitalize()
+
+
+def timestamp(rng: random.Random) -> datetime.datetime:
+    return EPOCH + datetime.timedelta(seconds=rng.randrange(TIME_SPAN))
+
+
+def user_email(user_id: int) -> str:
+    return f"user{user_id}@example.com"
+
+
+class Seeder:
+    """
+    Generates every table from `seed`. Rows that depend on each other, like purchases,
+    comments and transactions of one user, are derived from the same per-user generator,
+    so each table is streamed on its own without keeping the others in memory.
+
+    The same methods describe a seeded dataset to its readers, e.g. benchmarks logging in
+    as seeded users, after `index_articles` (or `run`) filled in authors and prices.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        users: int = 1000,
+        articles: int = 5000,
+        follows: int = 20,
+        purchases: int = 10,
+        comment_ratio: float = 0.3,
+        content_elements: int = 10,
+    ):
+        self.seed = seed
+        self.users = users
+        self.articles = articles
+        self.follows = min(follows, users - 1)
+        self.purchases = purchases
+        self.comment_ratio = comment_ratio
+        self.content_elements = content_elements
+
+        self.authors = array("i")
+        self.prices = array("d")
+
+    def rng(self, name: str, key: int = 0) -> random.Random:
+        return random.Random(f"{self.seed}:{name}:{key}")
+
+    def user_rows(self, hashed_password: str) -> Iterator[tuple]:
+        rng = self.rng("users")
+        for user_id in range(1, self.users + 1):
+            yield (
+                user_id, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), user_email(user_id),
+                rng.choice(["Male", "Female"]), DEFAULT_AVATAR, DEFAULT_BACKGROUND_IMAGE,
+                sentence(rng, 30), sentence(rng, 8), True, 0, 0, 0, 0, 0, hashed_password,
+            )
+
+    def article_rows(self) -> Iterator[tuple]:
+        rng = self.rng("articles")
+        for article_id in range(1, self.articles + 1):
+            author_id = rng.randint(1, self.users)
+            is_free = rng.random() < 0.3
+            price = 0.0 if is_free else float(rng.randint(1, 99))
+            self.authors.append(author_id)
+            self.prices.append(price)
+
+            title = sentence(rng, rng.randint(3, 10))
+            created_at = timestamp(rng)
+            yield (
+                article_id, title, f"{title.lower().replace(' ', '-')}-{article_id}", sentence(rng, 40),
+                author_id, created_at, created_at, rng.randint(0, 10000), IMAGE_URL + "default_article_title_img.jpg",
+                is_free, price, 0.0, 0,
+            )
+
+    def index_articles(self) -> None:
+        """
+        Generates articles without writing them, so the methods depending on their authors and prices work
+        """
+        if len(self.authors) < self.articles:
+            self.authors, self.prices = array("i"), array("d")
+            for _ in self.article_rows():
+                pass
+
+    def content_element_rows(self) -> Iterator[tuple]:
+        rng = self.rng("content_elements")
+        for article_id in range(1, self.articles + 1):
+            for order in range(1, rng.randint(1, self.content_elements) + 1):
+                content_type = rng.choice(CONTENT_TYPES)
+                if content_type == "image":
+                    content = IP_ADDRESS + IMAGE_URL + "default_article_img.jpg"
+                elif content_type == "title":
+                    content = sentence(rng, 6)
+                else:
+                    content = sentence(rng, rng.randint(20, 120))
+                yield article_id, content_type, content, order
+
+    def followed_users(self, user_id: int) -> list[int]:
+        rng = self.rng("follows", user_id)
+        followed = rng.sample(range(1, self.users), min(rng.randint(0, 2 * self.follows), self.users - 1))
+        # shift ids from user_id up by one, so nobody follows themselves
+        return [followed_id + (followed_id >= user_id) for followed_id in followed]
+
+    def follower_rows(self) -> Iterator[tuple]:
+        for user_id in range(1, self.users + 1):
+            rng = self.rng("follow_times", user_id)
+            for followed_id in self.followed_users(user_id):
+                yield followed_id, user_id, timestamp(rng)
+
+    def purchased_articles(self, user_id: int) -> list[int]:
+        rng = self.rng("purchases", user_id)
+        count = min(rng.randint(0, 2 * self.purchases), self.articles)
+        return [
+            article_id for article_id in rng.sample(range(1, self.articles + 1), count)
+            if self.authors[article_id - 1] != user_id
+        ]
+
+    def purchasable_articles(self, user_id: int, limit: int = 20) -> list[int]:
+        """
+        Up to `limit` paid articles the user neither wrote nor bought, from a per-user starting point
+        """
+        purchased = set(self.purchased_articles(user_id))
+        start = self.rng("purchasable", user_id).randrange(self.articles)
+        article_ids = []
+
+        for offset in range(self.articles):
+            article_id = 1 + (start + offset) % self.articles
+            if self.prices[article_id - 1] > 0 and self.authors[article_id - 1] != user_id and article_id not in purchased:
+                article_ids.append(article_id)
+                if len(article_ids) == limit:
+                    break
+
+        return article_ids
+
+    def purchase_rows(self) -> Iterator[tuple]:
+        for user_id in range(1, self.users + 1):
+            for article_id in self.purchased_articles(user_id):
+                yield user_id, article_id
+
+    def commented_articles(self, user_id: int) -> list[int]:
+        rng = self.rng("comments", user_id)
+        return [article_id for article_id in self.purchased_articles(user_id) if rng.random() < self.comment_ratio]
+
+    def comment_rows(self) -> Iterator[tuple]:
+        for user_id in range(1, self.users + 1):
+            rng = self.rng("comment_contents", user_id)
+            for article_id in self.commented_articles(user_id):
+                yield user_id, article_id, sentence(rng, rng.randint(5, 60)), timestamp(rng), rng.randint(1, 5)
+
+    def transactions(self) -> Iterator[tuple[str, int, datetime.datetime, list[int]]]:
+        """
+        Completed transactions of 1-3 purchased articles each.
+        """
+        for user_id in range(1, self.users + 1):
+            rng = self.rng("transactions", user_id)
+            article_ids = self.purchased_articles(user_id)
+            while article_ids:
+                size = rng.randint(1, 3)
+                items, article_ids = article_ids[:size], article_ids[size:]
+                yield str(uuid.UUID(int=rng.getrandbits(128), version=4)), user_id, timestamp(rng), items
+
+    def transaction_rows(self) -> Iterator[tuple]:
+        for transaction_id, user_id, created_at, items in self.transactions():
+            total_price = sum(self.prices[article_id - 1] for article_id in items)
+            yield transaction_id, user_id, "COMPLETED", created_at, None, total_price
+
+    def transaction_item_rows(self) -> Iterator[tuple]:
+        for transaction_id, _, _, items in self.transactions():
+            for article_id in items:
+                yield transaction_id, article_id, self.prices[article_id - 1] == 0
+
+    def run(self, db: Session, password: str) -> None:
+        tables = [
+            ("users", [
+                "id", "first_name", "last_name", "email", "sex", "avatar", "background_image", "description",
+                "short_description", "is_active", "follower_count", "following_count", "article_count",
+                "rated_article_count", "rated_article_rating_sum", "hashed_password",
+            ], lambda: self.user_rows(hash_password(password))),
+            ("articles", [
+                "id", "title", "slug", "summary", "author_id", "created_at", "content_updated_at", "view_count", "title_image",
+                "is_free", "price", "rating", "rating_count",
+            ], self.article_rows),
+            ("article_content_elements", ["article_id", "content_type", "content", "order"], self.content_element_rows),
+            ("followers", ["followed_id", "follower_id", "created_at"], self.follower_rows),
+            ("article_purchase", ["user_id", "article_id"], self.purchase_rows),
+            ("article_comment", ["author_id", "article_id", "content", "created_at", "rating"], self.comment_rows),
+            ("transactions", ["id", "user_id", "status", "created_at", "payu_order_id", "total_price"], self.transaction_rows),
+            ("transaction_items", ["transaction_id", "article_id", "paid_out"], self.transaction_item_rows),
+        ]
+
+        for table, columns, rows in tables:
+            logger.info("Copying %s", table)
+            copy_rows(db, table, columns, rows())
+
+        logger.info("Updating ratings and counters")
+        for statement in [
+            """
+            UPDATE articles
+            SET rating = ratings.rating, rating_count = ratings.rating_count
+            FROM (
+                SELECT article_id, avg(rating) AS rating, count(*) AS rating_count
+                FROM article_comment
+                GROUP BY article_id
+            ) AS ratings
+            WHERE articles.id = ratings.article_id
+            """,
+            "SELECT setval(pg_get_serial_sequence('users', 'id'), greatest(max(id), 1)) FROM users",
+            "SELECT setval(pg_get_serial_sequence('articles', 'id'), greatest(max(id), 1)) FROM articles",
+        ]:
+            db.execute(text(statement))
+        db.commit()
+
+        reconcile_user_counters(db, batch_size=10000)
+
+        # readers over the fan-out threshold read precomputed timelines, which ORM listeners would have filled
+        logger.info("Filling feeds")
+        db.execute(text("""
+            INSERT INTO feed_entries (user_id, article_id, author_id, created_at)
+            SELECT user_id, article_id, author_id, created_at
+            FROM (
+                SELECT
+                    followers.follower_id AS user_id, articles.id AS article_id, articles.author_id, articles.created_at,
+                    row_number() OVER (
+                        PARTITION BY followers.follower_id ORDER BY articles.created_at DESC, articles.id DESC
+                    ) AS position
+                FROM users
+                JOIN followers ON followers.follower_id = users.id
+                JOIN articles ON articles.author_id = followers.followed_id
+                WHERE users.following_count >= :threshold
+            ) AS timelines
+            WHERE position <= :size
+        """), {"threshold": article_models.FEED_FANOUT_THRESHOLD, "size": article_models.FEED_TIMELINE_SIZE})
+        db.commit()
+
+        db.execute(text("ANALYZE"))
+        db.commit()
+
+
+def seed_database(
+    db: Session,
+    seed: int = 0,
+    users: int = 1000,
+    articles: int = 5000,
+    follows: int = 20,
+    purchases: int = 10,
+    comment_ratio: float = 0.3,
+    content_elements: int = 10,
+    password: str = DEFAULT_PASSWORD,
+    reset: bool = False,
+) -> None:
+    """
+    Seeds the database. The tables have to be empty, unless `reset` recreates them first.
+    """
+    if reset:
+        Base.metadata.drop_all(bind=db.connection())
+    Base.metadata.create_all(bind=db.connection())
+    db.commit()
+
+    if db.execute(text("SELECT EXISTS (SELECT 1 FROM users)")).scalar():
+        raise ValueError("The database already has users, seed it with reset=True")
+
+    Seeder(seed, users, articles, follows, purchases, comment_ratio, content_elements).run(db, password)
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--articles", type=int, default=5000)
+    parser.add_argument("--follows", type=int, default=20, help="average follows per user")
+    parser.add_argument("--purchases", type=int, default=10, help="average purchases per user")
+    parser.add_argument("--comment-ratio", type=float, default=0.3, help="share of purchases that get a comment")
+    parser.add_argument("--content-elements", type=int, default=10, help="maximum content elements per article")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    parser.add_argument("--reset", action="store_true", help="drop and recreate all tables first")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    with SessionLocal() as db:
+        seed_database(
+            db, args.seed, args.users, args.articles, args.follows, args.purchases,
+            args.comment_ratio, args.content_elements, args.password, args.reset
+        )
@@ -0,0 +1,144 @@
+"""
+Trending articles from exponentially decayed view, wish list and purchase counters.
+
+A signal of weight `w` at time `t` is stored as `w * exp(decay * (t - reference))`. Adding one
+is O(1), and decaying every counter to "now" multiplies them by the same factor, so it never
+changes their order: the top articles are kept in a heap without rescoring anything.
+"""
+import heapq
+import math
+import threading
+import time
+
+
+SIGNAL_WEIGHTS = {"view": 1.0, "wishlist": 3.0, "purchase": 5.0}
+TRENDING_HALF_LIFE = 24 * 60 * 60  # in seconds
+TRENDING_SIZE = 100
+MIN_TRENDING_SCORE = 0.01  # decayed scores below are forgotten when persisting
+MAX_EXPONENT = 50.0  # stored values are rebased before exp() gets close to overflowing
+
+
+class TrendingArticles:
+    """
+    Decayed scores of articles, the `size` best of them in a heap.
+
+    Added signals are also kept as pending deltas, `pop_pending` hands them over for persisting
+    (`restore_pending` takes them back if that fails) and `load` replaces the scores with the persisted ones (plus deltas added in the meantime),
+    so processes sharing a database see each other's signals after every persist.
+    """
+
+    def __init__(self, half_life: float = TRENDING_HALF_LIFE, size: int = TRENDING_SIZE, clock=time.time):
+        self.decay = math.log(2) / half_life
+        self.size = size
+        self.clock = clock
+        self.is_loaded = False
+
+        self._lock = threading.Lock()
+        self._reference = clock()
+        self._scores: dict[int, float] = {}
+        self._pending: dict[int, float] = {}
+        self._top: dict[int, float] = {}
+        self._heap: list[tuple[float, int]] = []
+
+    def add(self, article_id: int, signal: str, count: int = 1, at: float | None = None) -> None:
+        at = self.clock() if at is None else at
+        with self._lock:
+            if self.decay * (at - self._reference) > MAX_EXPONENT:
+                self._rebase(at)
+            value = SIGNAL_WEIGHTS[signal] * count * math.exp(self.decay * (at - self._reference))
+            self._pending[article_id] = self._pending.get(article_id, 0.0) + value
+            self._set(article_id, self._scores.get(article_id, 0.0) + value)
+
+    def remove(self, article_id: int) -> None:
+        with self._lock:
+            self._scores.pop(article_id, None)
+            self._pending.pop(article_id, None)
+            if self._top.pop(article_id, None) is not None:
+                self._rebuild_top()
+
+    def score(self, article_id: int) -> float:
+        return self._decayed(self._scores.get(article_id, 0.0), self.clock())
+
+    def top(self, limit: int | None = None) -> list[tuple[int, float]]:
+        """
+        (article id, decayed score) of the best articles, best first
+        """
+        now = self.clock()
+        with self._lock:
+            entries = sorted(self._top.items(), key=lambda entry: (-entry[1], entry[0]))[:limit]
+        return [(article_id, self._decayed(value, now)) for article_id, value in entries]
+
+    def pop_pending(self, now: float | None = None) -> dict[int, float]:
+        """
+        Deltas added since the last call, decayed to `now`
+        """
+        now = self.clock() if now is None else now
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return {article_id: self._decayed(value, now) for article_id, value in pending.items()}
+
+    def restore_pending(self, deltas: dict[int, float], now: float) -> None:
+        """
+        Gives back deltas of `pop_pending(now)` that couldn't be persisted, they are already in the scores
+        """
+        with self._lock:
+            for article_id, value in deltas.items():
+                value = value * math.exp(self.decay * (now - self._reference))
+                self._pending[article_id] = self._pending.get(article_id, 0.0) + value
+
+    def load(self, scores: dict[int, float], now: float | None = None) -> None:
+        """
+        Replaces all scores with `scores` decayed to `now`, keeping deltas that weren't popped yet
+        """
+        now = self.clock() if now is None else now
+        with self._lock:
+            self._rebase(now)
+            self._scores = dict(scores)
+            for article_id, value in self._pending.items():
+                self._scores[article_id] = self._scores.get(article_id, 0.0) + value
+            self._rebuild_top()
+            self.is_loaded = True
+
+    def _decayed(self, value: float, now: float) -> float:
+        return value * math.exp(-self.decay * (now - self._reference))
+
+    def _rebase(self, now: float) -> None:
+        factor = math.exp(-self.decay * (now - self._reference))
+        self._scores = {article_id: value * factor for article_id, value in self._scores.items()}
+        self._pending = {article_id: value * factor for article_id, value in self._pending.items()}
+        self._reference = now
+        self._rebuild_top()
+
+    def _set(self, article_id: int, value: float) -> None:
+        self._scores[article_id] = value
+        if article_id not in self._top and len(self._top) >= self.size and value <= self._minimum():
+            return
+
+        # replaced heap entries stay in it, entries that don't match `_top` are skipped
+        self._top[article_id] = value
+        heapq.heappush(self._heap, (value, article_id))
+        if len(self._top) > self.size:
+            self._top.pop(self._pop_minimum())
+        if len(self._heap) > 4 * self.size:
+            self._heap = [(value, article_id) for article_id, value in self._top.items()]
+            heapq.heapify(self._heap)
+
+    def _minimum(self) -> float:
+        self._drop_stale()
+        return self._heap[0][0]
+
+    def _pop_minimum(self) -> int:
+        self._drop_stale()
+        return heapq.heappop(self._heap)[1]
+
+    def _drop_stale(self) -> None:
+        while self._top.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _rebuild_top(self) -> None:
+        self._top = dict(heapq.nlargest(self.size, self._scores.items(), key=lambda entry: entry[1]))
+        self._heap = [(value, article_id) for article_id, value in self._top.items()]
+        heapq.heapify(self._heap)
+
+
+trending_articles = TrendingArticles()
@@ -0,0 +1,190 @@
+"""
+Background jobs started from the application lifespan.
+"""
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.domain.transaction.payu import PayUClient, PayUUnavailableError, payu_client
+from app.domain.transaction.service import apply_payment_notifications, get_pending_transactions, update_transaction_statuses
+from app.domain.article.service import refresh_related_articles, persist_trending_scores
+from datetime import datetime, timedelta, timezone
+import asyncio
+import httpx
+import logging
+import os
+import time
+
+
+logger = logging.getLogger("workers")
+
+PAYMENT_NOTIFICATION_INTERVAL = float(os.getenv("PAYMENT_NOTIFICATION_INTERVAL", 1))  # in seconds
+PAYMENT_NOTIFICATION_BATCH_SIZE = 500
+
+RECONCILIATION_INTERVAL = float(os.getenv("RECONCILIATION_INTERVAL", 300))  # in seconds
+RECONCILE_AFTER = timedelta(minutes=15)  # pending transactions younger than this are left to notifications
+EXPIRE_AFTER = timedelta(days=1)  # orders never paid for are expired after this
+RECONCILIATION_BATCH_SIZE = 100
+RECONCILIATION_CONCURRENCY = 10
+
+RELATED_ARTICLES_INTERVAL = float(os.getenv("RELATED_ARTICLES_INTERVAL", 5))  # in seconds
+RELATED_ARTICLES_REBUILD_INTERVAL = float(os.getenv("RELATED_ARTICLES_REBUILD_INTERVAL", 3600))  # in seconds
+
+TRENDING_PERSIST_INTERVAL = float(os.getenv("TRENDING_PERSIST_INTERVAL", 30))  # in seconds
+
+ORDER_NOT_FOUND = ""
+
+
+def process_payment_notifications(batch_size: int = PAYMENT_NOTIFICATION_BATCH_SIZE) -> int:
+    with SessionLocal() as db:
+        return apply_payment_notifications(db, batch_size)
+
+
+async def payment_notification_worker(interval: float = PAYMENT_NOTIFICATION_INTERVAL) -> None:
+    """
+    Drains the notification inbox, full batches are followed by the next one right away
+    """
+    while True:
+        try:
+            processed = await asyncio.to_thread(process_payment_notifications)
+        except Exception:
+            logger.exception("Applying payment notifications failed")
+            processed = 0
+
+        if processed < PAYMENT_NOTIFICATION_BATCH_SIZE:
+            await asyncio.sleep(interval)
+
+
+async def fetch_order_status(payu: PayUClient, semaphore: asyncio.Semaphore, payu_order_id: str | None) -> str | None:
+    """
+    Status of the order in PayU, `ORDER_NOT_FOUND` if PayU does not know it and None if it could not be checked
+    """
+    if payu_order_id is None:
+        return ORDER_NOT_FOUND
+
+    async with semaphore:
+        try:
+            response = await payu.get_order(payu_order_id)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                return ORDER_NOT_FOUND
+            logger.warning("PayU returned %s for order %s", e.response.status_code, payu_order_id)
+            return None
+        except (PayUUnavailableError, httpx.TransportError):
+            return None
+
+    orders = response.get("orders") or []
+    return orders[0].get("status") if orders else ORDER_NOT_FOUND
+
+
+async def reconcile_pending_transactions(
+    db: Session,
+    payu: PayUClient,
+    reconcile_after: timedelta = RECONCILE_AFTER,
+    expire_after: timedelta = EXPIRE_AFTER,
+    batch_size: int = RECONCILIATION_BATCH_SIZE,
+    concurrency: int = RECONCILIATION_CONCURRENCY,
+) -> int:
+    """
+    Asks PayU about transactions that stayed pending for longer than `reconcile_after`
+    and applies their statuses batch by batch, returns how many transactions changed.
+
+    Orders PayU never saw or that are still NEW after `expire_after` are EXPIRED.
+    """
+    now = datetime.now(timezone.utc)
+    semaphore = asyncio.Semaphore(concurrency)
+    after = None
+    changed = 0
+
+    while True:
+        batch = [
+            (transaction.id, transaction.payu_order_id, transaction.status, transaction.created_at)
+            for transaction in await asyncio.to_thread(
+                get_pending_transactions, db, now - reconcile_after, after, batch_size
+            )
+        ]
+        if not batch:
+            return changed
+
+        remote_statuses = await asyncio.gather(*[
+            fetch_order_status(payu, semaphore, payu_order_id) for _, payu_order_id, _, _ in batch
+        ])
+
+        statuses = {}
+        for (transaction_id, _, current_status, created_at), remote_status in zip(batch, remote_statuses):
+            if remote_status in (ORDER_NOT_FOUND, "NEW"):
+                if created_at < now - expire_after:
+                    statuses[transaction_id] = "EXPIRED"
+            elif remote_status is not None and remote_status != current_status:
+                statuses[transaction_id] = remote_status
+
+        changed += await asyncio.to_thread(update_transaction_statuses, db, statuses)
+        after = batch[-1][3], batch[-1][0]
+
+
+async def payment_reconciliation_worker(interval: float = RECONCILIATION_INTERVAL) -> None:
+    while True:
+        try:
+            with SessionLocal() as db:
+                changed = await reconcile_pending_transactions(db, payu_client)
+            if changed:
+                logger.info("Reconciled %s transactions with PayU", changed)
+        except Exception:
+            logger.exception("Reconciling transactions with PayU failed")
+
+        await asyncio.sleep(interval)
+
+
+def process_related_articles(rebuild: bool) -> None:
+    with SessionLocal() as db:
+        refresh_related_articles(db, rebuild)
+
+
+async def related_articles_worker(
+    interval: float = RELATED_ARTICLES_INTERVAL,
+    rebuild_interval: float = RELATED_ARTICLES_REBUILD_INTERVAL
+) -> None:
+    """
+    Builds the related articles index, applies articles changed or deleted in the database since
+    the last poll, and rebuilds it every `rebuild_interval` seconds to refresh term weights and drop removed rows
+    """
+    built_at = None
+    while True:
+        rebuild = built_at is None or time.monotonic() - built_at >= rebuild_interval
+        try:
+            await asyncio.to_thread(process_related_articles, rebuild)
+            if rebuild:
+                built_at = time.monotonic()
+        except Exception:
+            logger.exception("Refreshing related articles failed")
+
+        await asyncio.sleep(interval)
+
+
+def process_trending_scores() -> None:
+    with SessionLocal() as db:
+        persist_trending_scores(db)
+
+
+async def trending_worker(interval: float = TRENDING_PERSIST_INTERVAL) -> None:
+    """
+    Persists trending signals of this process and loads the ones of the others,
+    once more when cancelled so signals of the last interval aren't lost on shutdown
+    """
+    try:
+        while True:
+            try:
+                await asyncio.to_thread(process_trending_scores)
+            except Exception:
+                logger.exception("Persisting trending scores failed")
+
+            await asyncio.sleep(interval)
+    finally:
+        try:
+            await asyncio.to_thread(process_trending_scores)
+        except Exception:
+            logger.exception("Persisting trending scores failed")
+
+
+async def cancel_workers(tasks: list[asyncio.Task]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -6,18 +6,27 @@ from starlette.middleware.base import BaseHTTPMiddleware
 
 from pydantic import BaseModel
 from app.database import engine, SessionLocal
-from app.config import CORS_ORIGINS, SECRET_KEY, ENCRYPTION_ALGORITHM, IS_PRODUCTION
+from app.config import CORS_ORIGINS, SECRET_KEY, ENCRYPTION_ALGORITHM, IS_PRODUCTION, METRICS_TOKEN
 from app.domain.model_base import Base
-from app.routers import oauth2, user, article, develop, router, support, transactions
+from app.routers import oauth2, user, article, develop, router, support, transactions, metrics
 from app.internal.admin import create_admin
+from app.domain.user.service import remove_duplicate_follows
+from app.internal.counters import reconcile_user_counters
+from app.domain.transaction.payu import payu_client, PAYU_SECOND_KEY
+from app.internal.workers import payment_notification_worker, payment_reconciliation_worker, related_articles_worker, trending_worker, cancel_workers
+from app.internal.query_stats import start_query_stats
+from app.internal.metrics import REQUESTS_IN_PROGRESS, instrument_engine, observe_request, observe_threadpool
 from fastapi_pagination import add_pagination
 from fastapi_pagination.utils import disable_installed_extensions_check
 from sqlalchemy import text
 from contextlib import asynccontextmanager
 from alembic.config import Config as AlembicConfig
 from alembic import command
+from anyio import to_thread
+import asyncio
 import logging
 import os
+import time
 from sqlalchemy.orm import configure_mappers
 configure_mappers()
 
@@ -38,6 +47,7 @@ class RemoveServerHeaderMiddleware(BaseHTTPMiddleware):
     
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("alembic.auto_migrate")
+query_logger = logging.getLogger("query_stats")
 
 # Functions
 def check_for_changes(alembic_cfg):
@@ -75,23 +85,44 @@ def apply_migrations(alembic_cfg):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if not PAYU_SECOND_KEY:
+        raise RuntimeError("PAYU_SECOND_KEY is not set, payment notifications can't be verified")
+
     alembic_cfg = AlembicConfig("alembic.ini")
 
     logger.info("Checking for database changes...")
     if check_for_changes(alembic_cfg):
+        # a failing constraint would skip the whole migration, duplicate follows are removed first
+        # (the counters they inflated are reconciled below)
+        with SessionLocal() as db:
+            if removed := remove_duplicate_follows(db):
+                logger.info("Removed %s duplicate follows", removed)
+
         logger.info("Applying migrations...")
         apply_migrations(alembic_cfg)
 
         with SessionLocal() as db:
             db.execute(text("DROP TABLE IF EXISTS alembic_version;"))
             db.commit()
+            # fills counter columns added by the migration and fixes drifted ones, in batches
+            reconcile_user_counters(db)
             try:
                 os.remove("app/alembic/versions/temp_rev_id_temporary_migration.py")
             except Exception as e:
                 print(e)
     
+    workers = [
+        asyncio.create_task(payment_notification_worker()),
+        asyncio.create_task(payment_reconciliation_worker()),
+        asyncio.create_task(related_articles_worker()),
+        asyncio.create_task(trending_worker()),
+    ]
+
     yield
 
+    await cancel_workers(workers)
+    await payu_client.close()
+
 
 
 def create_db() -> None:
@@ -149,6 +180,10 @@ def get_application() -> FastAPI:
     fapp.include_router(article.router)
     fapp.include_router(support.router)
     
+    # metrics describe routes, traffic and the database pool, in production only scrapers with the token see them
+    if not IS_PRODUCTION or METRICS_TOKEN:
+        fapp.include_router(metrics.router)
+
     if not IS_PRODUCTION:
         fapp.include_router(develop.router)
     
@@ -160,6 +195,8 @@ def get_application() -> FastAPI:
 
 app = get_application()
 
+instrument_engine(engine)
+
 admin = create_admin(app)
 
 app.mount("/media/uploads/user", staticfiles.StaticFiles(directory="app/media/uploads/user"), name="user_uploads")
@@ -179,3 +216,35 @@ async def db_session_middleware(request: Request, call_next):
     finally:
         request.state.db.close()
     return response
+
+
+@app.middleware("http")
+async def instrumentation_middleware(request: Request, call_next):
+    '''
+    Records request metrics and counts SQL statements executed while handling the request.
+    Outside of production the statement count and time are returned in the Server-Timing header.
+    '''
+    stats = start_query_stats()
+    status_code = 500
+    size = None
+    start = time.perf_counter()
+
+    REQUESTS_IN_PROGRESS.labels(request.method).inc()
+    observe_threadpool(to_thread.current_default_thread_limiter())
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        size = int(response.headers["content-length"]) if "content-length" in response.headers else None
+    finally:
+        REQUESTS_IN_PROGRESS.labels(request.method).dec()
+        route = request.scope.get("route")
+        observe_request(
+            request.method, route.path if route else "unmatched", status_code,
+            time.perf_counter() - start, size, stats
+        )
+
+    query_logger.debug("%s %s: %s queries in %.1f ms", request.method, request.url.path, stats.count, stats.duration * 1000)
+    if not IS_PRODUCTION:
+        response.headers.append("Server-Timing", stats.server_timing())
+
+    return response
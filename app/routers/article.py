@@ -6,6 +6,8 @@ from app.dependencies import send_email, get_db, DefaultResponseModel, authentic
 from typing import Annotated, Union, Literal, Optional
 from fastapi_pagination import Page, paginate
 from app.config import IMAGE_DIR, IP_ADDRESS, IMAGE_URL
+from app.internal.related import RELATED_ARTICLES_LIMIT
+from app.internal.trending import TRENDING_SIZE
 from uuid import uuid4
 import json
 from pydantic import ValidationError
@@ -491,6 +493,23 @@ async def get_articles(sort_order: Union[None, Literal['asc', 'desc']] = None, d
     db_articles = service.get_articles(db=db, sort_order=sort_order)
     return paginate(db_articles)
 
+@router.get('/feed', status_code=status.HTTP_200_OK)
+async def get_feed(
+    user_id: Annotated[int, Depends(authenticate)],
+    db: Annotated[Session, Depends(get_db)],
+    cursor: Optional[str] = None,
+    size: Annotated[int, Query(ge=1, le=100)] = 20,
+) -> schemas.ArticleFeed:
+    """
+    Newest articles of followed authors. Pass `next_cursor` of a page as `cursor` to get the next one.
+    """
+    articles, next_cursor = service.get_feed(db=db, user_id=user_id, cursor=cursor, size=size)
+
+    return {
+        "items": articles,
+        "next_cursor": next_cursor
+    }
+
 @router.get('/search', status_code=status.HTTP_200_OK)
 async def search_article_by_title_and_summary(
     value: str = "",
@@ -505,11 +524,13 @@ async def search_article_by_title_and_summary(
     is_free: Optional[bool] = None,
     sort_order: Literal['asc', 'desc'] = 'desc',
     sort_by: Literal['views', 'date', 'price', 'rating'] = 'date',
+    facets: bool = False,
     db: Session = Depends(get_db)
-) -> Page[schemas.ResponseArticle]:
-    
-    db_articles = service.search_articles(
-        db=db,
+) -> schemas.ArticleSearchPage:
+    """
+    With `facets=true` the page also has counts of all matching articles per tag, is_free, price and rating range.
+    """
+    filters = dict(
         value=value,
         tags=tags,
         author_id=author_id,
@@ -520,11 +541,35 @@ async def search_article_by_title_and_summary(
         min_rating=min_rating,
         max_rating=max_rating,
         is_free=is_free,
-        sort_order=sort_order,
-        sort_by=sort_by
     )
-    
-    return paginate(db_articles)
+    db_articles = service.search_articles(db=db, **filters, sort_order=sort_order, sort_by=sort_by)
+
+    page = paginate(db_articles)
+    if facets:
+        page.facets = schemas.SearchFacets.model_validate(service.search_facets(db=db, **filters))
+
+    return page
+
+@router.get('/trending', status_code=status.HTTP_200_OK)
+async def get_trending_articles(
+    db: Annotated[Session, Depends(get_db)],
+    limit: Annotated[int, Query(ge=1, le=TRENDING_SIZE)] = 20,
+) -> list[schemas.TrendingArticle]:
+    """
+    Articles with the most views, wish list additions and purchases lately, older signals count less.
+    """
+    return service.get_trending_articles(db=db, limit=limit)
+
+@router.get('/tags', status_code=status.HTTP_200_OK)
+async def get_tags(
+    db: Annotated[Session, Depends(get_db)],
+    prefix: str = "",
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+) -> list[schemas.TagCount]:
+    """
+    Most popular tags with their article counts. With `prefix`, only tags starting with it (case insensitive).
+    """
+    return service.tag_index.get(db).search(prefix=prefix, limit=limit)
 
 @router.get(
     '/detail/id/{article_id}', 
@@ -1757,9 +1802,7 @@ def buy_collection_by_id(collection_id: int, user_id: Annotated[int, Depends(aut
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Nie możesz kupić własnej paczki."
         )
-    for article in db_collection.articles:
-        if not service.has_user_purchased_article(db=db, user_id=user_id, article_id=article.id):
-            service.add_purchased_article(db=db, user_id=user_id, article_id=article.id)
+    service.add_purchased_articles(db=db, user_id=user_id, article_ids=db_collection.articles_id)
     
     return {"detail": "Paczka z artykułami została pomyślnie zakupiona."} 
 
@@ -1780,4 +1823,36 @@ async def send_email_with_assessment_information(
     
     return {
         "message": "Email wysłany"
-    }
\ No newline at end of file
+    }
+
+@router.get(
+    '/{article_id}/related',
+    status_code=status.HTTP_200_OK,
+    responses=Responses(
+        CreateExampleResponse(
+            code=status.HTTP_404_NOT_FOUND,
+            description="Not Found",
+            content_type='application/json',
+            examples=[
+                Example(
+                    name="ArticleNotFound",
+                    summary="Article not found",
+                    description="The article with the given ID does not exist.",
+                    value=DefaultErrorModel(detail="Artykuł nie istnieje.")
+                ),
+            ]
+        )
+    )
+)
+async def get_related_articles(
+    article_id: int,
+    db: Annotated[Session, Depends(get_db)],
+    limit: Annotated[int, Query(ge=1, le=RELATED_ARTICLES_LIMIT)] = 10,
+) -> list[schemas.ResponseArticle]:
+    """
+    Articles most similar to the given one by their text and tags, most similar first.
+    """
+    if service.get_article_by_id(db=db, article_id=article_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Artykuł nie istnieje.")
+
+    return service.get_related_articles(db=db, article_id=article_id, limit=limit)
@@ -1,7 +1,7 @@
 from fastapi import FastAPI, HTTPException, Depends, APIRouter, Query
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from app.database import engine, SessionLocal
+from app.database import engine, SessionLocal, truncate_tables
 from app.domain.model_base import Base
 from sqlalchemy import MetaData, text
 from faker import Faker
@@ -10,7 +10,7 @@ from app.domain.user.service import hash_password
 from app.domain.user.models import User
 from app.domain.article.models import Article, ArticleContentElement, ArticleComment, Tag, generate_slug, unique_slug
 
-from app.domain.article.service import get_or_create
+from app.domain.article.service import get_or_create_tags
 from typing import List
 import re
 import random
@@ -31,6 +31,7 @@ def seed_data(
     db: Session = Depends(get_db)
 ):
     fake = Faker()  
+    hashed_password = hash_password('password')
     try:
         # Add sample users
         users = [
@@ -38,7 +39,7 @@ def seed_data(
                 first_name=fake.first_name(),
                 last_name=fake.last_name(),
                 email=fake.email(),
-                hashed_password=hash_password('password'),
+                hashed_password=hashed_password,
                 sex=fake.random_element(['Male', 'Female']),
                 short_description=fake.sentence(),
                 is_active=True
@@ -48,7 +49,7 @@ def seed_data(
         db.add_all(users)
         db.commit()
         
-        tags = [get_or_create(db, Tag, value=fake.word()) for _ in range(10)]
+        tags = get_or_create_tags(db, [fake.unique.word() for _ in range(10)])
         users_to_article: List[User] = users
         
         content_types = ['image', 'title', 'text', 'listing']
@@ -133,19 +134,8 @@ def clear_data(db: Session = Depends(get_db)):
         metadata = MetaData()
         metadata.reflect(bind=engine)
         
-        with engine.connect() as conn:
-            # Disable foreign key checks if necessary (depends on your DBMS)
-            # conn.execute("SET FOREIGN_KEY_CHECKS = 0")
-            
-            # Delete all rows from tables in reverse order to handle foreign key constraints
-            for table in reversed(metadata.sorted_tables):
-                conn.execute(table.delete())
-            
-            # Commit the transaction
-            conn.commit()
-            
-            # Enable foreign key checks if you disabled them
-            # conn.execute("SET FOREIGN_KEY_CHECKS = 1")
+        with engine.begin() as conn:
+            truncate_tables(conn, metadata.sorted_tables)
         
         return {"message": "All data cleared successfully"}
     
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from prometheus_client import CONTENT_TYPE_LATEST
+from app.config import METRICS_TOKEN
+from app.internal.metrics import generate_metrics
+from typing import Annotated
+import hmac
+
+
+def check_metrics_token(authorization: Annotated[str | None, Header()] = None) -> None:
+    if METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Niepoprawny token.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"],
+    dependencies=[Depends(check_metrics_token)],
+)
+
+
+@router.get("", include_in_schema=False)
+def get_metrics() -> Response:
+    return Response(generate_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -1,16 +1,18 @@
 import datetime
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Body
 from fastapi_pagination import Page, paginate
+from fastapi_pagination.ext.sqlalchemy import paginate as sql_paginate
 from sqlalchemy.orm import Session
-from app.domain.article.service import get_article_by_id
+from app.domain.article.service import get_articles_for_purchase
 from app.domain.support import service, schemas, models
 from app.dependencies import get_db, authenticate, DefaultErrorModel, DefaultResponseModel, Responses, CreateExampleResponse, Example
 from typing import Annotated, Union, Literal, Optional
 from pydantic import BaseModel, EmailStr
 from app.domain.transaction.schemas import Transaction, TransactionCreate, TransactionItemCreate
-from app.domain.transaction.service import create_transaction, create_transaction_item, get_transaction, get_transaction_items_by_transaction_id, get_user_transactions_service
-import os
+from app.domain.transaction.service import create_transaction_with_items, get_transaction, get_user_transactions_query, add_payment_notification
+from app.domain.transaction.payu import PayUClient, PayUUnavailableError, get_payu_client, verify_notification_signature, PAYU_NOTIFY_URL
 import httpx
+import json
 import uuid
 
 from app.domain.user.schemas import User
@@ -27,30 +29,17 @@ class PayUOrderCreate(BaseModel):
     redirect_url: str = "http://127.0.0.1:8000/docs"
 
 
-async def get_access_token():
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{PAYU_BASE_URL}/pl/standard/user/oauth/authorize",
-            data={"grant_type": "client_credentials"},
-            auth=(os.getenv("PAYU_CLIENT_ID"), os.getenv("PAYU_CLIENT_SECRET")),
-        )
-        response.raise_for_status()
-        return response.json()["access_token"]
-
-PAYU_BASE_URL = "https://secure.snd.payu.com" if os.getenv("PAYU_ENV") == "sandbox" else "https://secure.payu.com"
-    
 async def create_test_payu_order(
+    payu: PayUClient,
     amount: int, 
     buyer_email: str, 
     redirect_url: str,
     user_id: int = 1
 ):
     order_id = str(uuid.uuid4())
-    token = await get_access_token()
     payload = {
-        "notifyUrl": "http://readit.ddns.net:8000/transactions/notify",
+        "notifyUrl": PAYU_NOTIFY_URL,
         "customerIp": "127.0.0.1",
-        "merchantPosId": os.getenv("PAYU_POS_ID"),
         "description": "Order description",
         "currencyCode": "PLN",
         "totalAmount": str(amount),
@@ -70,32 +59,20 @@ async def create_test_payu_order(
         ]
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{PAYU_BASE_URL}/api/v2_1/orders",
-            json=payload,
-            headers={"Authorization": f"Bearer {token}"}
-        )
-
-        # Optional: manually handle 302
-        if response.status_code in [200, 201, 302]:
-            return response.json()
-        
-        response.raise_for_status()
+    return await payu.create_order(payload)
 
 
 async def create_payu_order(
+    payu: PayUClient,
     products: list[dict],
     user: User,
     redirect_url: str,
     order_id: str,
     total_price: int
 ):
-    token = await get_access_token()
     payload = {
-        "notifyUrl": "http://readit.ddns.net:8000/transactions/notify",
+        "notifyUrl": PAYU_NOTIFY_URL,
         "customerIp": "127.0.0.1",
-        "merchantPosId": os.getenv("PAYU_POS_ID"),
         "description": f"Purchase by {user.first_name} {user.last_name} of {len(products)} articles.",
         "currencyCode": "PLN",
         "totalAmount": str(total_price),
@@ -109,18 +86,7 @@ async def create_payu_order(
         "products": products
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{PAYU_BASE_URL}/api/v2_1/orders",
-            json=payload,
-            headers={"Authorization": f"Bearer {token}"}
-        )
-
-        # Optional: manually handle 302
-        if response.status_code in [200, 201, 302]:
-            return response.json()
-        
-        response.raise_for_status()
+    return await payu.create_order(payload)
     
 
 
@@ -129,19 +95,34 @@ async def payment_notify(
     request: Request,
     db: Session = Depends(get_db)
 ):
-    body = await request.json()
-    # print("Payment notification:", body)
-    # print(body.get("order").get("extOrderId"))
-    # print(body.get("order").get("status"))
+    """
+    PayU webhook, notifications are only stored here and applied to transactions by a background worker
+    """
+    body = await request.body()
 
-    if not (order := get_transaction(db, body.get("order").get("extOrderId"))):
-        return {"status": "OK"}
-    
+    if not verify_notification_signature(body, request.headers.get("OpenPayu-Signature")):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Nieprawidłowy podpis powiadomienia'
+        )
 
-    order.status = body.get("order").get("status")
-    db.commit()
+    try:
+        order = json.loads(body)["order"]
+        order_id, order_status = order["extOrderId"], order["status"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Nieprawidłowe powiadomienie'
+        )
+
+    add_payment_notification(
+        db,
+        order_id=order_id,
+        payu_order_id=order.get("orderId"),
+        status=order_status,
+        payload=body.decode()
+    )
 
-    # Verify signature if needed and update order status
     return {"status": "OK"}
 
 
@@ -152,10 +133,12 @@ async def payment_notify(
     deprecated=True
 )
 async def create_test_order(
-    order: PayUOrderCreate
+    order: PayUOrderCreate,
+    payu: PayUClient = Depends(get_payu_client)
 ):
     try:
         result = await create_test_payu_order(
+            payu,
             order.amount,
             order.buyer_email, 
             order.redirect_url
@@ -174,6 +157,11 @@ async def create_test_order(
             status_code=e.response.status_code,
             detail=f"PayU Error: {e.response.text}"
         )
+    except (PayUUnavailableError, httpx.TransportError):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Płatności są chwilowo niedostępne"
+        )
     
 class CreateOrderResponse(BaseModel):   
     status: str
@@ -190,7 +178,8 @@ async def create_order(
     redirect_url: Annotated[str, Body()],
     user_id: Annotated[int, Depends(authenticate)],
     discounted_price: Annotated[float | None, Body()] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    payu: PayUClient = Depends(get_payu_client)
 ) -> CreateOrderResponse:
     try:
         if not (user := get_user(db, user_id)):
@@ -199,7 +188,39 @@ async def create_order(
                 detail='Użytkownik nie istnieje'
             )
         
-        articles = [get_article_by_id(db, item) for item in items]
+        article_ids = list(dict.fromkeys(items))
+
+        if not article_ids:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Zamówienie nie zawiera artykułów'
+            )
+
+        articles = []
+        found_ids = set()
+
+        for article, is_bought in get_articles_for_purchase(db, user_id, article_ids):
+            found_ids.add(article.id)
+
+            if article.author_id == user_id:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail='Nie możesz kupić własnego artykułu.'
+                )
+
+            if is_bought:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail='Już zakupiłeś ten artykuł.'
+                )
+
+            articles.append(article)
+
+        if missing_ids := [article_id for article_id in article_ids if article_id not in found_ids]:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f'Nie znaleziono artykułów: {", ".join(map(str, missing_ids))}'
+            )
 
         order_id = uuid.uuid4().__str__()
 
@@ -210,6 +231,7 @@ async def create_order(
         
         if total_price > 0:
             result = await create_payu_order(
+                payu=payu,
                 user=user,
                 products=[{
                     "name": article.title,
@@ -225,23 +247,24 @@ async def create_order(
             redirect_uri = result.get("redirectUri")
 
         # print(result.get("orderId"))
-        transaction = create_transaction(db, TransactionCreate(
-            id=order_id,
-            user_id=user_id,
-            status="WAITING_FOR_PAYMENT" if total_price > 0 else "COMPLETED",
-            payu_order_id=result.get("orderId") if total_price > 0 else None,
-            created_at=datetime.datetime.now(),
-            total_price=discounted_price if discounted_price else (float(total_price) / 100) 
-        ))
-
-        for article in articles:
-            create_transaction_item(db, TransactionItemCreate(
-                transaction_id=transaction.id,
-                article_id=article.id,
-                paid_out=True if article.is_free else False
-            ))
-
-        db.commit()
+        create_transaction_with_items(
+            db,
+            TransactionCreate(
+                id=order_id,
+                user_id=user_id,
+                status="WAITING_FOR_PAYMENT" if total_price > 0 else "COMPLETED",
+                payu_order_id=result.get("orderId") if total_price > 0 else None,
+                created_at=datetime.datetime.now(),
+                total_price=discounted_price if discounted_price else (float(total_price) / 100) 
+            ),
+            [
+                TransactionItemCreate(
+                    transaction_id=order_id,
+                    article_id=article.id,
+                    paid_out=True if article.is_free else False
+                ) for article in articles
+            ]
+        )
 
         return {
             "status": "success",
@@ -255,6 +278,11 @@ async def create_order(
             status_code=e.response.status_code,
             detail=f"PayU Error: {e.response.text}"
         )
+    except (PayUUnavailableError, httpx.TransportError):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Płatności są chwilowo niedostępne"
+        )
     
 
 class StatusResponse(BaseModel):
@@ -311,26 +339,22 @@ async def get_user_transactions(
             detail='Użytkownik nie istnieje'
         )
 
-    transactions = get_user_transactions_service(db, user_id)
-
-    output = []
-    for transaction in transactions:
-        t_items = get_transaction_items_by_transaction_id(db, transaction.id)
-        items = []
-        for item in t_items:
-            article = item.article
-            items.append(TransactionItemSummary(
-                id=item.id,
-                title=article.title,
-                price=article.price
-            ))
-
-        output.append(UserTransaction(
-            id=transaction.id,
-            status=transaction.status,
-            created_at=transaction.created_at,
-            total_price=transaction.total_price,
-            items=items
-        ))
-
-    return paginate(output[::-1])
\ No newline at end of file
+    return sql_paginate(
+        db,
+        get_user_transactions_query(user_id),
+        transformer=lambda transactions: [
+            UserTransaction(
+                id=transaction.id,
+                status=transaction.status,
+                created_at=transaction.created_at,
+                total_price=transaction.total_price,
+                items=[
+                    TransactionItemSummary(
+                        id=item.id,
+                        title=item.article.title,
+                        price=item.article.price
+                    ) for item in transaction.items
+                ]
+            ) for transaction in transactions
+        ]
+    )
@@ -4,10 +4,11 @@ from sqlalchemy.orm import Session
 from app.dependencies import send_email, get_db, DefaultResponseModel, authenticate, Responses, Example, CreateExampleResponse, CreateAuthResponses
 from app.config import SECRET_KEY, ENCRYPTION_ALGORITHM, IP_ADDRESS, IMAGE_DIR, IMAGE_URL, FRONTEND_URL
 from app.domain.user.service import ( create_user, hash_password, 
-    get_user_by_email, get_user, create_follow, get_user_skills,
+    get_user_by_email, get_user, get_user_profile, create_follow,
     get_follow_by_both_ids, delete_follow, get_follows_amount, verify_password,
     get_skill_by_skill_name, create_skill, create_skill_list_element,
-    delete_skill_list_element, get_top_users_by_most_articles, get_top_users_by_most_followers, search_users_by_first_name_and_last_name, get_followers_by_user_id as get_followers_by_id, get_following_by_user_id 
+    delete_skill_list_element, top_users_by_most_articles, top_users_by_most_followers, search_users_by_first_name_and_last_name, get_followers_query, get_following_query,
+    attach_user_skills
 )
 from app.domain.article.service import (
     get_articles_by_user_id
@@ -19,6 +20,7 @@ from uuid import uuid4
 import jwt
 import re
 from fastapi_pagination import Page, paginate
+from fastapi_pagination.ext.sqlalchemy import paginate as sql_paginate
 
 router = APIRouter(
     prefix="/user",
@@ -168,27 +170,13 @@ async def get_user_by_access_token(
     db: Session = Depends(get_db)
 ) -> UserProfile:
     
-    if not (user := get_user(db, user_id)):
+    if not (profile := get_user_profile(db, user_id)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail='Nieprawidłowe dane'
         )
  
-    return {
-        "id": user.id,
-        "email": user.email,
-        "sex": user.sex,
-        "avatar": IP_ADDRESS + user.avatar,
-        "background_image": IP_ADDRESS + user.background_image,
-        "description": user.description,
-        "short_description": user.short_description,
-        "follower_count": user.follower_count,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "article_count": len(user.articles),
-        "skill_list": get_user_skills(db, user_id),
-        "avg_rating_from_articles": user.avg_rating_from_articles
-    }
+    return profile
 
 class UserProfileById(BaseModel):
     id: int
@@ -210,33 +198,13 @@ async def get_user_by_user_id(
     user_id: Annotated[int, Path(title="User id")],
     db: Session = Depends(get_db)
 ) -> UserProfileById:
-    if not (user := get_user(db, user_id)):
+    if not (profile := get_user_profile(db, user_id)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail='Nieprawidłowe dane'
         )
 
-    output = {
-        "id": user.id,
-        "email": user.email,
-        "sex": user.sex,
-        "avatar": IP_ADDRESS + user.avatar,
-        "background_image": IP_ADDRESS + user.background_image,
-        "description": user.description,
-        "short_description": user.short_description,
-        "follower_count": user.follower_count,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "article_count": len(user.articles),
-        "skill_list": get_user_skills(db, user_id),
-        "avg_rating_from_articles": user.avg_rating_from_articles
-    }
-
-    # if (articles := get_articles_by_user_id(db, user.id)):
-    #     output.update({"articles": []})
-    #     print(articles)
-
-    return output
+    return profile
 
 @router.get("/get/articles/{user_id}", status_code=status.HTTP_200_OK)
 async def get_user_by_user_id(
@@ -268,15 +236,7 @@ async def get_followers_by_user_id(
             detail='Nieprawidłowe dane'
         )
 
-    output = [
-        get_user(db, follow.follower_id) for follow in user.followers
-    ]
-
-    # if (articles := get_articles_by_user_id(db, user.id)):
-    #     output.update({"articles": []})
-    #     print(articles)
-
-    return paginate(output)
+    return sql_paginate(db, get_followers_query(user_id), transformer=lambda users: attach_user_skills(db, users))
 
 @router.get("/get/followed_users/{user_id}", status_code=status.HTTP_200_OK)
 async def get_followed_users_by_user_id(
@@ -289,15 +249,7 @@ async def get_followed_users_by_user_id(
             detail='Nieprawidłowe dane'
         )
 
-    output = [
-        get_user(db, follow.followed_id) for follow in user.following
-    ]
-
-    # if (articles := get_articles_by_user_id(db, user.id)):
-    #     output.update({"articles": []})
-    #     print(articles)
-
-    return paginate(output)
+    return sql_paginate(db, get_following_query(user_id), transformer=lambda users: attach_user_skills(db, users))
 
 class PasswordChangeModel(BaseModel):
     old_password: str
@@ -341,22 +293,7 @@ async def modify_user(
     db.commit()
     
 
-    return {
-        "id": user.id,
-        "email": user.email,
-        "sex": user.sex,
-        "avatar": IP_ADDRESS + user.avatar,
-        "background_image": IP_ADDRESS + user.background_image,
-        "description": user.description,
-        "short_description": user.short_description,
-        "follower_count": user.follower_count,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "article_count": len(user.articles),
-        "skill_list": get_user_skills(db, user_id),
-        "avg_rating_from_articles": user.avg_rating_from_articles
-
-    }
+    return get_user_profile(db, user_id)
 
 @router.patch("/modify/password", status_code=status.HTTP_200_OK)
 async def modify_password(
@@ -413,21 +350,7 @@ async def modify_avatar(
     user.avatar = f"{IMAGE_URL}{file.filename}"
     db.commit()
 
-    return {
-        "id": user.id,
-        "email": user.email,
-        "sex": user.sex,
-        "avatar": IP_ADDRESS + user.avatar,
-        "background_image": IP_ADDRESS + user.background_image,
-        "description": user.description,
-        "short_description": user.short_description,
-        "follower_count": user.follower_count,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "article_count": len(user.articles),
-        "skill_list": get_user_skills(db, user_id),
-        "avg_rating_from_articles": user.avg_rating_from_articles,
-    }
+    return get_user_profile(db, user_id)
 
 @router.patch("/modify/background-image", status_code=status.HTTP_200_OK)
 async def modify_background_image(
@@ -458,21 +381,7 @@ async def modify_background_image(
     db.commit()
     
 
-    return {
-        "id": user.id,
-        "email": user.email,
-        "sex": user.sex,
-        "avatar": IP_ADDRESS + user.avatar,
-        "background_image": IP_ADDRESS + user.background_image,
-        "description": user.description,
-        "short_description": user.short_description,
-        "follower_count": user.follower_count,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "article_count": len(user.articles),
-        "skill_list": get_user_skills(db, user_id),
-        "avg_rating_from_articles": user.avg_rating_from_articles
-    }
+    return get_user_profile(db, user_id)
 
 class CreateSkillModel(BaseModel):
     skill_name: str
@@ -496,21 +405,7 @@ async def add_skill(
     create_skill_list_element(db, user_id, skill.id)
     
 
-    return {
-        "id": user.id,
-        "email": user.email,
-        "sex": user.sex,
-        "avatar": IP_ADDRESS + user.avatar,
-        "background_image": IP_ADDRESS + user.background_image,
-        "description": user.description,
-        "short_description": user.short_description,
-        "follower_count": user.follower_count,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "article_count": len(user.articles),
-        "skill_list": get_user_skills(db, user_id),
-        "avg_rating_from_articles": user.avg_rating_from_articles
-    }
+    return get_user_profile(db, user_id)
 
 @router.delete("/skill/{skill_id}", status_code=status.HTTP_200_OK)
 async def remove_skill(
@@ -527,32 +422,15 @@ async def remove_skill(
     
     delete_skill_list_element(db, skill_id)
 
-    return {
-        "id": user.id,
-        "email": user.email,
-        "sex": user.sex,
-        "avatar": IP_ADDRESS + user.avatar,
-        "background_image": IP_ADDRESS + user.background_image,
-        "description": user.description,
-        "short_description": user.short_description,
-        "follower_count": user.follower_count,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "article_count": len(user.articles),
-        "skill_list": get_user_skills(db, user_id),
-        "avg_rating_from_articles": user.avg_rating_from_articles
-    }
+    return get_user_profile(db, user_id)
 
 @router.get("/articles/top", status_code=status.HTTP_200_OK)
 async def get_users_with_most_articles(db: Session = Depends(get_db)) -> Page[UserPublic]:
-    top_users = get_top_users_by_most_articles(db=db)
-    return paginate(top_users)
+    return paginate(top_users_by_most_articles.get(db))
 
 @router.get("/followers/top", status_code=status.HTTP_200_OK)
 async def get_users_with_most_followers(db: Session = Depends(get_db)) -> Page[UserPublic]:
-    top_users = get_top_users_by_most_followers(db=db)
-    
-    return paginate(top_users)
+    return paginate(top_users_by_most_followers.get(db))
 
 @router.post("/follow/{followed_id}", status_code=status.HTTP_201_CREATED)
 async def follow_user(
@@ -567,12 +445,6 @@ async def follow_user(
             detail='Obserwowany użytkownik nie istnieje'
         )
     
-    if get_follow_by_both_ids(db, followed_id, user_id):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail='Użytkownik jest już obserwowany'
-        )
-    
     if user_id == followed_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -582,7 +454,7 @@ async def follow_user(
     if not (follow := create_follow(db, followed_id, user_id)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail='Niepoprawne dane'
+            detail='Użytkownik jest już obserwowany'
         )
     
     return {
@@ -679,17 +551,14 @@ async def get_followers_amount(
     status_code=status.HTTP_200_OK
 )
 async def get_followers_following_me(user_id: Annotated[int, Depends(authenticate)], db: Session = Depends(get_db)) -> Page[UserPublic]:
-    db_followers =  get_followers_by_id(db=db, user_id=user_id)
-    return paginate(db_followers)
+    return sql_paginate(db, get_followers_query(user_id), transformer=lambda users: attach_user_skills(db, users))
 
 @router.get(
     '/followers/followed_by/me',
     status_code=status.HTTP_200_OK
 )
 async def get_followers_followed_by_me(user_id: Annotated[int, Depends(authenticate)], db: Session = Depends(get_db)) -> Page[UserPublic]:
-    db_followers =  get_following_by_user_id(db=db, user_id=user_id)
-    
-    return paginate(db_followers) 
+    return sql_paginate(db, get_following_query(user_id), transformer=lambda users: attach_user_skills(db, users))
     
 @router.get('/search', status_code=status.HTTP_200_OK)
 async def search_user_by_first_and_last_name(
@@ -712,4 +581,4 @@ async def search_user_by_first_and_last_name(
         sex=sex
     )
 
-    return paginate(users)
+    return paginate(users, transformer=lambda users: attach_user_skills(db, users))
@@ -1,8 +1,20 @@
+import os
+
+# notifications are rejected without a second key, tests sign them with this one
+os.environ.setdefault("PAYU_SECOND_KEY", "test second key")
+
+# every pytest-xdist worker runs against its own copy of the template database,
+# DATABASE_URL has to point at it before app.config is imported
+if os.environ.get("PYTEST_XDIST_WORKER"):
+    from .databases import create_worker_database
+    os.environ["DATABASE_URL"] = create_worker_database(os.environ["DATABASE_URL"], os.environ["PYTEST_XDIST_WORKER"])
+
 from fastapi import status
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text, Engine, Connection
 from sqlalchemy.orm import sessionmaker, Session
 from app.main import app
+from app.database import truncate_tables
 from app.domain.user.service import get_user_by_email, hash_password
 from app.domain.model_base import Base 
 from app.domain.user.models import User
@@ -14,7 +26,8 @@ import pytest
 import json
 import datetime
 import jwt
-from .utils import add_example_article
+from .utils import add_example_article, forbid_lazy_loads, TEST_PASSWORD_HASH
+from .databases import create_template_database
 connection_engine = None
 
 while connection_engine is None:
@@ -32,16 +45,78 @@ engine = connection_engine
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def pytest_configure(config: pytest.Config) -> None:
+    # the xdist controller prepares the schema once, workers copy it in create_worker_database
+    if not hasattr(config, "workerinput") and config.getoption("numprocesses", None):
+        create_template_database(DATABASE_URL, Base.metadata)
+
+
+@pytest.fixture(autouse=True)
+def lazy_load_mode():
+    """
+    With RAISE_ON_LAZY_LOAD set, every test fails on accidental lazy loads.
+    """
+    if os.environ.get("RAISE_ON_LAZY_LOAD"):
+        with forbid_lazy_loads():
+            yield
+    else:
+        yield
+
+@pytest.fixture(scope="session")
+def database() -> Generator[Engine, None, None]:
+    """
+    Creates the schema once for the whole run. Databases of xdist workers already have it.
+    """
+    if not os.environ.get("PYTEST_XDIST_WORKER"):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+
+    yield engine
+
+@pytest.fixture(scope="session")
+def restart_sequences(database: Engine) -> str:
+    with database.connect() as connection:
+        sequences = connection.execute(text("SELECT sequence_name FROM information_schema.sequences")).scalars()
+        return "".join(f'ALTER SEQUENCE "{sequence}" RESTART;' for sequence in sequences)
+
 @pytest.fixture
-def session() -> Generator[Session, None, None]:
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
-    
+def connection(database: Engine, restart_sequences: str) -> Generator[Connection, None, None]:
+    """
+    Connection in a transaction that is rolled back after the test.
+    """
+    with database.connect() as connection:
+        transaction = connection.begin()
+        # tests refer to rows by ids, so every test starts counting from 1
+        connection.exec_driver_sql(restart_sequences)
+        try:
+            yield connection
+        finally:
+            if transaction.is_active:
+                transaction.rollback()
+
+@pytest.fixture
+def session(connection: Connection) -> Generator[Session, None, None]:
+    # commit() and rollback() of the test and of the app only release or roll back
+    # a SAVEPOINT, the outer transaction of `connection` undoes everything at the end
+    db = TestingSessionLocal(bind=connection, join_transaction_mode="create_savepoint")
+    try:
+        yield db
+    finally:
+        db.close()
+
+@pytest.fixture
+def committed_session(database: Engine) -> Generator[Session, None, None]:
+    """
+    Session that really commits, for tests whose data has to be seen by other connections.
+    All tables are truncated afterwards.
+    """
     db = TestingSessionLocal()
     try:
         yield db
     finally:
         db.close()
+        with database.begin() as connection:
+            truncate_tables(connection, Base.metadata.sorted_tables)
 
 @pytest.fixture
 def client(session: Session) -> Generator[TestClient, None, None]:
@@ -53,14 +128,16 @@ def client(session: Session) -> Generator[TestClient, None, None]:
                 session.close()
         
         app.dependency_overrides[get_db] = override_get_db
-        
-        yield c
+        try:
+            yield c
+        finally:
+            app.dependency_overrides.pop(get_db, None)
 
 @pytest.fixture
 def create_user(session: Session) -> dict:
     user_data = {
         'email': 'adam@adam.pl',
-        'hashed_password': hash_password('PasswordExample'),
+        'hashed_password': TEST_PASSWORD_HASH,
         'first_name': 'adam',
         'last_name': 'adam',
         'sex': 'adam',
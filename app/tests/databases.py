@@ -0,0 +1,64 @@
+"""
+Per-worker databases for running the suite with pytest-xdist (`pytest -n auto`).
+
+The controller creates `<database>_template` with the whole schema once. Every worker gets
+its own `<database>_<worker id>` copied from it, so workers never see each other's data.
+"""
+from sqlalchemy import create_engine, text, MetaData
+from sqlalchemy.engine import make_url
+import time
+
+
+CREATE_DATABASE_ATTEMPTS = 10
+
+
+def database_url(url: str, suffix: str) -> str:
+    url = make_url(url)
+    return url.set(database=f"{url.database}_{suffix}").render_as_string(hide_password=False)
+
+
+def execute_on_server(url: str, *statements: str) -> None:
+    """
+    Runs `statements` outside of a transaction, connected to the `postgres` maintenance database.
+    """
+    engine = create_engine(make_url(url).set(database="postgres"), isolation_level="AUTOCOMMIT")
+    try:
+        with engine.connect() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+    finally:
+        engine.dispose()
+
+
+def create_template_database(url: str, metadata: MetaData) -> str:
+    template_url = database_url(url, "template")
+    name = make_url(template_url).database
+
+    execute_on_server(url, f'DROP DATABASE IF EXISTS "{name}"', f'CREATE DATABASE "{name}"')
+
+    engine = create_engine(template_url)
+    try:
+        metadata.create_all(bind=engine)
+    finally:
+        engine.dispose()
+
+    return template_url
+
+
+def create_worker_database(url: str, worker_id: str) -> str:
+    """
+    Recreates the database of `worker_id` from the template and returns its URL.
+    """
+    worker_url = database_url(url, worker_id)
+    name = make_url(worker_url).database
+    template = make_url(database_url(url, "template")).database
+
+    # Postgres refuses to copy a template that another CREATE DATABASE is reading right now
+    for attempt in range(CREATE_DATABASE_ATTEMPTS):
+        try:
+            execute_on_server(url, f'DROP DATABASE IF EXISTS "{name}"', f'CREATE DATABASE "{name}" TEMPLATE "{template}"')
+            return worker_url
+        except Exception:
+            if attempt == CREATE_DATABASE_ATTEMPTS - 1:
+                raise
+            time.sleep(0.1 * (attempt + 1))
@@ -6,15 +6,25 @@ import os
 import json
 import pytest
 from typing import List
-from app.domain.article.service import add_purchased_article
+from app.domain.article.service import (
+    add_purchased_article, add_purchased_articles, get_or_create_tags, search_facets,
+    refresh_related_articles, persist_trending_scores
+)
+from app.domain.article import service as article_service
+from app.internal.related import RelatedArticlesIndex
+from app.internal.trending import trending_articles
 from app.dependencies import get_user_id_by_access_token
-from app.domain.article.models import Article
+from app.domain.article import models as article_models
+from app.domain.article.models import Article, ArticleContentElement, FeedEntry, WishList, ArticleTrendingScore, DeletedArticle
+from app.domain.user.models import Follower
 from app.tests.utils import (
     create_test_article,
     create_test_user,
     create_test_comment,
     create_test_wish_list,
     create_test_collection,
+    create_test_follower,
+    assert_max_queries,
     DEFAULT_IMAGE_PATH
 )
 
@@ -87,6 +97,229 @@ def test_get_articles_unauthorized_all(client: TestClient):
     
     assert res.status_code == status.HTTP_200_OK
 
+def test_articles_get_tags(client: TestClient, session: Session):
+    user_id = create_test_user(session).id
+    for values, is_free in [(["Python", "sql"], True), (["python", "pytest"], False), (["pytest", "rust"], True)]:
+        article = create_test_article(session, user_id)
+        article.tags = get_or_create_tags(session, values)
+        article.is_free = is_free
+    session.commit()
+
+    res = client.get('/articles/tags')
+
+    assert res.status_code == status.HTTP_200_OK
+    assert [tag['value'] for tag in res.json()] == ['pytest', 'Python', 'python', 'rust', 'sql']
+    assert res.json()[0] == {'value': 'pytest', 'free_article_count': 1, 'paid_article_count': 1, 'article_count': 2}
+
+    res = client.get('/articles/tags', params={'prefix': 'PY', 'limit': 2})
+
+    assert res.status_code == status.HTTP_200_OK
+    assert [tag['value'] for tag in res.json()] == ['pytest', 'Python']
+
+    res = client.get('/articles/tags', params={'prefix': 'go'})
+
+    assert res.json() == []
+
+def test_articles_search_facets(client: TestClient, session: Session):
+    user_id = create_test_user(session).id
+    for title, values, price, rating in [
+        ("python basics", ["python"], 0, 0),
+        ("python testing", ["python", "pytest"], 15, 4.5),
+        ("rust basics", ["rust"], 60, 3),
+        ("sql", [], 120, 5),
+    ]:
+        article = create_test_article(session, user_id)
+        article.title, article.tags, article.price, article.is_free, article.rating = \
+            title, get_or_create_tags(session, values), price, price == 0, rating
+    session.commit()
+
+    res = client.get('/articles/search', params={'value': 'basics', 'facets': True})
+
+    assert res.status_code == status.HTTP_200_OK
+    assert res.json()['total'] == 2
+    assert res.json()['facets'] == {
+        'tags': [{'value': 'python', 'count': 1}, {'value': 'rust', 'count': 1}],
+        'is_free': [{'value': False, 'count': 1}, {'value': True, 'count': 1}],
+        'price': [{'min': 0, 'max': 10, 'count': 1}, {'min': 50, 'max': 100, 'count': 1}],
+        'rating': [{'min': 0, 'max': 1, 'count': 1}, {'min': 3, 'max': 4, 'count': 1}],
+    }
+
+    res = client.get('/articles/search', params={'facets': True, 'min_price': 10})
+
+    assert res.json()['total'] == 3
+    assert res.json()['facets']['tags'] == [
+        {'value': 'pytest', 'count': 1}, {'value': 'python', 'count': 1}, {'value': 'rust', 'count': 1}
+    ]
+    assert res.json()['facets']['rating'] == [
+        {'min': 3, 'max': 4, 'count': 1}, {'min': 4, 'max': 5, 'count': 1}, {'min': 5, 'max': None, 'count': 1}
+    ]
+
+    res = client.get('/articles/search', params={'value': 'basics'})
+
+    assert res.json()['facets'] is None
+
+    with assert_max_queries(1):
+        search_facets(session, value='', tags=['python', 'rust'])
+
+def test_articles_get_related(client: TestClient, session: Session, monkeypatch):
+    monkeypatch.setattr(article_service, 'related_articles', RelatedArticlesIndex())
+
+    user_id = create_test_user(session).id
+    ids = []
+    for title, summary, values in [
+        ("postgres indexes", "btree and gin indexes in postgres", ["sql"]),
+        ("postgres vacuum", "how vacuum cleans postgres tables", ["sql"]),
+        ("baking bread", "sourdough starter and flour", ["cooking"]),
+        ("query planning", "how postgres picks indexes", []),
+    ]:
+        article = create_test_article(session, user_id)
+        article.title, article.summary, article.tags = title, summary, get_or_create_tags(session, values)
+        session.commit()
+        ids.append(article.id)
+
+    res = client.get(f'/articles/{ids[0]}/related')
+
+    # nothing is built inside a request, the background worker builds the index
+    assert res.status_code == status.HTTP_200_OK
+    assert res.json() == []
+
+    refresh_related_articles(session, rebuild=True)
+
+    res = client.get(f'/articles/{ids[0]}/related')
+
+    assert [article['id'] for article in res.json()][:2] == [ids[1], ids[3]]
+
+    article = session.get(Article, ids[2])
+    article.title, article.summary = "postgres indexes", "btree and gin indexes in postgres"
+    session.delete(session.get(Article, ids[3]))
+    session.commit()
+
+    assert session.get(DeletedArticle, ids[3]) is not None
+
+    refresh_related_articles(session)
+
+    res = client.get(f'/articles/{ids[0]}/related')
+
+    assert [article['id'] for article in res.json()] == [ids[2], ids[1]]
+
+    res = client.get(f'/articles/{ids[0]}/related', params={'limit': 1})
+
+    assert [article['id'] for article in res.json()] == [ids[2]]
+
+    res = client.get('/articles/0/related')
+
+    assert res.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_article_content_updated_at_follows_indexed_content(session: Session):
+    article = create_test_article(session, create_test_user(session).id)
+    versions = [article.content_updated_at]
+
+    article.view_count += 1
+    article.rating = 4
+    session.commit()
+    versions.append(article.content_updated_at)
+
+    article.title = "new title"
+    session.commit()
+    versions.append(article.content_updated_at)
+
+    article.tags = get_or_create_tags(session, ["sql"])
+    session.commit()
+    versions.append(article.content_updated_at)
+
+    article.content_elements = [ArticleContentElement(content_type="text", content="content", order=1)]
+    session.commit()
+    versions.append(article.content_updated_at)
+
+    article.content_elements[0].content = "new content"
+    session.commit()
+    versions.append(article.content_updated_at)
+
+    assert versions[0] == versions[1] < versions[2] < versions[3] < versions[4] < versions[5]
+
+def test_articles_get_trending(client: TestClient, session: Session):
+    trending_articles.pop_pending()
+    trending_articles.load({})
+
+    user_id = create_test_user(session).id
+    buyer_id = create_test_user(session).id
+    ids = [create_test_article(session, user_id).id for _ in range(3)]
+
+    article = session.get(Article, ids[0])
+    article.view_count += 4
+    session.commit()
+    session.add(WishList(article_id=ids[1], user_id=buyer_id))
+    session.commit()
+    add_purchased_articles(session, buyer_id, [ids[2], ids[1]])
+
+    res = client.get('/articles/trending')
+
+    assert res.status_code == status.HTTP_200_OK
+    assert [(article['id'], round(article['trending_score'], 2)) for article in res.json()] == [
+        (ids[1], 8.0), (ids[2], 5.0), (ids[0], 4.0)
+    ]
+
+    persist_trending_scores(session)
+    article = session.get(Article, ids[0])
+    article.view_count += 2
+    session.commit()
+    persist_trending_scores(session)
+
+    assert dict(session.query(ArticleTrendingScore.article_id, ArticleTrendingScore.score)) == pytest.approx(
+        {ids[0]: 6.0, ids[1]: 8.0, ids[2]: 5.0}, rel=1e-3
+    )
+    assert [article_id for article_id, _ in trending_articles.top()] == [ids[1], ids[0], ids[2]]
+
+    res = client.get('/articles/trending', params={'limit': 1})
+
+    assert [article['id'] for article in res.json()] == [ids[1]]
+
+
+def test_persist_trending_scores_keeps_signals_on_failure(
+    session: Session,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    trending_articles.pop_pending()
+    trending_articles.load({})
+
+    article_id = create_test_article(session, create_test_user(session).id).id
+    article = session.get(Article, article_id)
+    article.view_count += 3
+    session.commit()
+
+    def failing_commit():
+        raise RuntimeError("database unavailable")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(session, "commit", failing_commit)
+        with pytest.raises(RuntimeError):
+            persist_trending_scores(session)
+
+    persist_trending_scores(session)
+
+    assert session.get(ArticleTrendingScore, article_id).score == pytest.approx(3.0, rel=1e-3)
+
+
+def test_articles_get_detail_records_trending_views(authorized_client: TestClient, session: Session):
+    trending_articles.pop_pending()
+    trending_articles.load({})
+
+    user_id = get_user_id_by_access_token(authorized_client.cookies.get('access_token'))
+    article = create_test_article(session, user_id)
+    article_id, slug = article.id, article.slug
+
+    res = authorized_client.get(f'/articles/detail/id/{article_id}')
+
+    assert res.status_code == status.HTTP_200_OK
+    assert trending_articles.score(article_id) == pytest.approx(1.0, rel=1e-3)
+
+    res = authorized_client.post('/articles/detail/slug', json={'slug': slug})
+
+    assert res.status_code == status.HTTP_200_OK
+    assert trending_articles.score(article_id) == pytest.approx(2.0, rel=1e-3)
+    assert session.get(Article, article_id).view_count == 2
+
 def test_articles_authorized_get_me(authorized_client: TestClient):
     res = authorized_client.get('/articles/me')
     
@@ -972,4 +1205,107 @@ def test_articles_collection_post_buy_by_collection_id(
     res = authorized_client.post(f'/articles/collection/buy/{collection_id}')
     
     assert res.status_code == expected_code
-    
\ No newline at end of file
+    
+def test_articles_collection_post_buy_skips_already_bought_articles(
+    authorized_client: TestClient,
+    session: Session,
+):
+    buyer_id = get_user_id_by_access_token(authorized_client.cookies.get('access_token'))
+    owner_id = create_test_user(session).id
+
+    articles = [create_test_article(session, owner_id) for _ in range(3)]
+    article_ids = [article.id for article in articles]
+    collection_id = create_test_collection(session, articles, owner_id).id
+    add_purchased_article(session, buyer_id, article_ids[0])
+
+    res = authorized_client.post(f'/articles/collection/buy/{collection_id}')
+
+    assert res.status_code == status.HTTP_200_OK
+
+    res = authorized_client.get('/articles/bought-list')
+
+    assert sorted(item['article']['id'] for item in res.json()['items']) == sorted(article_ids)
+
+
+def get_whole_feed(authorized_client: TestClient, size: int) -> List[List[int]]:
+    pages, cursor = [], None
+    while True:
+        res = authorized_client.get('/articles/feed', params={'size': size, **({'cursor': cursor} if cursor else {})})
+        assert res.status_code == status.HTTP_200_OK
+        pages.append([article['id'] for article in res.json()['items']])
+        if not (cursor := res.json()['next_cursor']):
+            return pages
+
+
+def test_articles_get_feed_of_followed_authors(
+    authorized_client: TestClient,
+    session: Session
+):
+    user_id = get_user_id_by_access_token(authorized_client.cookies.get('access_token'))
+    author_ids = [create_test_user(session).id for _ in range(3)]
+    for author_id in author_ids[:2]:
+        create_test_follower(session, user_id, author_id)
+
+    article_ids = [create_test_article(session, author_id).id for author_id in author_ids * 2]
+
+    assert get_whole_feed(authorized_client, size=2) == [
+        [article_ids[4], article_ids[3]],
+        [article_ids[1], article_ids[0]],
+    ]
+
+
+def test_articles_get_feed_from_timeline(
+    authorized_client: TestClient,
+    session: Session,
+    monkeypatch
+):
+    monkeypatch.setattr(article_models, 'FEED_FANOUT_THRESHOLD', 1)
+
+    user_id = get_user_id_by_access_token(authorized_client.cookies.get('access_token'))
+    author_id = create_test_user(session).id
+    article_ids = [create_test_article(session, author_id).id]
+
+    create_test_follower(session, user_id, author_id)
+    article_ids += [create_test_article(session, author_id).id for _ in range(2)]
+
+    assert session.query(FeedEntry).filter_by(user_id=user_id).count() == 3
+    assert get_whole_feed(authorized_client, size=2) == [article_ids[:0:-1], article_ids[:1]]
+
+    session.delete(session.query(Follower).filter_by(follower_id=user_id).one())
+    session.commit()
+
+    assert session.query(FeedEntry).filter_by(user_id=user_id).count() == 0
+
+
+def test_feed_timeline_is_trimmed(
+    session: Session,
+    monkeypatch
+):
+    monkeypatch.setattr(article_models, 'FEED_FANOUT_THRESHOLD', 1)
+    monkeypatch.setattr(article_models, 'FEED_TIMELINE_SIZE', 2)
+
+    user_id = create_test_user(session).id
+    author_ids = [create_test_user(session).id for _ in range(2)]
+    create_test_follower(session, user_id, author_ids[0])
+
+    def timeline() -> list[int]:
+        return [
+            article_id for article_id, in session.query(FeedEntry.article_id)
+            .filter_by(user_id=user_id)
+            .order_by(FeedEntry.created_at.desc(), FeedEntry.article_id.desc())
+        ]
+
+    article_ids = [create_test_article(session, author_ids[0]).id for _ in range(3)]
+
+    assert timeline() == article_ids[:0:-1]
+
+    other_article_ids = [create_test_article(session, author_ids[1]).id for _ in range(2)]
+    create_test_follower(session, user_id, author_ids[1])
+
+    assert timeline() == other_article_ids[::-1]
+
+
+def test_articles_get_feed_invalid_cursor(authorized_client: TestClient):
+    res = authorized_client.get('/articles/feed', params={'cursor': 'invalid'})
+
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,36 @@
+from fastapi.testclient import TestClient
+from fastapi import status
+from sqlalchemy.orm import Session
+from app.tests.utils import create_test_user
+from app.routers import metrics
+import pytest
+
+
+def test_metrics_get_request_and_cache_metrics(client: TestClient, session: Session):
+    user_id = create_test_user(session).id
+
+    client.get(f'/user/get/{user_id}')
+    client.get('/user/followers/top')
+    res = client.get('/metrics')
+
+    assert res.status_code == status.HTTP_200_OK
+    assert res.headers['content-type'].startswith('text/plain')
+    assert 'http_request_duration_seconds_count{method="GET",route="/user/get/{user_id}",status="200"}' in res.text
+    assert 'http_request_db_queries_count{route="/user/get/{user_id}"}' in res.text
+    assert 'cache_misses_total{cache="top_users_by_most_followers"}' in res.text
+
+
+def test_metrics_get_requires_token(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(metrics, 'METRICS_TOKEN', 'scrape token')
+
+    res = client.get('/metrics')
+
+    assert res.status_code == status.HTTP_401_UNAUTHORIZED
+
+    res = client.get('/metrics', headers={'Authorization': 'Bearer other token'})
+
+    assert res.status_code == status.HTTP_401_UNAUTHORIZED
+
+    res = client.get('/metrics', headers={'Authorization': 'Bearer scrape token'})
+
+    assert res.status_code == status.HTTP_200_OK
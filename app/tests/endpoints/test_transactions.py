@@ -0,0 +1,214 @@
+from app.tests.conftest import authorized_client
+from app.tests.utils import create_test_article, create_test_user
+from app.dependencies import get_user_id_by_access_token
+from app.domain.article.service import add_purchased_article
+from app.domain.transaction.models import Transaction, TransactionItem, PaymentNotification, COMPLETED_TRANSACTIONS_KEY
+from app.domain.transaction.service import apply_payment_notifications
+from app.internal.payu_mock import sign_notification
+from app.domain.transaction import payu
+from app.domain.transaction.payu import verify_notification_signature, PAYU_SECOND_KEY
+from app.domain.article.models import ArticlePurchase
+
+from fastapi.testclient import TestClient
+from fastapi import status
+
+from sqlalchemy.orm import Session
+import pytest
+import json
+
+
+def test_transactions_post_create_order_free_articles(
+    authorized_client: TestClient,
+    session: Session,
+):
+    author_id = create_test_user(session).id
+    article_ids = [create_test_article(session, author_id).id for _ in range(3)]
+
+    res = authorized_client.post(
+        '/transactions/create-order',
+        json={"items": article_ids, "redirect_url": "http://localhost/"}
+    )
+
+    assert res.status_code == status.HTTP_200_OK
+    assert res.json()["PayU_order_id"] is None
+
+    transaction = session.get(Transaction, res.json()["order_id"])
+
+    assert transaction.status == "COMPLETED"
+    assert sorted(item.article_id for item in transaction.items) == sorted(article_ids)
+
+    res = authorized_client.get('/articles/bought-list')
+
+    assert sorted(item['article']['id'] for item in res.json()['items']) == sorted(article_ids)
+
+
+@pytest.mark.parametrize(
+    'case, expected_code',
+    [
+        ('missing', status.HTTP_404_NOT_FOUND),
+        ('own', status.HTTP_403_FORBIDDEN),
+        ('bought', status.HTTP_403_FORBIDDEN),
+        ('empty', status.HTTP_400_BAD_REQUEST),
+    ]
+)
+def test_transactions_post_create_order_unpurchasable_articles(
+    authorized_client: TestClient,
+    session: Session,
+    case: str,
+    expected_code: int
+):
+    user_id = get_user_id_by_access_token(authorized_client.cookies.get('access_token'))
+    author_id = create_test_user(session).id
+    article_ids = [create_test_article(session, author_id).id]
+
+    if case == 'missing':
+        article_ids.append(article_ids[0] + 100)
+    elif case == 'own':
+        article_ids.append(create_test_article(session, user_id).id)
+    elif case == 'bought':
+        add_purchased_article(session, user_id, article_ids[0])
+    elif case == 'empty':
+        article_ids = []
+
+    res = authorized_client.post(
+        '/transactions/create-order',
+        json={"items": article_ids, "redirect_url": "http://localhost/"}
+    )
+
+    assert res.status_code == expected_code
+    assert session.query(Transaction).count() == 0
+
+
+def test_transactions_get_user_transactions_newest_first(
+    authorized_client: TestClient,
+    session: Session,
+):
+    author_id = create_test_user(session).id
+    articles = [create_test_article(session, author_id) for _ in range(3)]
+    article_titles = {article.id: article.title for article in articles}
+    order_ids = []
+
+    for article_ids in ([articles[0].id], [articles[1].id, articles[2].id]):
+        res = authorized_client.post(
+            '/transactions/create-order',
+            json={"items": article_ids, "redirect_url": "http://localhost/"}
+        )
+        order_ids.append((res.json()["order_id"], article_ids))
+
+    res = authorized_client.get('/transactions/user-transactions')
+
+    assert res.status_code == status.HTTP_200_OK
+    assert res.json()["total"] == 2
+    assert [item["id"] for item in res.json()["items"]] == [order_id for order_id, _ in reversed(order_ids)]
+
+    for transaction, (_, article_ids) in zip(res.json()["items"], reversed(order_ids)):
+        assert sorted(item["title"] for item in transaction["items"]) == sorted(article_titles[id] for id in article_ids)
+
+
+def test_transaction_status_completed_grants_articles(session: Session):
+    user_id = create_test_user(session).id
+    author_id = create_test_user(session).id
+    article_ids = [create_test_article(session, author_id).id for _ in range(2)]
+
+    transaction = Transaction(
+        id='order',
+        user_id=user_id,
+        status='WAITING_FOR_PAYMENT',
+        items=[TransactionItem(article_id=article_id) for article_id in article_ids]
+    )
+    session.add(transaction)
+    session.commit()
+
+    assert session.query(ArticlePurchase).count() == 0
+
+    transaction.status = 'COMPLETED'
+    session.commit()
+
+    assert COMPLETED_TRANSACTIONS_KEY not in session.info
+    assert sorted(
+        purchase.article_id for purchase in session.query(ArticlePurchase).filter_by(user_id=user_id)
+    ) == sorted(article_ids)
+
+
+def create_notification(order_id: str, order_status: str, second_key: str = PAYU_SECOND_KEY) -> tuple[str, dict]:
+    body = json.dumps({"order": {"orderId": "PAYU" + order_id, "extOrderId": order_id, "status": order_status}})
+    return body, {"Content-Type": "application/json", "OpenPayu-Signature": sign_notification(body, second_key)}
+
+
+def test_transactions_post_notify_is_deduplicated(
+    client: TestClient,
+    session: Session,
+):
+    body, headers = create_notification("order", "COMPLETED")
+
+    for _ in range(3):
+        res = client.post('/transactions/notify', content=body, headers=headers)
+        assert res.status_code == status.HTTP_200_OK
+
+    assert session.query(PaymentNotification).count() == 1
+
+
+def test_transactions_post_notify_invalid_signature(
+    client: TestClient,
+    session: Session,
+):
+    body, headers = create_notification("order", "COMPLETED", second_key="other key")
+
+    res = client.post('/transactions/notify', content=body, headers=headers)
+
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
+    assert session.query(PaymentNotification).count() == 0
+
+
+def test_transactions_post_notify_without_second_key(
+    client: TestClient,
+    session: Session,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    body, headers = create_notification("order", "COMPLETED")
+    monkeypatch.setattr(payu, "PAYU_SECOND_KEY", "")
+
+    res = client.post('/transactions/notify', content=body, headers=headers)
+
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
+    assert session.query(PaymentNotification).count() == 0
+    assert not verify_notification_signature(body.encode(), sign_notification(body, ""), second_key="")
+
+
+def test_transactions_payment_notifications_out_of_order(
+    client: TestClient,
+    session: Session,
+):
+    user_id = create_test_user(session).id
+    author_id = create_test_user(session).id
+    article_id = create_test_article(session, author_id).id
+
+    session.add(Transaction(
+        id='order',
+        user_id=user_id,
+        status='WAITING_FOR_PAYMENT',
+        items=[TransactionItem(article_id=article_id)]
+    ))
+    session.commit()
+
+    for order_status in ('COMPLETED', 'PENDING', 'COMPLETED'):
+        body, headers = create_notification('order', order_status)
+        client.post('/transactions/notify', content=body, headers=headers)
+    body, headers = create_notification('unknown', 'COMPLETED')
+    client.post('/transactions/notify', content=body, headers=headers)
+
+    assert apply_payment_notifications(session) == 3
+    assert apply_payment_notifications(session) == 0
+
+    outcomes = {
+        (notification.order_id, notification.status): notification.outcome
+        for notification in session.query(PaymentNotification)
+    }
+
+    assert outcomes == {
+        ('order', 'COMPLETED'): 'APPLIED',
+        ('order', 'PENDING'): 'STALE',
+        ('unknown', 'COMPLETED'): 'UNKNOWN_ORDER',
+    }
+    assert session.get(Transaction, 'order').status == 'COMPLETED'
+    assert session.query(ArticlePurchase).filter_by(user_id=user_id, article_id=article_id).count() == 1
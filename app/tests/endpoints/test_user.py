@@ -6,15 +6,22 @@ from app.tests.utils import (
     create_test_skill,
     create_test_skill_list,
     create_test_follower,
+    create_test_article,
+    assert_max_queries,
+    forbid_lazy_loads,
     DEFAULT_IMAGE_PATH
 )
 from app.dependencies import get_user_id_by_access_token, EncodedTokens, create_token
-from app.domain.user.models import User
+from app.domain.user.models import User, Follower
+from app.domain.user.service import remove_duplicate_follows
+from app.internal.counters import reconcile_user_counters
+from app.domain.article.models import Article, ArticleComment
 
 from fastapi.testclient import TestClient
 from fastapi import status
 
 from sqlalchemy.orm import Session
+from sqlalchemy import func, select, text
 import os
 import pytest
 
@@ -139,6 +146,20 @@ def test_user_post_skill(authorized_client: TestClient):
     res = authorized_client.post('/user/skill', json={'skill_name': 'skill'})
     
     assert res.status_code == status.HTTP_201_CREATED
+
+def test_user_post_skill_returns_profile(authorized_client: TestClient, session: Session):
+    user_id = get_user_id_by_access_token(authorized_client.cookies.get('access_token'))
+    for _ in range(2):
+        create_test_article(session, user_id)
+
+    authorized_client.post('/user/skill', json={'skill_name': 'first'})
+    res = authorized_client.post('/user/skill', json={'skill_name': 'second'})
+
+    assert res.status_code == status.HTTP_201_CREATED
+    assert res.json()['id'] == user_id
+    assert res.json()['article_count'] == 2
+    assert [skill['skill_name'] for skill in res.json()['skill_list']] == ['first', 'second']
+    assert res.json() == authorized_client.get('/user/get').json()
     
 def test_user_delete_skill_by_skill_id(
     authorized_client: TestClient,
@@ -163,7 +184,36 @@ def test_user_get_followers_top(client: TestClient):
     res = client.get('/user/followers/top')
 
     assert res.status_code == status.HTTP_200_OK
+
+def test_user_get_followers_top_skill_list(client: TestClient, session: Session):
+    skill = create_test_skill(session, 'skill')
+    user_ids = [create_test_user(session).id for _ in range(3)]
+    skill_list_id = create_test_skill_list(session, user_ids[0], skill).id
+
+    res = client.get('/user/followers/top')
+
+    assert res.status_code == status.HTTP_200_OK
+    assert {user['id']: user['skill_list'] for user in res.json()['items']} == {
+        user_ids[0]: [{'id': skill_list_id, 'skill_name': 'skill'}],
+        user_ids[1]: [],
+        user_ids[2]: [],
+    }
     
+def test_user_get_followers_query_count_does_not_grow(client: TestClient, session: Session):
+    followed_id = create_test_user(session).id
+    skill = create_test_skill(session, 'skill')
+    for _ in range(10):
+        follower_id = create_test_user(session).id
+        create_test_follower(session, follower_id, followed_id)
+        create_test_skill_list(session, follower_id, skill)
+
+    with assert_max_queries(4), forbid_lazy_loads():
+        res = client.get(f'/user/get/followers/{followed_id}')
+
+    assert res.status_code == status.HTTP_200_OK
+    assert len(res.json()['items']) == 10
+    assert res.headers['Server-Timing'].startswith('db;dur=')
+
 def test_user_post_follow_by_followed_user_id(
     authorized_client: TestClient,
     session: Session
@@ -174,6 +224,57 @@ def test_user_post_follow_by_followed_user_id(
     
     assert res.status_code == status.HTTP_201_CREATED
     
+def test_user_post_follow_twice(
+    authorized_client: TestClient,
+    session: Session
+):
+    user_id = create_test_user(session).id
+
+    authorized_client.post(f'/user/follow/{user_id}')
+    res = authorized_client.post(f'/user/follow/{user_id}')
+
+    assert res.status_code == status.HTTP_400_BAD_REQUEST
+    assert session.get(User, user_id).follower_count == 1
+
+def test_remove_duplicate_follows(session: Session):
+    follower_id, followed_id, other_id = [create_test_user(session).id for _ in range(3)]
+    # databases created before the constraint could have duplicates left by concurrent follows
+    session.execute(text("ALTER TABLE followers DROP CONSTRAINT uix_follower_followed"))
+    session.execute(
+        text("INSERT INTO followers (follower_id, followed_id) VALUES (:a, :b), (:a, :b), (:a, :b), (:a, :c)"),
+        {"a": follower_id, "b": followed_id, "c": other_id},
+    )
+    first_id = session.scalar(select(func.min(Follower.id)))
+
+    assert remove_duplicate_follows(session) == 2
+    assert sorted(session.execute(select(Follower.id, Follower.followed_id))) == [
+        (first_id, followed_id), (first_id + 3, other_id)
+    ]
+    assert remove_duplicate_follows(session) == 0
+
+    reconcile_user_counters(session)
+
+    assert session.get(User, follower_id).following_count == 2
+    assert session.get(User, followed_id).follower_count == 1
+
+def test_user_get_followers_newest_first(
+    client: TestClient,
+    session: Session
+):
+    followed_id = create_test_user(session).id
+    follower_ids = [create_test_user(session).id for _ in range(3)]
+    for follower_id in follower_ids:
+        create_test_follower(session, follower_id, followed_id)
+
+    res = client.get(f'/user/get/followers/{followed_id}')
+
+    assert res.json()['total'] == 3
+    assert [user['id'] for user in res.json()['items']] == follower_ids[::-1]
+
+    res = client.get(f'/user/get/followed_users/{follower_ids[0]}')
+
+    assert [user['id'] for user in res.json()['items']] == [followed_id]
+
 def test_user_delete_follow_by_followed_user_id(
     authorized_client: TestClient,
     session: Session
@@ -221,3 +322,27 @@ def test_user_get_search(client: TestClient):
     res = client.get('/user/search')
     
     assert res.status_code == status.HTTP_200_OK
+
+
+def test_user_avg_rating_from_articles_follows_comments(client: TestClient, session: Session):
+    author_id = create_test_user(session).id
+    reader_ids = [create_test_user(session).id for _ in range(2)]
+    article_ids = [create_test_article(session, author_id).id for _ in range(3)]
+
+    for article_id, ratings in zip(article_ids, ([1, 5], [4], [])):
+        for reader_id, rating in zip(reader_ids, ratings):
+            session.add(ArticleComment(author_id=reader_id, article_id=article_id, content='comment', rating=rating))
+            session.commit()
+
+    res = client.get(f'/user/get/{author_id}')
+    assert res.json()['avg_rating_from_articles'] == 3.5
+
+    session.delete(session.get(Article, article_ids[1]))
+    session.commit()
+
+    res = client.get(f'/user/get/{author_id}')
+    assert res.json()['avg_rating_from_articles'] == 3.0
+
+    assert reconcile_user_counters(session) == 0
+    author = session.get(User, author_id)
+    assert (author.rated_article_count, author.rated_article_rating_sum) == (1, 3.0)
@@ -0,0 +1,56 @@
+from sqlalchemy.orm import Session
+from app.main import app
+from app.benchmarks.runner import percentile, run_scenario, summarize
+from app.benchmarks.scenarios import SCENARIOS
+from app.internal.seeder import Seeder, seed_database
+from app.domain.article.models import ArticleComment
+from app.domain.transaction.payu import get_payu_client
+from app.tests.utils import create_mock_payu_client
+import asyncio
+import httpx
+
+
+def test_summarize_reports_percentiles_per_endpoint():
+    samples = [('GET /a', i / 1000, True) for i in range(1, 101)] + [('GET /b', 0.5, False)]
+
+    summary = summarize(samples, elapsed=2)
+
+    assert summary['requests'] == 101
+    assert summary['errors'] == 1
+    assert summary['endpoints']['GET /a'] == {
+        'requests': 100, 'errors': 0, 'throughput': 50.0, 'mean': 50.5, 'p50': 50.0, 'p95': 95.0, 'p99': 99.0
+    }
+    assert percentile([], 50) == 0.0
+
+
+def test_benchmark_scenarios_run_without_errors(committed_session: Session, monkeypatch):
+    # the app opens its own sessions, so the seeded data has to be committed
+    options = {'seed': 1, 'users': 5, 'articles': 40, 'follows': 2, 'purchases': 8}
+    seed_database(committed_session, reset=True, **options)
+    dataset = Seeder(**options)
+    seeded_comments = committed_session.query(ArticleComment).count()
+
+    payu_client = create_mock_payu_client()
+    monkeypatch.setattr(app, 'dependency_overrides', {get_payu_client: lambda: payu_client})
+
+    async def run_all():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+            return {
+                scenario: await run_scenario(
+                    client, scenario, dataset=dataset, concurrency=3, iterations=2
+                )
+                for scenario in SCENARIOS
+            }
+
+    try:
+        results = asyncio.run(run_all())
+    finally:
+        asyncio.run(payu_client.close())
+
+    assert {scenario: result['errors'] for scenario, result in results.items()} == dict.fromkeys(SCENARIOS, 0)
+    assert 'POST /transactions/create-order' in results['checkout']['endpoints']
+    # every virtual user comments one more bought article per iteration, while there are uncommented ones
+    assert committed_session.query(ArticleComment).count() == seeded_comments + sum(
+        min(2, len(set(dataset.purchased_articles(user_id)) - set(dataset.commented_articles(user_id))))
+        for user_id in range(1, 4)
+    )
@@ -0,0 +1,30 @@
+from app.internal.cache import SnapshotCache
+import time
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_snapshot_cache_serves_stale_value_while_revalidating():
+    versions = iter(range(10))
+    cache = SnapshotCache(lambda db: next(versions), ttl=60)
+
+    assert cache.get(None) == 0
+    assert cache.get(None) == 0
+
+    cache.invalidate()
+
+    assert cache.get(None) == 0
+    wait_for(lambda: cache.get(None) == 1)
+    assert cache.misses == 1
+
+
+def test_snapshot_cache_without_ttl_always_loads():
+    versions = iter(range(10))
+    cache = SnapshotCache(lambda db: next(versions), ttl=0)
+
+    assert [cache.get(None) for _ in range(3)] == [0, 1, 2]
@@ -0,0 +1,71 @@
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from app.domain.user.models import User
+from app.domain.article.models import Tag
+from app.domain.article.service import get_or_create_tags
+from app.internal.counters import reconcile_user_counters, reconcile_tag_counters
+from app.tests.utils import create_test_article, create_test_follower, create_test_user
+
+
+def test_reconcile_user_counters_fixes_drift(session: Session):
+    user_ids = [create_test_user(session).id for _ in range(3)]
+    create_test_follower(session, user_ids[0], user_ids[1])
+    create_test_follower(session, user_ids[2], user_ids[1])
+    create_test_article(session, user_ids[1])
+
+    counters = lambda: {
+        user.id: (user.follower_count, user.following_count, user.article_count)
+        for user in session.query(User).populate_existing()
+    }
+    expected = counters()
+
+    assert expected == {
+        user_ids[0]: (0, 1, 0),
+        user_ids[1]: (2, 0, 1),
+        user_ids[2]: (0, 1, 0),
+    }
+    assert reconcile_user_counters(session) == 0
+
+    session.execute(update(User).where(User.id != user_ids[0]).values(follower_count=7, article_count=None))
+    session.commit()
+
+    assert reconcile_user_counters(session, batch_size=2) == 2
+    assert counters() == expected
+
+
+def test_tag_counters_follow_article_tags(session: Session):
+    user_id = create_test_user(session).id
+    first, second = create_test_article(session, user_id), create_test_article(session, user_id)
+
+    counters = lambda: {
+        tag.value: (tag.free_article_count, tag.paid_article_count)
+        for tag in session.query(Tag).populate_existing()
+    }
+
+    first.tags = get_or_create_tags(session, ["python", "sql"])
+    second.tags = get_or_create_tags(session, ["python", "python"])
+    session.commit()
+    assert counters() == {"python": (2, 0), "sql": (1, 0)}
+
+    second.is_free = False
+    session.commit()
+    assert counters() == {"python": (1, 1), "sql": (1, 0)}
+
+    session.expire_all()
+    first.tags = get_or_create_tags(session, ["sql", "rust"])
+    session.commit()
+    assert counters() == {"python": (0, 1), "sql": (1, 0), "rust": (1, 0)}
+
+    session.expire_all()
+    session.delete(second)
+    session.commit()
+    assert counters() == {"python": (0, 0), "sql": (1, 0), "rust": (1, 0)}
+
+    expected = counters()
+    assert reconcile_tag_counters(session) == 0
+
+    session.execute(update(Tag).values(free_article_count=5))
+    session.commit()
+
+    assert reconcile_tag_counters(session) == 3
+    assert counters() == expected
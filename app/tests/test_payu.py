@@ -0,0 +1,180 @@
+from fastapi.testclient import TestClient
+from fastapi import status
+from sqlalchemy.orm import Session
+from app.main import app
+from app.internal import payu_mock
+from app.domain.transaction.payu import PayUClient, CircuitBreaker, PayUUnavailableError, get_payu_client
+from app.domain.transaction.models import Transaction, TransactionItem
+from app.domain.article.models import ArticlePurchase
+from app.internal.workers import reconcile_pending_transactions
+from app.dependencies import get_user_id_by_access_token
+from app.tests.utils import create_mock_payu_client, create_test_article, create_test_user
+from datetime import datetime, timedelta, timezone
+import asyncio
+import threading
+import time
+import httpx
+import pytest
+
+
+@pytest.fixture
+def payu_client():
+    payu_mock.app.state.token_requests = 0
+    payu_mock.app.state.orders.clear()
+
+    return create_mock_payu_client()
+
+
+def test_payu_token_is_cached_between_orders(payu_client: PayUClient):
+    async def create_orders():
+        for _ in range(3):
+            await payu_client.create_order({"extOrderId": "1", "totalAmount": "100"})
+
+    asyncio.run(create_orders())
+
+    assert payu_mock.app.state.token_requests == 1
+    assert len(payu_mock.app.state.orders) == 3
+
+
+def test_payu_token_refresh_is_single_flight(payu_client: PayUClient):
+    async def create_orders():
+        await asyncio.gather(*[
+            payu_client.create_order({"extOrderId": str(i), "totalAmount": "100"}) for i in range(10)
+        ])
+
+    asyncio.run(create_orders())
+
+    assert payu_mock.app.state.token_requests == 1
+
+
+def test_payu_revoked_token_is_refreshed(payu_client: PayUClient):
+    async def create_orders():
+        await payu_client.create_order({"extOrderId": "1", "totalAmount": "100"})
+        payu_mock.app.state.tokens.clear()
+        return await payu_client.create_order({"extOrderId": "2", "totalAmount": "100"})
+
+    result = asyncio.run(create_orders())
+
+    assert result["extOrderId"] == "2"
+    assert payu_mock.app.state.token_requests == 2
+
+
+def test_payu_circuit_breaker_opens_after_failures():
+    def refuse(request: httpx.Request):
+        raise httpx.ConnectError("Connection refused", request=request)
+
+    payu_client = PayUClient(
+        base_url="http://payu.test",
+        client_id="client",
+        client_secret="secret",
+        transport=httpx.MockTransport(refuse),
+        circuit_breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    )
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(payu_client.get_access_token())
+
+    assert payu_client.circuit_breaker.is_open
+
+    with pytest.raises(PayUUnavailableError):
+        asyncio.run(payu_client.get_access_token())
+
+
+def test_transactions_post_create_order_with_payu_stand_in(
+    authorized_client: TestClient,
+    session: Session,
+    payu_client: PayUClient,
+    monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setitem(app.dependency_overrides, get_payu_client, lambda: payu_client)
+
+    author_id = create_test_user(session).id
+    article = create_test_article(session, author_id)
+    article.is_free = False
+    article.price = 12.5
+    session.commit()
+
+    res = authorized_client.post(
+        '/transactions/create-order',
+        json={"items": [article.id], "redirect_url": "http://localhost/"}
+    )
+
+    assert res.status_code == status.HTTP_200_OK
+    assert res.json()["PayU_order_id"] in payu_mock.app.state.orders
+    assert payu_mock.app.state.orders[res.json()["PayU_order_id"]]["totalAmount"] == "1250"
+    assert session.get(Transaction, res.json()["order_id"]).status == "WAITING_FOR_PAYMENT"
+
+
+def test_reconcile_pending_transactions_with_payu_stand_in(
+    session: Session,
+    payu_client: PayUClient
+):
+    user_id = create_test_user(session).id
+    author_id = create_test_user(session).id
+    article_id = create_test_article(session, author_id).id
+    now = datetime.now(timezone.utc)
+
+    async def create_orders():
+        return [
+            (await payu_client.create_order({"extOrderId": str(i), "totalAmount": "100"}))["orderId"]
+            for i in range(4)
+        ]
+
+    paid, abandoned, waiting, fresh = asyncio.run(create_orders())
+    payu_mock.app.state.orders[paid]["status"] = "COMPLETED"
+    payu_mock.app.state.orders[fresh]["status"] = "COMPLETED"
+
+    transactions = {
+        "paid": (paid, now - timedelta(hours=1)),
+        "abandoned": (abandoned, now - timedelta(days=2)),
+        "unknown": ("MISSING", now - timedelta(days=2)),
+        "waiting": (waiting, now - timedelta(hours=1)),
+        "fresh": (fresh, now),
+    }
+    for transaction_id, (payu_order_id, created_at) in transactions.items():
+        session.add(Transaction(
+            id=transaction_id,
+            user_id=user_id,
+            status="WAITING_FOR_PAYMENT",
+            payu_order_id=payu_order_id,
+            created_at=created_at,
+            items=[TransactionItem(article_id=article_id)] if transaction_id == "paid" else []
+        ))
+    session.commit()
+
+    changed = asyncio.run(reconcile_pending_transactions(session, payu_client, batch_size=2, concurrency=2))
+
+    assert changed == 3
+    assert {
+        transaction.id: transaction.status for transaction in session.query(Transaction)
+    } == {
+        "paid": "COMPLETED",
+        "abandoned": "EXPIRED",
+        "unknown": "EXPIRED",
+        "waiting": "WAITING_FOR_PAYMENT",
+        "fresh": "WAITING_FOR_PAYMENT",
+    }
+    assert session.query(ArticlePurchase).filter_by(user_id=user_id, article_id=article_id).count() == 1
+
+
+def test_payu_client_of_another_loop_is_closed(payu_client: PayUClient):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    try:
+        asyncio.run_coroutine_threadsafe(payu_client.get_access_token(), loop).result()
+        old_client = payu_client._client
+
+        asyncio.run(payu_client.get_access_token())
+
+        # closed by a task on the old loop, which is still running
+        for _ in range(100):
+            if old_client.is_closed:
+                break
+            time.sleep(0.01)
+        assert old_client.is_closed
+        assert payu_client._client is not old_client
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
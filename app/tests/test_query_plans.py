@@ -0,0 +1,166 @@
+"""
+Query plan regression harness.
+
+Seeds a large dataset, runs the service-layer queries and EXPLAINs every SELECT they issue.
+A query fails when its plan reads a large table with a sequential scan.
+
+It takes a while, so it only runs with `QUERY_PLAN_TESTS=1`.
+"""
+from app.database import truncate_tables
+from app.domain.model_base import Base
+from app.domain.article import service as article_service
+from app.domain.user import service as user_service
+from app.domain.support import service as support_service
+from app.domain.transaction import service as transaction_service
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from contextlib import contextmanager
+import asyncio
+import os
+import pytest
+
+
+pytestmark = pytest.mark.skipif(not os.environ.get("QUERY_PLAN_TESTS"), reason="QUERY_PLAN_TESTS is not set")
+
+USERS = 5_000
+ARTICLES = int(os.environ.get("QUERY_PLAN_ROWS", 100_000))
+LARGE_TABLE_ROWS = 10_000
+
+SEED_SQL = [
+    f"""
+    INSERT INTO users (first_name, last_name, email, sex, description, short_description, is_active,
+                       follower_count, following_count, article_count, hashed_password)
+    SELECT 'first' || i, 'last' || i, 'user' || i || '@example.com', 'male', '', '', true, 0, 0, 0, ''
+    FROM generate_series(1, {USERS}) AS i
+    """,
+    f"""
+    INSERT INTO articles (title, slug, summary, author_id, created_at, title_image, is_free, price, rating, rating_count, view_count)
+    SELECT 'title ' || i, 'slug-' || i, 'summary', 1 + i % {USERS}, now() - i * interval '1 minute',
+           'image.png', i % 2 = 0, i % 50, i % 6, i % 6, i
+    FROM generate_series(1, {ARTICLES}) AS i
+    """,
+    # (i % USERS, 7 * i % ARTICLES) pairs are unique as long as 7 is coprime to ARTICLES
+    f"""
+    INSERT INTO article_comment (author_id, article_id, content, rating)
+    SELECT 1 + i % {USERS}, 1 + (7 * i) % {ARTICLES}, 'comment', 1 + i % 5
+    FROM generate_series(1, {ARTICLES}) AS i
+    """,
+    f"""
+    INSERT INTO followers (follower_id, followed_id)
+    SELECT 1 + i % {USERS}, 1 + (i % {USERS} + i / {USERS} + 1) % {USERS}
+    FROM generate_series(0, {USERS * 20 - 1}) AS i
+    """,
+    f"""
+    INSERT INTO wishlists (user_id, article_id)
+    SELECT 1 + i % {USERS}, 1 + (11 * i) % {ARTICLES}
+    FROM generate_series(1, {ARTICLES}) AS i
+    """,
+    f"""
+    INSERT INTO article_purchase (user_id, article_id)
+    SELECT 1 + i % {USERS}, 1 + (13 * i) % {ARTICLES}
+    FROM generate_series(1, {ARTICLES}) AS i
+    """,
+    f"""
+    INSERT INTO transactions (id, user_id, status, created_at, total_price)
+    SELECT 'tx' || i, 1 + i % {USERS}, 'COMPLETED', now() - i * interval '1 minute', 10
+    FROM generate_series(1, {ARTICLES}) AS i
+    """,
+    f"""
+    INSERT INTO transaction_items (transaction_id, article_id, paid_out)
+    SELECT 'tx' || i, 1 + (13 * i) % {ARTICLES}, false
+    FROM generate_series(1, {ARTICLES}) AS i
+    """,
+    f"""
+    INSERT INTO collections (owner_id, title, discount_percentage, collection_image)
+    SELECT 1 + i % {USERS}, 'collection ' || i, 0, 'image.png'
+    FROM generate_series(1, {ARTICLES // 10}) AS i
+    """,
+    f"""
+    INSERT INTO collection_articles (collection_id, article_id)
+    SELECT 1 + i % {ARTICLES // 10}, 1 + (17 * i) % {ARTICLES}
+    FROM generate_series(1, {ARTICLES}) AS i
+    """,
+    f"""
+    INSERT INTO issues (category, title, description, status, reported_by_id)
+    SELECT 'other', 'issue ' || i, 'description', 'Nowe', 1 + i % {USERS}
+    FROM generate_series(1, {ARTICLES}) AS i
+    """,
+    "ANALYZE",
+]
+
+SERVICE_QUERIES = {
+    "article_comments": lambda db: article_service.get_article_comments_by_article_id(db, 1, "desc"),
+    "wish_list": lambda db: article_service.get_wish_list_by_user_id(db, 1, "desc"),
+    "wish_list_entry": lambda db: article_service.get_wish_list_by_user_id_and_article_id(db, 1, 1),
+    "purchased_articles": lambda db: article_service.get_purchased_articles_by_user_id(db, 1),
+    "has_purchased": lambda db: article_service.has_user_purchased_article(db, 1, 1),
+    "articles_for_purchase": lambda db: article_service.get_articles_for_purchase(db, 1, [1, 2, 3]),
+    "author_articles": lambda db: article_service.get_articles_by_user_id(db, 1),
+    "collections_by_article": lambda db: article_service.get_collections_by_article_id(db, 1),
+    "collections_by_user": lambda db: article_service.get_collections_by_user_id(db, 1),
+    "feed": lambda db: article_service.get_feed(db, 1),
+    "followers": lambda db: db.scalars(user_service.get_followers_query(1).limit(20)).all(),
+    "following": lambda db: db.scalars(user_service.get_following_query(1).limit(20)).all(),
+    "user_profile": lambda db: user_service.get_user_profile(db, 1),
+    "issues": lambda db: asyncio.run(support_service.get_issues_by_user_id(db, 1)),
+    "transaction_items": lambda db: transaction_service.get_transaction_items_by_transaction_id(db, "tx1"),
+    "article_transaction_items": lambda db: transaction_service.get_transaction_items_by_article_id(db, 1),
+    "user_transactions": lambda db: db.scalars(transaction_service.get_user_transactions_query(1).limit(20)).all(),
+}
+
+
+@pytest.fixture(scope="module")
+def seeded_engine(database):
+    with database.begin() as connection:
+        # the seed refers to rows by ids, so sequences have to start from 1
+        truncate_tables(connection, Base.metadata.sorted_tables)
+        for statement in SEED_SQL:
+            connection.execute(text(statement))
+
+    yield database
+
+    with database.begin() as connection:
+        truncate_tables(connection, Base.metadata.sorted_tables)
+
+
+@contextmanager
+def capture_selects(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def sequential_scans(plan: dict, large_tables: set[str]) -> list[str]:
+    scans = []
+    if plan["Node Type"] == "Seq Scan" and plan["Relation Name"] in large_tables:
+        scans.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        scans += sequential_scans(child, large_tables)
+    return scans
+
+
+@pytest.mark.parametrize("name", SERVICE_QUERIES)
+def test_service_query_plan_uses_indexes(seeded_engine, name: str):
+    with Session(bind=seeded_engine) as db:
+        with capture_selects(seeded_engine) as statements:
+            SERVICE_QUERIES[name](db)
+
+    assert statements
+
+    with seeded_engine.connect() as connection:
+        large_tables = set(connection.execute(
+            text("SELECT relname FROM pg_class WHERE relkind = 'r' AND reltuples >= :rows"),
+            {"rows": LARGE_TABLE_ROWS}
+        ).scalars())
+
+        for statement, parameters in statements:
+            plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()[0]["Plan"]
+            assert not sequential_scans(plan, large_tables), statement
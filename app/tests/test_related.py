@@ -0,0 +1,74 @@
+from datetime import datetime
+from app.internal.related import RelatedArticlesIndex, ArticleDocument
+
+
+DOCUMENTS = [
+    ArticleDocument(1, "postgres indexes explained, btree and gin indexes", ["sql"]),
+    ArticleDocument(2, "vacuum in postgres", ["sql"]),
+    ArticleDocument(3, "sourdough bread at home", ["cooking"]),
+    ArticleDocument(4, "choosing indexes for postgres queries", []),
+    ArticleDocument(5, "bread flour and water", []),
+]
+
+
+def test_related_articles_index_build():
+    index = RelatedArticlesIndex(limit=2)
+    index.build(DOCUMENTS)
+
+    assert index.related(1) == [4, 2]
+    assert index.related(3) == [5]
+    assert index.related(1, limit=1) == [4]
+    assert index.related(42) == []
+    assert all(0 < score <= 1 for _, score in index.scores(1))
+
+
+def test_related_articles_index_update():
+    changed = ArticleDocument(5, "bread, postgres and gin indexes", ["sql"])
+    new = ArticleDocument(6, "sourdough bread starter", ["cooking"])
+
+    index = RelatedArticlesIndex(limit=2)
+    index.build(DOCUMENTS)
+    index.update(changed)
+    index.update(new)
+
+    assert index.related(5) == [1, 2]
+    assert index.related(6) == [3, 5]
+    assert index.related(3) == [6, 5]
+    assert index.related(1) == [5, 4]
+
+
+def test_related_articles_index_remove():
+    index = RelatedArticlesIndex(limit=2)
+    index.build(DOCUMENTS)
+    index.remove(4)
+
+    assert index.related(4) == []
+    # refilled by the next build
+    assert index.related(1) == [2]
+    assert all(4 not in index.related(document.id) for document in DOCUMENTS)
+
+    index.update(ArticleDocument(7, "postgres indexes", ["sql"]))
+
+    assert index.related(7)[0] == 1
+    assert 4 not in index.related(7)
+
+
+def test_related_articles_index_versions():
+    versions = [datetime(2024, 1, day) for day in range(1, 4)]
+    index = RelatedArticlesIndex(limit=2)
+    index.build([
+        ArticleDocument(document.id, document.text, document.tags, version=versions[document.id % 2])
+        for document in DOCUMENTS
+    ])
+
+    assert index.watermark == versions[1]
+    assert index.version(2) == versions[0]
+    assert len(index) == 5
+
+    index.update(ArticleDocument(2, "vacuum in postgres", ["sql"], version=versions[2]))
+    index.remove(3)
+
+    assert index.watermark == versions[2]
+    assert index.version(2) == versions[2]
+    assert index.version(3) is None
+    assert index.article_ids() == {1, 2, 4, 5}
@@ -0,0 +1,98 @@
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from app.domain.user.service import get_user_by_email_and_password
+from app.internal.counters import reconcile_user_counters
+from app.internal.seeder import RowStream, Seeder, seed_database
+from app.domain.article import models as article_models
+from app.domain.article.models import Article, ArticleComment, ArticlePurchase, FeedEntry
+from app.domain.user.models import Follower
+import pytest
+
+
+def dataset_digest(session: Session) -> dict:
+    # password hashes are salted, so users are compared without them
+    rows = {
+        'users': '(t.id, t.first_name, t.description, t.follower_count, t.following_count, t.rated_article_rating_sum)',
+        'articles': 't',
+        'article_content_elements': 't',
+        'article_comment': 't',
+        'article_purchase': 't',
+        'transactions': 't',
+    }
+    return {
+        table: session.execute(text(f"SELECT md5(string_agg({row}::text, ',' ORDER BY {row}::text)) FROM {table} AS t")).scalar()
+        for table, row in rows.items()
+    }
+
+
+def test_row_stream_encodes_copy_text_format():
+    stream = RowStream([(1, 'a\tb\\c', None, True), (2, 'line\nbreak', 1.5, False)])
+
+    assert stream.read(4) + stream.read() == b'1\ta\\tb\\\\c\t\\N\tt\n2\tline\\nbreak\t1.5\tf\n'
+
+
+def test_seed_database_is_deterministic_and_consistent(session: Session):
+    options = {'seed': 3, 'users': 30, 'articles': 80, 'follows': 5, 'purchases': 8, 'comment_ratio': 0.5}
+
+    seed_database(session, **options)
+    digest = dataset_digest(session)
+
+    with pytest.raises(ValueError):
+        seed_database(session, **options)
+
+    seed_database(session, reset=True, **options)
+
+    assert dataset_digest(session) == digest
+    assert reconcile_user_counters(session) == 0
+    assert session.execute(text("""
+        SELECT count(*) FROM articles
+        WHERE rating_count != (SELECT count(*) FROM article_comment WHERE article_id = articles.id)
+    """)).scalar() == 0
+    assert session.execute(text("""
+        SELECT count(*) FROM article_comment AS c
+        WHERE NOT EXISTS (SELECT 1 FROM article_purchase WHERE user_id = c.author_id AND article_id = c.article_id)
+    """)).scalar() == 0
+    assert get_user_by_email_and_password(session, 'user1@example.com', 'password')
+
+
+def test_seed_database_fills_feeds_over_fan_out_threshold(session: Session, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(article_models, 'FEED_FANOUT_THRESHOLD', 8)
+    monkeypatch.setattr(article_models, 'FEED_TIMELINE_SIZE', 5)
+
+    seed_database(session, seed=5, users=30, articles=120, follows=6, purchases=0)
+
+    # the same timelines the ORM listeners keep: newest articles of followed authors, for readers over the threshold
+    expected = session.execute(text("""
+        SELECT user_id, article_id
+        FROM (
+            SELECT f.follower_id AS user_id, a.id AS article_id,
+                   row_number() OVER (PARTITION BY f.follower_id ORDER BY a.created_at DESC, a.id DESC) AS position
+            FROM followers AS f
+            JOIN articles AS a ON a.author_id = f.followed_id
+            WHERE (SELECT count(*) FROM followers WHERE follower_id = f.follower_id) >= 8
+        ) AS t
+        WHERE position <= 5
+    """)).all()
+
+    assert expected
+    assert sorted(session.query(FeedEntry.user_id, FeedEntry.article_id).all()) == sorted(expected)
+
+
+def test_seeder_describes_the_seeded_dataset(session: Session):
+    seed_database(session, seed=2, users=20, articles=60, follows=4, purchases=6, comment_ratio=0.5)
+    dataset = Seeder(seed=2, users=20, articles=60, follows=4, purchases=6, comment_ratio=0.5)
+    dataset.index_articles()
+
+    for user_id in (1, 7):
+        assert sorted(dataset.followed_users(user_id)) == sorted(
+            session.scalars(select(Follower.followed_id).where(Follower.follower_id == user_id))
+        )
+        assert sorted(dataset.commented_articles(user_id)) == sorted(
+            session.scalars(select(ArticleComment.article_id).where(ArticleComment.author_id == user_id))
+        )
+
+        purchased = set(session.scalars(select(ArticlePurchase.article_id).where(ArticlePurchase.user_id == user_id)))
+        assert set(dataset.purchased_articles(user_id)) == purchased
+        for article_id in dataset.purchasable_articles(user_id):
+            article = session.get(Article, article_id)
+            assert article.price > 0 and article.author_id != user_id and article_id not in purchased
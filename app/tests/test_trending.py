@@ -0,0 +1,84 @@
+from app.internal.trending import TrendingArticles, TRENDING_HALF_LIFE
+import pytest
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_trending_scores_decay_by_half_life():
+    clock = Clock()
+    trending = TrendingArticles(clock=clock)
+
+    trending.add(1, "view", count=4)
+    trending.add(2, "purchase")
+    clock.now += TRENDING_HALF_LIFE
+
+    assert trending.score(1) == pytest.approx(2)
+    assert trending.score(2) == pytest.approx(2.5)
+    assert trending.score(3) == 0
+
+    trending.add(1, "wishlist")
+
+    assert trending.top() == [(1, pytest.approx(5)), (2, pytest.approx(2.5))]
+
+
+def test_trending_top_keeps_best_articles():
+    clock = Clock()
+    trending = TrendingArticles(size=3, clock=clock)
+
+    for article_id in range(1, 11):
+        trending.add(article_id, "view", count=article_id)
+        clock.now += 60
+
+    assert [article_id for article_id, _ in trending.top()] == [10, 9, 8]
+
+    # an evicted article is back as soon as its total beats the others
+    trending.add(2, "purchase", count=3)
+    trending.remove(9)
+
+    assert [article_id for article_id, _ in trending.top()] == [2, 10, 8]
+    assert [article_id for article_id, _ in trending.top(limit=1)] == [2]
+
+
+def test_trending_rebases_long_running_counters():
+    clock = Clock()
+    trending = TrendingArticles(clock=clock)
+
+    trending.add(1, "view")
+    clock.now += 200 * TRENDING_HALF_LIFE
+    trending.add(2, "view")
+
+    assert trending.top() == [(2, pytest.approx(1)), (1, pytest.approx(0, abs=1e-12))]
+
+
+def test_trending_load_keeps_unpersisted_signals():
+    clock = Clock()
+    trending = TrendingArticles(clock=clock)
+
+    trending.add(1, "view", count=2)
+    assert trending.pop_pending() == {1: pytest.approx(2)}
+
+    trending.add(2, "view")
+    trending.load({1: 7.0, 3: 1.5})
+
+    assert trending.top() == [(1, 7.0), (3, 1.5), (2, 1.0)]
+    assert trending.pop_pending() == {2: pytest.approx(1)}
+
+
+def test_trending_restore_pending_after_failed_persist():
+    clock = Clock()
+    trending = TrendingArticles(clock=clock)
+
+    trending.add(1, "view", count=2)
+    deltas = trending.pop_pending()
+    trending.add(1, "view")
+    clock.now += TRENDING_HALF_LIFE
+    trending.restore_pending(deltas, clock.now - TRENDING_HALF_LIFE)
+
+    assert trending.pop_pending() == {1: pytest.approx(1.5)}
+    assert trending.score(1) == pytest.approx(1.5)
@@ -1,19 +1,28 @@
 import pytest
-from sqlalchemy.orm import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, ORMExecuteState
 from fastapi.testclient import TestClient
 from app.domain.article.models import Article, ArticleComment, WishList, Collection
 from app.domain.support.models import Issue
 from app.domain.user.models import User, Skill, SkillList, Follower
 from app.domain.user.service import hash_password
+from app.domain.transaction.payu import PayUClient
+from app.internal import payu_mock
 import os
 import json
 import random
+import re
 import faker
+import httpx
+from contextlib import contextmanager
 from typing import List, Final
 
 DEFAULT_IMAGE_PATH: Final[str] = os.path.join(
     os.getcwd(), "app", "media", "uploads", "user", "default_article_title_img.jpg"
 )
+# bcrypt is slow on purpose, so test users share one hash of 'PasswordExample'
+TEST_PASSWORD_HASH: Final[str] = hash_password('PasswordExample')
 
 @pytest.fixture
 def add_example_article(
@@ -66,7 +75,7 @@ def create_test_user(session: Session) -> User:
         
     user_data = {
         'email': email_test,
-        'hashed_password': hash_password('PasswordExample'),
+        'hashed_password': TEST_PASSWORD_HASH,
         'first_name': 'adam',
         'last_name': 'adam',
         'sex': 'adam',
@@ -84,7 +93,7 @@ def create_test_user(session: Session) -> User:
 def create_test_unactive_user(session: Session) -> User:
     user_data = {
         'email': 'test@test.pl',
-        'hashed_password': hash_password('PasswordExample'),
+        'hashed_password': TEST_PASSWORD_HASH,
         'first_name': 'adam',
         'last_name': 'adam',
         'sex': 'adam',
@@ -182,3 +191,52 @@ def create_test_follower(session: Session, following_id: int, followed_id: int)
     session.refresh(follower)
     
     return follower
+
+SAVEPOINT_COMMAND = re.compile(r"\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b", re.IGNORECASE)
+
+def create_mock_payu_client(**kwargs) -> PayUClient:
+    return PayUClient(
+        base_url="http://payu.test",
+        client_id="client",
+        client_secret="secret",
+        pos_id="pos",
+        transport=httpx.ASGITransport(app=payu_mock.app),
+        **kwargs
+    )
+
+
+@contextmanager
+def assert_max_queries(max_queries: int):
+    """
+    Fails when more than `max_queries` SQL statements are executed inside the block.
+    SAVEPOINT commands of the transactional test fixtures aren't counted.
+    """
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if not SAVEPOINT_COMMAND.match(statement):
+            statements.append(statement)
+
+    event.listen(Engine, "after_cursor_execute", count_statement)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "after_cursor_execute", count_statement)
+
+    assert len(statements) <= max_queries, \
+        f"{len(statements)} queries executed, expected at most {max_queries}:\n" + "\n".join(statements)
+
+@contextmanager
+def forbid_lazy_loads():
+    """
+    Works like lazy='raise' on every relationship: lazy loads that hit the database inside the block raise an error.
+    """
+    def raise_on_lazy_load(orm_execute_state: ORMExecuteState):
+        if orm_execute_state.lazy_loaded_from is not None:
+            raise AssertionError(f"Lazy load of {orm_execute_state.statement}")
+
+    event.listen(Session, "do_orm_execute", raise_on_lazy_load)
+    try:
+        yield
+    finally:
+        event.remove(Session, "do_orm_execute", raise_on_lazy_load)